@@ -0,0 +1,149 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compiles the `transform` section of a pipeline config into column ops.
+
+The section lists column rules, e.g.
+
+    transform:
+      columns:
+        - index: 0
+          rules: [yyyymmdd_to_iso]
+        - from_index: 4
+          rules:
+            - null_values: ["N/A"]
+            - null_prefixes: ["<", "~"]
+            - thousands_separator
+            - replace: {"7/1": 7}
+
+A column is matched by `index`, by `from_index` (that index and every column
+after it), or by every column if neither is given. The first matching entry
+wins. Within an entry, a value is converted by the first rule that applies to
+it, and kept as it is when none does.
+
+`generate_dag.py` passes the section to the transform script as JSON in the
+`TRANSFORM_RULES` environment variable. Setting `output_format: parquet` in the
+section makes the script write typed Parquet instead of CSV, see
+`parquet_output.py`.
+"""
+
+import json
+import os
+import typing
+
+import date_conversion
+
+ColumnOp = typing.Callable[[str], typing.Any]
+
+# Returned by a rule that doesn't apply to a value, so the next rule gets it
+NO_MATCH = object()
+
+# A rule returns the converted value, or `NO_MATCH`
+Rule = typing.Callable[[str], typing.Any]
+
+
+def null_values(values: typing.Iterable[str]) -> Rule:
+    values = frozenset(values)
+    return lambda val: "" if val in values else NO_MATCH
+
+
+def null_prefixes(prefixes: typing.Iterable[str]) -> Rule:
+    prefixes = tuple(prefixes)
+    return lambda val: "" if val.startswith(prefixes) else NO_MATCH
+
+
+def thousands_separator() -> Rule:
+    """Converts integers represented as strings, e.g. "1,234" """
+    return lambda val: int(val.replace(",", "")) if "," in val else NO_MATCH
+
+
+def replace(replacements: dict) -> Rule:
+    return lambda val: replacements.get(val, NO_MATCH)
+
+
+def yyyymmdd_to_iso() -> Rule:
+    return date_conversion.yyyymmdd_to_iso
+
+
+RULES = {
+    "null_values": null_values,
+    "null_prefixes": null_prefixes,
+    "thousands_separator": thousands_separator,
+    "replace": replace,
+    "yyyymmdd_to_iso": yyyymmdd_to_iso,
+}
+
+
+def from_env() -> dict:
+    if not os.environ.get("TRANSFORM_RULES"):
+        raise ValueError(
+            "`TRANSFORM_RULES` must hold the `transform` section of the pipeline "
+            "config as JSON"
+        )
+    try:
+        return json.loads(os.environ["TRANSFORM_RULES"])
+    except json.JSONDecodeError as e:
+        raise ValueError(f"`TRANSFORM_RULES` isn't valid JSON: {e}") from e
+
+
+def compile_rules(
+    config: dict,
+) -> typing.Callable[[int], typing.Optional[ColumnOp]]:
+    """Returns the op to apply to each raw column index, or `None` to keep it.
+
+    All rules are built here once, so the engine only resolves a function per
+    column and never looks at the config again while converting values.
+    """
+    specs = [
+        (column.get("index"), column.get("from_index"), chain(column["rules"]))
+        for column in config["columns"]
+    ]
+
+    def column_op(idx: int) -> typing.Optional[ColumnOp]:
+        for index, from_index, op in specs:
+            if index is not None:
+                if idx == index:
+                    return op
+            elif from_index is None or idx >= from_index:
+                return op
+        return None
+
+    return column_op
+
+
+def chain(rules: list) -> ColumnOp:
+    ops = [build_rule(rule) for rule in rules]
+
+    def apply_first_matching(val: str) -> typing.Any:
+        for op in ops:
+            converted = op(val)
+            if converted is not NO_MATCH:
+                return converted
+        return val
+
+    return apply_first_matching
+
+
+def build_rule(rule: typing.Union[str, dict]) -> Rule:
+    if isinstance(rule, str):
+        name, args = rule, ()
+    elif isinstance(rule, dict) and len(rule) == 1:
+        name, arg = next(iter(rule.items()))
+        args = (arg,)
+    else:
+        raise ValueError(f"Column rule must be a name or a single-key mapping: {rule}")
+
+    if name not in RULES:
+        raise ValueError(f"Unknown column rule `{name}`, must be one of {list(RULES)}")
+    return RULES[name](*args)
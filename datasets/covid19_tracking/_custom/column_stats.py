@@ -0,0 +1,120 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Column statistics collected while the transforms write their output.
+
+The sidecar holds the row count and, per output column, the number of empty
+cells, the min and max of the `YYYY-MM-DD` dates and the min and max of the
+numbers, e.g.
+
+    {
+      "rows": 2,
+      "columns": {
+        "date": {"nulls": 0, "min_date": "2020-03-01", "max_date": "2020-03-02"},
+        "cases": {"nulls": 1, "min": 1234, "max": 1234}
+      }
+    }
+
+With `stats: true` in the `transform` section, it is written next to the target
+file as `<target file name>.stats.json`, so downstream tasks can check a run
+without querying the loaded table. A pipeline turning it on deletes the
+sidecar once it's read, so it's neither archived nor left behind.
+"""
+
+import itertools
+import json
+import math
+import pathlib
+import re
+import typing
+
+DATE_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+
+class ColumnStats:
+    """Accumulates statistics over batches of transformed rows"""
+
+    def __init__(self, headers: list) -> None:
+        self.headers = headers
+        self.rows = 0
+        self.nulls = [0] * len(headers)
+        self.numbers = [None] * len(headers)
+        self.dates = [None] * len(headers)
+
+    def update(self, rows: typing.Sequence[typing.Sequence]) -> None:
+        if not rows:
+            return
+
+        self.rows += len(rows)
+        # Short rows count as nulls in their missing cells
+        columns = itertools.zip_longest(*rows, fillvalue="")
+        for idx, column in zip(range(len(self.headers)), columns):
+            distinct = set(column)
+            if "" in distinct or None in distinct:
+                self.nulls[idx] += column.count("") + column.count(None)
+
+            numbers, dates = classify(distinct)
+            self.numbers[idx] = widen(self.numbers[idx], numbers)
+            self.dates[idx] = widen(self.dates[idx], dates)
+
+    def to_dict(self) -> dict:
+        columns = {}
+        for idx, header in enumerate(self.headers):
+            column = {"nulls": self.nulls[idx]}
+            if self.dates[idx]:
+                column["min_date"], column["max_date"] = self.dates[idx]
+            if self.numbers[idx]:
+                column["min"], column["max"] = self.numbers[idx]
+            columns[header] = column
+        return {"rows": self.rows, "columns": columns}
+
+    def write(self, path: pathlib.Path) -> None:
+        path.write_text(json.dumps(self.to_dict(), indent=2))
+
+
+def sidecar_path(target_path: pathlib.Path) -> pathlib.Path:
+    return target_path.with_name(f"{target_path.name}.stats.json")
+
+
+def classify(values: typing.Iterable) -> typing.Tuple[list, list]:
+    """Splits the distinct values of a column into numbers and ISO dates"""
+    numbers, dates = [], []
+    for val in values:
+        if isinstance(val, (int, float)):
+            number = val
+        elif not val:
+            continue
+        elif DATE_PATTERN.match(val):
+            dates.append(val)
+            continue
+        else:
+            try:
+                number = float(val) if "." in val or "e" in val.lower() else int(val)
+            except ValueError:
+                continue
+
+        if math.isfinite(number):
+            numbers.append(number)
+    return numbers, dates
+
+
+def widen(
+    bounds: typing.Optional[typing.Tuple], values: list
+) -> typing.Optional[typing.Tuple]:
+    if not values:
+        return bounds
+    low, high = min(values), max(values)
+    if bounds is not None:
+        low, high = min(low, bounds[0]), max(high, bounds[1])
+    return low, high
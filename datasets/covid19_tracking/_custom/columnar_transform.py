@@ -0,0 +1,368 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Column-batch CSV transforms shared by the covid19_tracking custom callables.
+
+Rows are read in batches and transposed into columns, so every column's
+conversion runs as a single `map` over the batch instead of branching on the
+column index for every cell.
+
+Memory stays constant whatever the size of the file: only one batch is held at
+a time, and a batch ends after `batch_rows` rows or once it has read
+`max_batch_bytes` of CSV text, whichever comes first. Both limits and the
+`read_buffer_size` and `write_buffer_size` of the files can be set in the
+`transform` section of the pipeline config, next to the column rules.
+
+Without a source path the CSV is read from stdin, and without a target path it
+is written to stdout, so a transform can run as a filter between `curl` and
+`gzip` instead of round-tripping the data through the gcsfuse mount.
+
+Setting `compression: gzip` writes the CSV gzipped, to the target path with a
+`.gz` suffix. BigQuery loads gzipped CSV objects as they are.
+
+Setting `stats: true` collects the row count and per-column statistics in the
+same pass and writes them next to the target file, see `column_stats.py`. They
+are off by default, as the pipelines archiving their data folder would ship
+the sidecar along.
+
+Given a `since` date, only the rows dated after it are written, see
+`watermark.py`.
+"""
+
+import contextlib
+import csv
+import functools
+import gzip
+import io
+import itertools
+import os
+import pathlib
+import sys
+import typing
+
+import column_rules
+import column_stats
+
+OUTPUT_FORMATS = ("csv", "parquet")
+COMPRESSIONS = ("none", "gzip")
+
+# Close to the best ratio for these CSVs at a fraction of the time of level 9
+GZIP_LEVEL = 6
+
+STREAM_SETTINGS = {
+    "batch_rows": 10000,
+    "max_batch_bytes": 8 * 1024 * 1024,
+    "read_buffer_size": 1024 * 1024,
+    "write_buffer_size": 1024 * 1024,
+}
+
+HeaderParser = typing.Callable[[list], typing.Tuple[list, set]]
+
+
+def transform_csv(
+    source_path: typing.Optional[pathlib.Path],
+    target_path: typing.Optional[pathlib.Path],
+    transform_rules: dict,
+    parse_headers: HeaderParser = None,
+    skip_lines: int = 0,
+    since: typing.Optional[str] = None,
+) -> typing.Optional[pathlib.Path]:
+    """Transforms a CSV file one batch of rows at a time.
+
+    `transform_rules` is the `transform` section of the pipeline config, see
+    `column_rules.py`. `parse_headers` returns the output headers and the raw
+    column indices to drop. `skip_lines` is the number of lines preceding the
+    headers row. `since` is a `YYYY-MM-DD` date, and only the rows dated after
+    it in the `incremental.date_column` column are written when it's given.
+
+    A `None` source or target path stands for stdin or stdout.
+
+    Returns the path of the written file, which gets a `.parquet` suffix when
+    the rules ask for Parquet output and a `.gz` suffix when they ask for
+    compression, or `None` when writing to stdout. The statistics sidecar
+    isn't written for stdout either.
+    """
+    parse_headers = parse_headers or keep_headers
+    column_op = column_rules.compile_rules(transform_rules)
+    output_format = transform_rules.get("output_format", "csv")
+    compression = transform_rules.get("compression", "none")
+    target_path = output_path(target_path, output_format, compression)
+    settings = stream_settings(transform_rules)
+
+    with open_stream(source_path, "r", settings["read_buffer_size"]) as csv_source:
+        lines = CountedLines(csv_source)
+        csv_reader = csv.reader(lines, delimiter=",")
+        for _ in range(skip_lines):
+            next(csv_reader)
+
+        headers, skip_col_indices = parse_headers(next(csv_reader))
+        ops_for_width = column_plan(column_op, skip_col_indices)
+        newer_rows = None
+        if since is not None:
+            newer_rows = date_filter(
+                transform_rules, column_op, headers, skip_col_indices, since
+            )
+        stats = None
+        if target_path is not None and transform_rules.get("stats", False):
+            stats = column_stats.ColumnStats(headers)
+
+        with open_writer(
+            target_path, headers, transform_rules, settings["write_buffer_size"]
+        ) as writer:
+            for batch in read_batches(
+                csv_reader,
+                lines,
+                settings["batch_rows"],
+                settings["max_batch_bytes"],
+            ):
+                if newer_rows:
+                    batch = newer_rows(batch)
+                rows = list(transform_batch(batch, ops_for_width))
+                writer.writerows(rows)
+                if stats:
+                    stats.update(rows)
+
+    if stats:
+        stats.write(column_stats.sidecar_path(target_path))
+    return target_path
+
+
+def date_filter(
+    transform_rules: dict,
+    column_op: typing.Callable[[int], typing.Optional[column_rules.ColumnOp]],
+    headers: list,
+    skip_col_indices: set,
+    since: str,
+) -> typing.Callable[[list], list]:
+    """Returns a filter keeping the raw rows of a batch dated after `since`.
+
+    Dates are compared once their column rules are applied, so `since` is an
+    ISO date whatever the format of the source file.
+    """
+    if "incremental" not in transform_rules:
+        raise ValueError("Filtering by date requires `incremental.date_column`")
+
+    date_column = transform_rules["incremental"]["date_column"]
+    if date_column not in headers:
+        raise ValueError(f"Date column `{date_column}` isn't one of {headers}")
+
+    raw_indices = (idx for idx in itertools.count() if idx not in skip_col_indices)
+    date_idx = next(itertools.islice(raw_indices, headers.index(date_column), None))
+    to_date = column_op(date_idx) or str
+
+    def newer_rows(rows: list) -> list:
+        return [
+            row
+            for row in rows
+            if len(row) > date_idx and to_date(row[date_idx]) > since
+        ]
+
+    return newer_rows
+
+
+def stream_settings(transform_rules: dict) -> dict:
+    settings = {**STREAM_SETTINGS}
+    for name in STREAM_SETTINGS:
+        if name in transform_rules:
+            settings[name] = int(transform_rules[name])
+            if settings[name] < 1:
+                raise ValueError(f"`{name}` must be a positive integer")
+    return settings
+
+
+def path_from_env(name: str) -> typing.Optional[pathlib.Path]:
+    """Reads a file path from the environment, with unset or "-" for stdio"""
+    value = os.environ.get(name, "-")
+    return None if value == "-" else pathlib.Path(value).expanduser()
+
+
+def open_stream(
+    path: typing.Optional[pathlib.Path], mode: str, buffer_size: int
+) -> typing.IO:
+    """Opens `path`, or stdin/stdout when it's `None`, with the given buffer.
+
+    The standard stream is reopened on its descriptor so it gets the same
+    buffering as a file, and is left open when the returned file is closed.
+    """
+    if path is not None:
+        return open(path, mode, buffering=buffer_size)
+
+    if mode == "r":
+        stream = sys.stdin
+    else:
+        # Anything already printed must come out ahead of the CSV
+        stream = sys.stdout
+        stream.flush()
+    return open(stream.fileno(), mode, buffering=buffer_size, closefd=False)
+
+
+@contextlib.contextmanager
+def open_gzip(
+    path: typing.Optional[pathlib.Path], buffer_size: int
+) -> typing.Iterator[typing.TextIO]:
+    """Opens a text stream that gzips what is written to `path`, or stdout"""
+    with open_stream(path, "wb", buffer_size) as raw_target:
+        with gzip.GzipFile(
+            fileobj=raw_target, mode="wb", compresslevel=GZIP_LEVEL
+        ) as gzip_target:
+            with io.TextIOWrapper(gzip_target) as text_target:
+                yield text_target
+
+
+def output_path(
+    target_path: typing.Optional[pathlib.Path],
+    output_format: str,
+    compression: str = "none",
+) -> typing.Optional[pathlib.Path]:
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"`output_format` must be one of {OUTPUT_FORMATS}")
+
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"`compression` must be one of {COMPRESSIONS}")
+
+    if output_format == "parquet" and compression != "none":
+        raise ValueError("Parquet output is compressed with snappy already")
+
+    if target_path is None:
+        if output_format == "parquet":
+            raise ValueError("Parquet output needs a target path, not stdout")
+        return None
+
+    if output_format == "parquet":
+        return target_path.with_suffix(".parquet")
+    if compression == "gzip":
+        return target_path.with_name(f"{target_path.name}.gz")
+    return target_path
+
+
+@contextlib.contextmanager
+def open_writer(
+    target_path: typing.Optional[pathlib.Path],
+    headers: list,
+    transform_rules: dict,
+    buffer_size: int,
+) -> typing.Iterator:
+    """Yields an object with a `writerows` method, after writing the headers"""
+    if transform_rules.get("output_format") == "parquet":
+        # pyarrow is only needed, and only imported, for Parquet output
+        import parquet_output
+
+        with parquet_output.ParquetWriter(
+            target_path, headers, transform_rules["column_types"]
+        ) as parquet_writer:
+            yield parquet_writer
+    else:
+        if transform_rules.get("compression") == "gzip":
+            target = open_gzip(target_path, buffer_size)
+        else:
+            target = open_stream(target_path, "w", buffer_size)
+
+        with target as csv_target:
+            csv_writer = csv.writer(csv_target, delimiter=",")
+            csv_writer.writerow(headers)
+            yield csv_writer
+
+
+def keep_headers(raw_headers: list) -> typing.Tuple[list, set]:
+    return list(raw_headers), set()
+
+
+def column_plan(
+    column_op: typing.Callable[[int], typing.Optional[column_rules.ColumnOp]],
+    skip_col_indices: set,
+) -> typing.Callable[[int], list]:
+    """Resolves the (index, op) pairs once per row width instead of per cell"""
+
+    @functools.lru_cache(maxsize=None)
+    def ops_for_width(width: int) -> list:
+        return [
+            (idx, column_op(idx)) for idx in range(width) if idx not in skip_col_indices
+        ]
+
+    return ops_for_width
+
+
+class CountedLines:
+    """Iterates over the lines of a file, counting the characters read so far"""
+
+    def __init__(self, source: typing.Iterable[str]) -> None:
+        self.source = source
+        self.chars = 0
+
+    def __iter__(self) -> typing.Iterator[str]:
+        for line in self.source:
+            self.chars += len(line)
+            yield line
+
+
+def read_batches(
+    csv_reader: typing.Iterator[list],
+    lines: CountedLines,
+    batch_rows: int,
+    max_batch_bytes: int,
+) -> typing.Iterator[list]:
+    """Yields lists of rows, capped by row count and by the CSV text read.
+
+    The text is counted on the lines the reader consumed, so quoted fields
+    spanning several lines are counted in full and never split.
+    """
+    batch = []
+    batch_start = lines.chars
+    for row in csv_reader:
+        batch.append(row)
+        if len(batch) >= batch_rows or lines.chars - batch_start >= max_batch_bytes:
+            yield batch
+            batch = []
+            batch_start = lines.chars
+    if batch:
+        yield batch
+
+
+def transform_batch(
+    rows: list, ops_for_width: typing.Callable[[int], list]
+) -> typing.Iterable[typing.Sequence]:
+    widths = set(map(len, rows))
+    if len(widths) != 1 or 0 in widths:
+        # Ragged or blank rows can't be transposed, so convert them one by one
+        return [transform_row(row, ops_for_width(len(row))) for row in rows]
+
+    columns = list(zip(*rows))
+    return zip(
+        *[
+            columns[idx] if op is None else map_distinct(op, columns[idx])
+            for idx, op in ops_for_width(widths.pop())
+        ]
+    )
+
+
+def map_distinct(
+    op: column_rules.ColumnOp, column: typing.Sequence[str]
+) -> typing.Iterator:
+    """Applies `op` once per distinct value in the column.
+
+    Dates, sentinels and small counts repeat heavily within a batch, so the
+    Python-level calls shrink to the number of distinct values while the
+    per-cell work stays in C (`set`, `map` and dict lookups). Columns that are
+    mostly distinct values are mapped directly.
+    """
+    distinct = set(column)
+    if len(distinct) > len(column) // 2:
+        return map(op, column)
+
+    table = {val: op(val) for val in distinct}
+    return map(table.__getitem__, column)
+
+
+def transform_row(row: list, ops: list) -> list:
+    return [row[idx] if op is None else op(row[idx]) for idx, op in ops]
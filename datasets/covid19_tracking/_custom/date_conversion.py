@@ -0,0 +1,35 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Memoized date conversions shared by the covid19_tracking custom callables.
+
+The covidtracking files hold a few hundred distinct dates spread over millions
+of rows, so every distinct value is parsed once and then served from a bounded
+LRU table. `columnar_transform.map_distinct` is the batch path: it dedupes a
+column before calling the converter, so a batch costs one lookup per distinct
+date.
+"""
+
+import functools
+from datetime import datetime
+
+# Roughly ten years of daily dates, after which the least recently used ones
+# are evicted
+CACHE_SIZE = 4096
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def yyyymmdd_to_iso(val: str) -> str:
+    """Converts a date with format `YYYYMMDD` into `YYYY-MM-DD`"""
+    return str(datetime.strptime(val, "%Y%m%d").date())
@@ -0,0 +1,164 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Throughput and latency metrics of the downloads of a run.
+
+Sessions given a `Metrics` through `http_client.session(metrics=...)` record
+the latency of every request sent, up to the response headers, and every
+retry. The download functions record the files and bytes they write.
+
+At the end of the run, the scripts write the summary as JSON to the file in
+`METRICS_FILE`, and send it as gauges to the StatsD daemon at `STATSD_ADDRESS`,
+e.g. `localhost:8125`, when they're set:
+
+    {
+      "seconds": 12.4,
+      "files": 840,
+      "bytes": 6720000,
+      "failures": 0,
+      "files_per_second": 67.7,
+      "bytes_per_second": 541935.5,
+      "requests": 897,
+      "retries": 2,
+      "latency_seconds": {"p50": 0.012, "p95": 0.048, "p99": 0.131},
+      "cache": {"hits": 57, "misses": 0, "bytes_served": 1034880}
+    }
+"""
+
+import json
+import logging
+import math
+import pathlib
+import socket
+import threading
+import time
+import typing
+
+import http_cache
+
+PERCENTILES = (50, 95, 99)
+
+
+class Metrics:
+    """Counters and request latencies, shared by the threads of a run"""
+
+    def __init__(self) -> None:
+        self.started_at = time.monotonic()
+        self.latencies = []
+        self.files = 0
+        self.bytes = 0
+        self.failures = 0
+        self.retries = 0
+        self.lock = threading.Lock()
+
+    def record_request(self, latency: float) -> None:
+        with self.lock:
+            self.latencies.append(latency)
+
+    def record_retry(self) -> None:
+        with self.lock:
+            self.retries += 1
+
+    def record_file(self, size: int) -> None:
+        with self.lock:
+            self.files += 1
+            self.bytes += size
+
+    def record_failures(self, count: int = 1) -> None:
+        with self.lock:
+            self.failures += count
+
+    def summary(self, cache: typing.Optional[http_cache.Cache] = None) -> dict:
+        """Returns the metrics so far, with the hits of an `http_cache.Cache`"""
+        with self.lock:
+            seconds = max(time.monotonic() - self.started_at, 1e-9)
+            latencies = sorted(self.latencies)
+            summary = {
+                "seconds": round(seconds, 3),
+                "files": self.files,
+                "bytes": self.bytes,
+                "failures": self.failures,
+                "files_per_second": round(self.files / seconds, 3),
+                "bytes_per_second": round(self.bytes / seconds, 3),
+                "requests": len(latencies),
+                "retries": self.retries,
+                "latency_seconds": {
+                    f"p{p}": round(percentile(latencies, p), 6) for p in PERCENTILES
+                },
+            }
+        if cache is not None:
+            summary["cache"] = {
+                "hits": cache.hits,
+                "misses": cache.misses,
+                "bytes_served": cache.bytes_served,
+            }
+        return summary
+
+    def report(
+        self,
+        metrics_path: typing.Optional[pathlib.Path],
+        statsd_address: typing.Optional[str] = None,
+        statsd_prefix: str = "",
+        cache: typing.Optional[http_cache.Cache] = None,
+    ) -> dict:
+        """Writes the summary to the metrics file and StatsD, whichever is set"""
+        summary = self.summary(cache)
+        logging.info(
+            f"Download metrics: {summary['files_per_second']:.1f} files/s, "
+            f"{summary['bytes_per_second'] / 1e6:.2f} MB/s, latency p50 "
+            f"{summary['latency_seconds']['p50'] * 1000:.0f} ms, p99 "
+            f"{summary['latency_seconds']['p99'] * 1000:.0f} ms, "
+            f"{summary['retries']} retries"
+        )
+        if metrics_path is not None:
+            metrics_path.parent.mkdir(parents=True, exist_ok=True)
+            metrics_path.write_text(json.dumps(summary, indent=2))
+        if statsd_address:
+            send_statsd(statsd_address, statsd_prefix, summary)
+        return summary
+
+
+def percentile(sorted_values: typing.List[float], p: float) -> float:
+    """Returns the nearest-rank percentile, 0 when there are no values"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def statsd_lines(prefix: str, summary: dict) -> typing.List[str]:
+    """Returns the summary as StatsD gauges, with the latencies in milliseconds"""
+    prefix = f"{prefix}." if prefix else ""
+    gauges = {
+        name: value
+        for name, value in summary.items()
+        if isinstance(value, (int, float))
+    }
+    for name, value in summary["latency_seconds"].items():
+        gauges[f"latency_ms.{name}"] = round(value * 1000, 3)
+    for name, value in summary.get("cache", {}).items():
+        gauges[f"cache.{name}"] = value
+    return [f"{prefix}{name}:{value}|g" for name, value in gauges.items()]
+
+
+def send_statsd(address: str, prefix: str, summary: dict) -> None:
+    """Sends the summary over UDP, which never fails the run"""
+    host, _, port = address.rpartition(":")
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as statsd:
+            statsd.sendto(
+                "\n".join(statsd_lines(prefix, summary)).encode(), (host, int(port))
+            )
+    except (OSError, ValueError, OverflowError) as e:
+        logging.warning(f"Sending the metrics to StatsD at {address} failed: {e}")
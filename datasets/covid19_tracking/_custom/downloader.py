@@ -0,0 +1,210 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Downloads the files listed in the `download` section of a pipeline config.
+
+The section is a manifest of URL to target file entries, e.g.
+
+    download:
+      base_url: "https://github.com/COVID19Tracking/long-term-care-data/raw/master/"
+      max_workers: 8
+      rate_limit: 10
+      files:
+        - url: facilities_ar.csv
+          target: raw-facilities-ar.csv
+
+URLs are relative to the optional `base_url`, and targets to the directory in
+the `TARGET_DIR` environment variable. An entry can also have the `sha256` hex
+digest its file is checked against. `generate_dag.py` passes the section to
+this script as JSON in the `DOWNLOAD_MANIFEST` environment variable.
+
+The optional `rate_limit` caps the downloads at that many requests a second.
+Throttled downloads are retried and slow the others down, see `rate_control.py`.
+
+Downloads are network-bound, so they run on a bounded pool of threads sharing
+pooled keep-alive connections, see `http_client.py`. An entry listed twice is
+downloaded once. Every file is written to a `.part` file and renamed once
+complete, and a retry only downloads the bytes missing from a `.part` file,
+see `resumable_download.py`.
+
+With `FINGERPRINT_FILE` set, the files are fetched with conditional requests
+instead, and the last line printed is `changed` when any of them changed since
+the last load, or `unchanged`, see `fingerprints.py`. A file is only requested
+conditionally when it's still in the target directory, as the load moves the
+files away and a changed manifest needs all of them.
+
+The throughput and request latencies of the downloads are written as JSON to
+`METRICS_FILE`, and sent to StatsD at `STATSD_ADDRESS`, when they're set, see
+`download_metrics.py`.
+"""
+
+import functools
+import json
+import logging
+import os
+import pathlib
+import time
+import typing
+import urllib.parse
+from multiprocessing.pool import ThreadPool
+
+import download_metrics
+import fingerprints
+import http_client
+import rate_control
+import requests
+import resumable_download
+
+MAX_WORKERS = 8
+STATSD_PREFIX = "covid19_tracking.downloader"
+
+Job = typing.Tuple[str, pathlib.Path, typing.Optional[str]]
+
+
+def main(
+    target_dir: pathlib.Path,
+    manifest: dict,
+    metrics_path: typing.Optional[pathlib.Path] = None,
+    statsd_address: typing.Optional[str] = None,
+    fingerprint_path: typing.Optional[pathlib.Path] = None,
+):
+    jobs = download_jobs(target_dir, manifest)
+    max_workers = min(int(manifest.get("max_workers", MAX_WORKERS)), len(jobs) or 1)
+    for parent in {target_path.parent for _, target_path, _ in jobs}:
+        parent.mkdir(parents=True, exist_ok=True)
+
+    rate = rate_control.RateControl(
+        manifest.get("rate_limit"), max_concurrency=max_workers
+    )
+
+    metrics = download_metrics.Metrics()
+    http = http_client.session(max_workers, rate=rate, metrics=metrics)
+
+    store = None
+    if fingerprint_path is not None:
+        store = fingerprints.load(fingerprint_path)
+        fetch = functools.partial(
+            download_fingerprinted, http, store=store, metrics=metrics
+        )
+    else:
+        fetch = functools.partial(download, http, metrics=metrics)
+
+    started_at = time.perf_counter()
+    with http, ThreadPool(max_workers) as pool:
+        results = list(pool.imap(fetch, jobs))
+    seconds = time.perf_counter() - started_at
+    rate.log_stats()
+    summary = metrics.report(metrics_path, statsd_address, STATSD_PREFIX)
+
+    logging.info(
+        f"Downloaded {summary['files']} of {len(jobs)} files, "
+        f"{summary['bytes'] / 1e6:.1f} MB with {max_workers} workers in "
+        f"{seconds:.2f}s ({summary['bytes'] / 1e6 / seconds:.2f} MB/s)"
+    )
+
+    if store is not None:
+        changed = fingerprints.record(
+            fingerprint_path,
+            {
+                url: fingerprint
+                for (url, _, _), fingerprint in zip(jobs, results)
+                if fingerprint is not None
+            },
+        )
+        print("changed" if changed else "unchanged")
+
+
+def download_jobs(target_dir: pathlib.Path, manifest: dict) -> typing.List[Job]:
+    """Resolves the manifest entries, dropping repeated ones"""
+    base_url = manifest.get("base_url", "")
+    jobs = {}
+    for entry in manifest["files"]:
+        url = urllib.parse.urljoin(base_url, entry["url"])
+        target_path = target_dir / entry["target"]
+        job = (url, target_path, entry.get("sha256"))
+        if jobs.setdefault(target_path, job) != job:
+            raise ValueError(
+                f"`{entry['target']}` is the target of both {jobs[target_path][0]} "
+                f"and {url}, or listed with different hashes"
+            )
+    return list(jobs.values())
+
+
+def download(
+    http: requests.Session,
+    job: Job,
+    metrics: typing.Optional[download_metrics.Metrics] = None,
+) -> int:
+    url, target_path, sha256 = job
+
+    started_at = time.perf_counter()
+    size = resumable_download.download(http, url, target_path, sha256)
+    seconds = time.perf_counter() - started_at
+    if metrics is not None:
+        metrics.record_file(size)
+
+    logging.info(
+        f"Downloaded {target_path.name}, {size / 1e6:.2f} MB in {seconds:.2f}s "
+        f"({size / 1e6 / seconds:.2f} MB/s)"
+    )
+    return size
+
+
+def download_fingerprinted(
+    http: requests.Session,
+    job: Job,
+    store: typing.Dict[str, dict],
+    metrics: typing.Optional[download_metrics.Metrics] = None,
+) -> typing.Optional[dict]:
+    """Downloads a file unless it's unchanged, and returns its new fingerprint"""
+    url, target_path, sha256 = job
+
+    # A file is only kept on a `304 Not Modified` if it's still there
+    fingerprint = fingerprints.fetch(
+        http, url, target_path, store.get(url, {}), conditional=target_path.exists()
+    )
+    if fingerprint is None:
+        return None
+    if sha256 and fingerprint["sha256"] != sha256.lower():
+        target_path.unlink()
+        raise resumable_download.IncompleteDownloadError(
+            f"{target_path.name} has the wrong SHA-256"
+        )
+
+    if metrics is not None:
+        metrics.record_file(fingerprint["size"])
+    logging.info(f"Downloaded {target_path.name}, {fingerprint['size'] / 1e6:.2f} MB")
+    return fingerprint
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    assert os.environ["TARGET_DIR"]
+    assert os.environ["DOWNLOAD_MANIFEST"]
+    main(
+        target_dir=pathlib.Path(os.environ["TARGET_DIR"]).expanduser(),
+        manifest=json.loads(os.environ["DOWNLOAD_MANIFEST"]),
+        metrics_path=(
+            pathlib.Path(os.environ["METRICS_FILE"]).expanduser()
+            if os.environ.get("METRICS_FILE")
+            else None
+        ),
+        statsd_address=os.environ.get("STATSD_ADDRESS"),
+        fingerprint_path=(
+            pathlib.Path(os.environ["FINGERPRINT_FILE"]).expanduser()
+            if os.environ.get("FINGERPRINT_FILE")
+            else None
+        ),
+    )
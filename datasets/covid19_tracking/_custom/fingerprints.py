@@ -0,0 +1,171 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Source fingerprints, to skip the transform and load of unchanged sources.
+
+Most covidtracking sources are frozen archives. The download task fetches them
+with this module instead of `curl`:
+
+    SOURCE_URL=... TARGET_FILE=... FINGERPRINT_FILE=... python fingerprints.py fetch
+
+or with `downloader.py` and `FINGERPRINT_FILE` set, for a manifest of files.
+
+The fingerprint of a source is the SHA-256 and size of its contents, along with
+the `ETag` and `Last-Modified` validators sent by the server. The stored
+validators make the request conditional, so an unchanged source usually comes
+back as a bodyless `304 Not Modified`. Otherwise the contents are hashed while
+they are written to the target file. Requests go through a pooled session from
+`http_client.py`, and back off when the origin throttles them.
+
+The last line printed is `changed` or `unchanged`, for the downstream
+ShortCircuitOperator task to read from XCom. New fingerprints are staged next
+to the store and only committed once the load succeeded, so a failed run is
+retried in full:
+
+    FINGERPRINT_FILE=... python fingerprints.py commit
+"""
+
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import sys
+import typing
+
+import http_client
+import requests
+
+CHUNK_SIZE = 1024 * 1024
+TIMEOUT = 60
+
+
+def fetch(
+    http: requests.Session,
+    url: str,
+    target_path: pathlib.Path,
+    known: dict,
+    conditional: bool = True,
+) -> typing.Optional[dict]:
+    """Downloads `url` to `target_path` and returns its fingerprint.
+
+    Returns `None` when the server answers that the source didn't change since
+    the `known` fingerprint, and leaves the target alone. The request is only
+    made conditional when `conditional` is set.
+    """
+    headers = {}
+    if conditional and known.get("etag"):
+        headers["If-None-Match"] = known["etag"]
+    if conditional and known.get("last_modified"):
+        headers["If-Modified-Since"] = known["last_modified"]
+
+    partial_path = target_path.with_name(f"{target_path.name}.part")
+    with http.get(url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+        if response.status_code == 304:
+            logging.info(f"{url} not modified since {known.get('last_modified')}")
+            return None
+        response.raise_for_status()
+
+        digest, size = hashlib.sha256(), 0
+        with open(partial_path, "wb") as partial_file:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                digest.update(chunk)
+                size += len(chunk)
+                partial_file.write(chunk)
+
+        fingerprint = {
+            "sha256": digest.hexdigest(),
+            "size": size,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }
+    partial_path.replace(target_path)
+    return fingerprint
+
+
+def record(store_path: pathlib.Path, fingerprints: typing.Dict[str, dict]) -> bool:
+    """Stages the fingerprints of changed sources, returns whether there are any"""
+    store = load(store_path)
+    changed, refreshed = {}, {}
+    for url, fingerprint in fingerprints.items():
+        known = store.get(url, {})
+        if contents(fingerprint) != contents(known):
+            changed[url] = fingerprint
+        elif fingerprint != known:
+            refreshed[url] = fingerprint
+        logging.info(
+            f"{url} {'changed' if url in changed else 'unchanged'}: {fingerprint}"
+        )
+
+    if refreshed:
+        # The contents are loaded already, so refreshed validators are kept
+        # right away for the next conditional request
+        store_path.write_text(json.dumps({**store, **refreshed}, indent=2))
+    if changed:
+        stage(store_path, changed)
+    return bool(changed)
+
+
+def commit(store_path: pathlib.Path) -> None:
+    """Merges the staged fingerprints into the store"""
+    staged_path = staging_path(store_path)
+    staged = load(staged_path)
+    if not staged:
+        return
+
+    store_path.write_text(json.dumps({**load(store_path), **staged}, indent=2))
+    staged_path.unlink()
+    logging.info(f"Committed fingerprints for {list(staged)}")
+
+
+def stage(store_path: pathlib.Path, fingerprints: typing.Dict[str, dict]) -> None:
+    staged_path = staging_path(store_path)
+    staged_path.write_text(json.dumps({**load(staged_path), **fingerprints}, indent=2))
+
+
+def contents(fingerprint: dict) -> typing.Tuple:
+    return fingerprint.get("sha256"), fingerprint.get("size")
+
+
+def load(path: pathlib.Path) -> typing.Dict[str, dict]:
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+def staging_path(store_path: pathlib.Path) -> pathlib.Path:
+    return store_path.with_name(f"{store_path.stem}.staged{store_path.suffix}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    assert os.environ["FINGERPRINT_FILE"]
+    store_path = pathlib.Path(os.environ["FINGERPRINT_FILE"]).expanduser()
+
+    if sys.argv[1:] == ["fetch"]:
+        assert os.environ["SOURCE_URL"]
+        assert os.environ["TARGET_FILE"]
+        url = os.environ["SOURCE_URL"]
+        with http_client.session(1) as http:
+            fingerprint = fetch(
+                http,
+                url,
+                target_path=pathlib.Path(os.environ["TARGET_FILE"]).expanduser(),
+                known=load(store_path).get(url, {}),
+            )
+        changed = fingerprint is not None and record(store_path, {url: fingerprint})
+        print("changed" if changed else "unchanged")
+    elif sys.argv[1:] == ["commit"]:
+        commit(store_path)
+    else:
+        sys.exit("Usage: fingerprints.py fetch|commit")
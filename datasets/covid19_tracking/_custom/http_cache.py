@@ -0,0 +1,176 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""An on-disk cache of HTTP responses, revalidated on every request.
+
+Pages that come with an `ETag` or `Last-Modified` validator are kept in the
+cache directory. The next GET for the same URL sends the validators along, and
+a `304 Not Modified` answer is served from the cache, so a re-run or a retry
+only costs a bodyless round trip per unchanged page.
+
+The cache is capped at `max_bytes`. Entries are evicted least recently used
+first, and using an entry bumps its file modification time.
+
+Sessions opt in through `http_client.session(cache=...)`. Streamed requests,
+like the screenshot downloads, are never cached.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import tempfile
+import threading
+import typing
+
+import requests
+import requests.adapters
+
+MAX_BYTES = 64 * 1024 * 1024
+
+
+class Cache:
+    """The cached bodies and their metadata, with hit and miss counters"""
+
+    def __init__(self, cache_dir: pathlib.Path, max_bytes: int = MAX_BYTES) -> None:
+        if max_bytes < 1:
+            raise ValueError("`max_bytes` must be a positive integer")
+
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.bytes_served = 0
+        self.lock = threading.Lock()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # The cap may have been lowered since the last run
+        self.evict()
+
+    def lookup(self, url: str) -> typing.Optional[dict]:
+        meta_path, body_path = self.paths(url)
+        try:
+            meta = json.loads(meta_path.read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+        return meta if meta.get("url") == url and body_path.exists() else None
+
+    def read(self, url: str) -> typing.Optional[bytes]:
+        """Returns the cached body, or `None` when it was evicted meanwhile"""
+        meta_path, body_path = self.paths(url)
+        with self.lock:
+            try:
+                body = body_path.read_bytes()
+            except FileNotFoundError:
+                return None
+            for path in (meta_path, body_path):
+                os.utime(path)
+            self.hits += 1
+            self.bytes_served += len(body)
+        return body
+
+    def store(self, url: str, response: requests.Response) -> None:
+        meta_path, body_path = self.paths(url)
+        meta = {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "content_type": response.headers.get("Content-Type"),
+            "encoding": response.encoding,
+        }
+        with self.lock:
+            # The body is written first, so a metadata file always has one
+            write_atomic(body_path, response.content)
+            write_atomic(meta_path, json.dumps(meta).encode())
+            self.evict()
+
+    def miss(self) -> None:
+        with self.lock:
+            self.misses += 1
+
+    def evict(self) -> None:
+        stats = {path: path.stat() for path in self.cache_dir.glob("*.body")}
+        size = sum(stat.st_size for stat in stats.values())
+        for body_path in sorted(stats, key=lambda path: stats[path].st_mtime):
+            if size <= self.max_bytes:
+                break
+            body_path.with_suffix(".json").unlink(missing_ok=True)
+            body_path.unlink()
+            size -= stats[body_path].st_size
+
+    def paths(self, url: str) -> typing.Tuple[pathlib.Path, pathlib.Path]:
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return self.cache_dir / f"{key}.json", self.cache_dir / f"{key}.body"
+
+    def log_stats(self) -> None:
+        requests_made = self.hits + self.misses
+        hit_rate = self.hits / requests_made if requests_made else 0
+        logging.info(
+            f"HTTP cache: {self.hits} hits, {self.misses} misses "
+            f"({hit_rate:.0%} hit rate), {self.bytes_served / 1e6:.1f} MB "
+            "served from the cache"
+        )
+
+
+class CachingAdapter(requests.adapters.HTTPAdapter):
+    """Revalidates the cached GET responses and serves the unmodified ones"""
+
+    def __init__(self, cache: Cache, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.cache = cache
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        if request.method != "GET" or kwargs.get("stream"):
+            return super().send(request, **kwargs)
+
+        cached = self.cache.lookup(request.url)
+        if cached and cached["etag"]:
+            request.headers["If-None-Match"] = cached["etag"]
+        if cached and cached["last_modified"]:
+            request.headers["If-Modified-Since"] = cached["last_modified"]
+
+        response = super().send(request, **kwargs)
+        if cached and response.status_code == 304:
+            # Reading the empty body hands the connection back to the pool
+            response.content
+            body = self.cache.read(request.url)
+            if body is None:
+                # Evicted by another thread since the lookup, so fetch it again
+                request.headers.pop("If-None-Match", None)
+                request.headers.pop("If-Modified-Since", None)
+                return self.send(request, **kwargs)
+
+            response.status_code = 200
+            response.reason = "OK (cached)"
+            response._content = body
+            response.encoding = cached["encoding"]
+            if cached["content_type"]:
+                response.headers["Content-Type"] = cached["content_type"]
+            return response
+
+        self.cache.miss()
+        validators = ("ETag", "Last-Modified")
+        if response.status_code == 200 and any(
+            name in response.headers for name in validators
+        ):
+            self.cache.store(request.url, response)
+        return response
+
+
+def write_atomic(path: pathlib.Path, data: bytes) -> None:
+    with tempfile.NamedTemporaryFile(
+        dir=path.parent, suffix=".tmp", delete=False
+    ) as tmp_file:
+        tmp_file.write(data)
+    pathlib.Path(tmp_file.name).replace(path)
@@ -0,0 +1,80 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Pooled HTTP sessions shared by the covid19_tracking custom callables.
+
+A bare `requests.get` opens a new connection, with a new TLS handshake, for
+every request. For the small screenshot files the handshake takes longer than
+the transfer, so the scripts that fetch many files share a session that keeps
+its connections alive and reuses them.
+
+The pool is sized to the number of requests the caller keeps in flight: with
+fewer connections requests would queue for one, and more would sit unused.
+
+requests and urllib3 only speak HTTP/1.1, so connections are reused but
+requests aren't multiplexed over them as HTTP/2 would.
+
+Given a `http_cache.Cache`, the session revalidates and serves cached pages.
+
+Requests go through a `rate_control.RateControl`, which backs off when the
+origin throttles or slows down. Pass one to share it between sessions, or to
+cap the request rate.
+
+Given a `download_metrics.Metrics`, the session records the latency of its
+requests and its retries.
+"""
+
+import typing
+
+import download_metrics
+import http_cache
+import rate_control
+import requests
+
+POOL_SIZE = 10
+
+
+class CachingThrottledAdapter(http_cache.CachingAdapter, rate_control.ThrottledAdapter):
+    """Serves the cached pages, sending the revalidations through a rate control"""
+
+
+def session(
+    pool_size: int = POOL_SIZE,
+    cache: typing.Optional[http_cache.Cache] = None,
+    rate: typing.Optional[rate_control.RateControl] = None,
+    metrics: typing.Optional[download_metrics.Metrics] = None,
+) -> requests.Session:
+    """Returns a session keeping up to `pool_size` connections per host.
+
+    Threads can share the session for GET requests. A thread finding every
+    connection in use waits for one rather than opening a connection that
+    would be closed after a single request.
+    """
+    if pool_size < 1:
+        raise ValueError("`pool_size` must be a positive integer")
+
+    adapter_args = {
+        "rate": rate or rate_control.RateControl(max_concurrency=pool_size),
+        "metrics": metrics,
+        "pool_maxsize": pool_size,
+        "pool_block": True,
+    }
+    if cache is None:
+        adapter = rate_control.ThrottledAdapter(**adapter_args)
+    else:
+        adapter = CachingThrottledAdapter(cache=cache, **adapter_args)
+    http = requests.Session()
+    http.mount("https://", adapter)
+    http.mount("http://", adapter)
+    return http
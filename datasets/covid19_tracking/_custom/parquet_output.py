@@ -0,0 +1,149 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Typed Parquet output for the column-batch transforms.
+
+Column types come from the BigQuery schema of the pipeline's load task, which
+`generate_dag.py` copies into the `transform` section as `column_types`. Empty
+cells are written as nulls, so every Parquet field is nullable and BigQuery
+enforces the schema modes on load.
+"""
+
+import datetime
+import decimal
+import itertools
+import pathlib
+import typing
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+COMPRESSION = "snappy"
+
+ARROW_TYPES = {
+    "STRING": pa.string(),
+    "INTEGER": pa.int64(),
+    "INT64": pa.int64(),
+    "FLOAT": pa.float64(),
+    "FLOAT64": pa.float64(),
+    # BigQuery NUMERIC has a precision of 38 and a scale of 9
+    "NUMERIC": pa.decimal128(38, 9),
+    "BOOLEAN": pa.bool_(),
+    "BOOL": pa.bool_(),
+    "DATE": pa.date32(),
+}
+
+
+def to_int(val: typing.Union[str, int]) -> int:
+    """Converts a whole number, also when written as a decimal, e.g. "1.0" """
+    if isinstance(val, int):
+        return val
+    try:
+        return int(val)
+    except ValueError:
+        number = decimal.Decimal(val)
+    if number != number.to_integral_value():
+        raise ValueError(f"{val!r} isn't a whole number")
+    return int(number)
+
+
+# The spellings BigQuery accepts for BOOLEAN in CSV, compared case-insensitively
+BOOLEANS = {"true": True, "t": True, "1": True, "false": False, "f": False, "0": False}
+
+
+def to_bool(val: typing.Union[str, bool]) -> bool:
+    if isinstance(val, bool):
+        return val
+    try:
+        return BOOLEANS[str(val).lower()]
+    except KeyError:
+        raise ValueError(f"{val!r} isn't a boolean") from None
+
+
+CONVERTERS = {
+    "STRING": str,
+    "INTEGER": to_int,
+    "INT64": to_int,
+    "FLOAT": float,
+    "FLOAT64": float,
+    "NUMERIC": decimal.Decimal,
+    "BOOLEAN": to_bool,
+    "BOOL": to_bool,
+    "DATE": datetime.date.fromisoformat,
+}
+
+
+class ParquetWriter:
+    """Writes batches of transformed rows as row groups of a Parquet file"""
+
+    def __init__(
+        self,
+        target_path: pathlib.Path,
+        headers: list,
+        column_types: dict,
+        compression: str = COMPRESSION,
+    ) -> None:
+        missing = [name for name in headers if name not in column_types]
+        if missing:
+            raise ValueError(f"No column types found for {missing}")
+
+        unsupported = {column_types[name] for name in headers} - ARROW_TYPES.keys()
+        if unsupported:
+            raise ValueError(f"Column types {unsupported} can't be written to Parquet")
+
+        self.types = [column_types[name] for name in headers]
+        self.schema = pa.schema(
+            [pa.field(name, ARROW_TYPES[column_types[name]]) for name in headers]
+        )
+        self.writer = pq.ParquetWriter(
+            str(target_path), self.schema, compression=compression
+        )
+
+    def writerows(self, rows: typing.Iterable[typing.Sequence]) -> None:
+        rows = list(rows)
+        if not rows:
+            return
+
+        # Only the cells at the end of a short row can be missing. They are
+        # written as nulls, as `allow_jagged_rows` loads them from a CSV. Cells
+        # past the last column are dropped, where a CSV load would fail unless
+        # it sets `ignore_unknown_values`.
+        columns = list(itertools.zip_longest(*rows, fillvalue=""))
+        columns += [("",) * len(rows)] * (len(self.types) - len(columns))
+        arrays = []
+        for bq_type, field, column in zip(self.types, self.schema, columns):
+            try:
+                values = to_values(bq_type, column)
+            except (ValueError, ArithmeticError) as err:
+                raise ValueError(f"Column `{field.name}` isn't {bq_type}: {err}")
+            arrays.append(pa.array(values, type=field.type))
+        self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self) -> None:
+        self.writer.close()
+
+    def __enter__(self) -> "ParquetWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def to_values(bq_type: str, column: typing.Sequence) -> list:
+    """Converts the column's cells once per distinct value, with "" as null"""
+    convert = CONVERTERS[bq_type]
+    table = {
+        val: None if val == "" or val is None else convert(val) for val in set(column)
+    }
+    return [table[val] for val in column]
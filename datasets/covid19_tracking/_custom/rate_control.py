@@ -0,0 +1,263 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Rate control of the requests sent to an origin.
+
+Every session from `http_client.session` sends its requests through a
+`RateControl`, which several sessions can share:
+
+- A token bucket caps the rate at `rate_limit` requests a second, in bursts of
+  up to `burst` requests. There's no cap by default.
+- An AIMD limit on the requests in flight. Every response in good time raises
+  the limit by one request per round of requests, up to `max_concurrency`.
+  A `429 Too Many Requests` or `503 Service Unavailable`, a connection error or
+  timeout, or responses slowing down well past the fastest ones halve it, at
+  most once per `COOLDOWN` so a burst of errors counts once.
+- Throttled and failed GET requests are retried up to `RETRIES` times, after a
+  jittered exponential backoff. A `Retry-After` from the origin holds every
+  request back until then, not only the retried one.
+
+A request holds its slot until its body is read, the response is closed or
+sending it fails, so a streamed download counts as in flight for as long as it
+transfers. Streamed responses must therefore be read to the end or closed, e.g.
+in a `with` block.
+Latencies are still measured up to the response headers, so that large bodies
+don't pass for congestion. Given a `download_metrics.Metrics`, the adapter
+records them and the retries too.
+"""
+
+import email.utils
+import logging
+import random
+import threading
+import time
+import typing
+from datetime import datetime, timezone
+
+import download_metrics
+import requests
+import requests.adapters
+
+RETRIES = 4
+BACKOFF = 0.5
+MAX_BACKOFF = 60
+
+COOLDOWN = 1
+DECREASE_FACTOR = 0.5
+
+# The smoothed latency is congestion once it's this many times the fastest
+# response seen, and over the floor
+LATENCY_TOLERANCE = 4
+LATENCY_FLOOR = 1
+LATENCY_SMOOTHING = 0.2
+
+THROTTLED_STATUSES = (429, 503)
+RETRIED_METHODS = ("GET", "HEAD")
+RETRIED_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+
+
+class RateControl:
+    """The token bucket and concurrency limit shared by the requests to an origin"""
+
+    def __init__(
+        self,
+        rate_limit: typing.Optional[float] = None,
+        burst: typing.Optional[int] = None,
+        max_concurrency: int = 10,
+    ) -> None:
+        if rate_limit is not None and rate_limit <= 0:
+            raise ValueError("`rate_limit` must be a positive number")
+        if max_concurrency < 1:
+            raise ValueError("`max_concurrency` must be a positive integer")
+
+        self.rate_limit = rate_limit
+        self.burst = burst or max(1, int(rate_limit or 1))
+        self.tokens = float(self.burst)
+        self.refilled_at = time.monotonic()
+
+        self.max_concurrency = max_concurrency
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.min_latency = None
+        self.latency = None
+        self.decreased_at = 0.0
+        self.paused_until = 0.0
+
+        self.throttled = 0
+        self.retries = 0
+        self.condition = threading.Condition()
+
+    def acquire(self) -> None:
+        """Waits for a token and a free slot among the requests in flight"""
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                wait = max(self.paused_until - now, self.token_wait(now))
+                if wait <= 0 and self.in_flight < int(self.limit):
+                    break
+                self.condition.wait(wait if wait > 0 else None)
+
+            if self.rate_limit:
+                self.tokens -= 1
+            self.in_flight += 1
+
+    def release(self, latency: float, throttled: bool) -> None:
+        """Frees the slot of a request, adjusting the limit to how it went"""
+        with self.condition:
+            self.in_flight -= 1
+            congested = throttled
+            if throttled:
+                self.throttled += 1
+            else:
+                self.min_latency = min(self.min_latency or latency, latency)
+                self.latency = (self.latency or latency) * (
+                    1 - LATENCY_SMOOTHING
+                ) + latency * LATENCY_SMOOTHING
+                congested = self.latency > max(
+                    self.min_latency * LATENCY_TOLERANCE, LATENCY_FLOOR
+                )
+
+            now = time.monotonic()
+            if not congested:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            elif now - self.decreased_at > COOLDOWN:
+                self.limit = max(1.0, self.limit * DECREASE_FACTOR)
+                self.decreased_at = now
+            self.condition.notify_all()
+
+    def abandon(self) -> None:
+        """Frees the slot of a request that failed on this side, keeping the limit"""
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def back_off(self, attempt: int, retry_after: typing.Optional[str]) -> float:
+        """Returns how long to wait before retrying after the `attempt`th try"""
+        delay = random.uniform(0, min(MAX_BACKOFF, BACKOFF * pow(2, attempt)))
+        pause = min(MAX_BACKOFF, retry_after_seconds(retry_after) or 0)
+        with self.condition:
+            self.retries += 1
+            # The origin asked every request to wait
+            self.paused_until = max(self.paused_until, time.monotonic() + pause)
+        return max(delay, pause)
+
+    def token_wait(self, now: float) -> float:
+        """Refills the bucket, and returns how long until it has a token"""
+        if not self.rate_limit:
+            return 0
+        self.tokens = min(
+            self.burst, self.tokens + (now - self.refilled_at) * self.rate_limit
+        )
+        self.refilled_at = now
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate_limit
+
+    def log_stats(self) -> None:
+        logging.info(
+            f"Rate control: {self.throttled} throttled or failed requests, "
+            f"{self.retries} retries, {int(self.limit)} of {self.max_concurrency} "
+            "requests in flight allowed at the end"
+        )
+
+
+class ThrottledAdapter(requests.adapters.HTTPAdapter):
+    """Sends the requests through a rate control, retrying the throttled ones"""
+
+    def __init__(
+        self,
+        rate: RateControl,
+        metrics: typing.Optional[download_metrics.Metrics] = None,
+        **kwargs,
+    ) -> None:
+        super().__init__(**kwargs)
+        self.rate = rate
+        self.metrics = metrics
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        retries = RETRIES if request.method in RETRIED_METHODS else 0
+        for attempt in range(retries + 1):
+            self.rate.acquire()
+            started_at = time.monotonic()
+            try:
+                response = super().send(request, **kwargs)
+            except RETRIED_ERRORS as e:
+                self.release(time.monotonic() - started_at, throttled=True)
+                if attempt == retries:
+                    raise
+                delay = self.back_off(attempt, None)
+                logging.warning(f"{request.url} failed, retrying in {delay:.1f}s: {e}")
+                time.sleep(delay)
+                continue
+            except BaseException:
+                # Bad arguments, TLS errors or an interrupt say nothing of the
+                # origin, but the slot must still be freed
+                self.rate.abandon()
+                raise
+
+            throttled = response.status_code in THROTTLED_STATUSES
+            self.release_after_body(response, time.monotonic() - started_at, throttled)
+            if not throttled or attempt == retries:
+                return response
+
+            # Reading the body hands the connection back to the pool
+            response.content
+            delay = self.back_off(attempt, response.headers.get("Retry-After"))
+            logging.warning(
+                f"{request.url} returned {response.status_code}, retrying in "
+                f"{delay:.1f}s"
+            )
+            time.sleep(delay)
+
+    def release_after_body(
+        self, response: requests.Response, latency: float, throttled: bool
+    ) -> None:
+        """Releases the slot of a request once its body is read or it's closed.
+
+        urllib3 hands the connection back to the pool at that point, whether the
+        body was read to the end or the response closed early.
+        """
+        release_conn = response.raw.release_conn
+        released = threading.Lock()
+
+        def release_conn_and_slot() -> None:
+            release_conn()
+            # The connection can be released more than once, the slot can't
+            if released.acquire(blocking=False):
+                self.release(latency, throttled)
+
+        response.raw.release_conn = release_conn_and_slot
+
+    def release(self, latency: float, throttled: bool) -> None:
+        self.rate.release(latency, throttled)
+        if self.metrics is not None:
+            self.metrics.record_request(latency)
+
+    def back_off(self, attempt: int, retry_after: typing.Optional[str]) -> float:
+        if self.metrics is not None:
+            self.metrics.record_retry()
+        return self.rate.back_off(attempt, retry_after)
+
+
+def retry_after_seconds(header: typing.Optional[str]) -> typing.Optional[float]:
+    """Parses a `Retry-After` header, in seconds or as an HTTP date"""
+    if not header:
+        return None
+    try:
+        return max(0.0, float(header))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(header)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
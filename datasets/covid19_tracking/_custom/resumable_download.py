@@ -0,0 +1,199 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Resumable downloads that only ever leave complete files at their target.
+
+A file is written to a partial file first, and renamed to its target once its
+size matches the one the server announced and, when one is given, its SHA-256
+matches too. An existing target is therefore always complete, and a killed
+worker leaves a partial file at most.
+
+A partial file is kept when a transfer breaks off. The next attempt, in the
+same run or in a retry of the task, asks for the missing bytes only with a
+`Range` request. The `ETag` or `Last-Modified` validator of the first response
+is kept next to the partial file and sent along in `If-Range`, so a file that
+changed on the server since is downloaded whole again rather than spliced.
+Without a validator the download starts over.
+
+Bodies are requested uncompressed, as ranges and lengths count the bytes sent.
+"""
+
+import hashlib
+import json
+import logging
+import pathlib
+import typing
+
+import requests
+
+ATTEMPTS = 3
+
+# The bytes read since the last chunk written are lost when a transfer breaks
+CHUNK_SIZE = 64 * 1024
+TIMEOUT = 60
+
+
+class IncompleteDownloadError(requests.exceptions.RequestException):
+    """The downloaded bytes don't add up to the announced size or expected hash"""
+
+
+# A partial file is resumed after any of these
+RETRIED_ERRORS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.ChunkedEncodingError,
+    requests.exceptions.Timeout,
+    IncompleteDownloadError,
+)
+
+
+def download(
+    http: requests.Session,
+    url: str,
+    target_path: pathlib.Path,
+    sha256: typing.Optional[str] = None,
+    partial_path: typing.Optional[pathlib.Path] = None,
+) -> int:
+    """Downloads `url` to `target_path` and returns the size of the file.
+
+    The partial file defaults to the target path with a `.part` suffix. A
+    transfer that breaks off is resumed, up to `ATTEMPTS` attempts in all.
+    """
+    partial_path = partial_path or target_path.with_name(f"{target_path.name}.part")
+    partial_path.parent.mkdir(parents=True, exist_ok=True)
+
+    for attempt in range(1, ATTEMPTS + 1):
+        try:
+            size = transfer(http, url, partial_path)
+            verify(partial_path, size, sha256)
+            break
+        except RETRIED_ERRORS as e:
+            if attempt == ATTEMPTS:
+                raise
+            logging.warning(f"Attempt {attempt} at {url} failed: {e}")
+
+    size = partial_path.stat().st_size
+    partial_path.replace(target_path)
+    validator_path(partial_path).unlink(missing_ok=True)
+    return size
+
+
+def transfer(
+    http: requests.Session, url: str, partial_path: pathlib.Path
+) -> typing.Optional[int]:
+    """Writes the missing bytes to the partial file, returns the full size if known"""
+    offset = partial_path.stat().st_size if partial_path.exists() else 0
+    validator = read_validator(partial_path) if offset else None
+
+    headers = {"Accept-Encoding": "identity"}
+    if validator:
+        headers["Range"] = f"bytes={offset}-"
+        headers["If-Range"] = validator
+
+    with http.get(url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+        if validator and response.status_code == 416:
+            # The partial file is as long as the file or longer, `verify` tells
+            _, size = content_range(response.headers.get("Content-Range", ""))
+            if size is None:
+                discard(partial_path)
+                raise IncompleteDownloadError(f"{url} has no range from {offset}")
+            return size
+
+        response.raise_for_status()
+        if validator and response.status_code == 206:
+            start, size = content_range(response.headers.get("Content-Range", ""))
+            if start != offset:
+                discard(partial_path)
+                raise IncompleteDownloadError(
+                    f"Asked {url} for bytes from {offset}, got them from {start}"
+                )
+            logging.info(f"Resuming {url} from byte {offset}")
+            mode = "ab"
+        else:
+            # A full body, because the file changed or ranges aren't supported
+            length = response.headers.get("Content-Length")
+            size = int(length) if length else None
+            write_validator(partial_path, response.headers)
+            mode = "wb"
+
+        with open(partial_path, mode) as partial_file:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                partial_file.write(chunk)
+    return size
+
+
+def verify(
+    partial_path: pathlib.Path, size: typing.Optional[int], sha256: typing.Optional[str]
+) -> None:
+    actual_size = partial_path.stat().st_size if partial_path.exists() else 0
+    if size is not None and actual_size != size:
+        # A short file is resumed, a longer one can't be
+        if actual_size > size:
+            discard(partial_path)
+        raise IncompleteDownloadError(
+            f"{partial_path.name} has {actual_size} of {size} bytes"
+        )
+
+    if sha256 and file_sha256(partial_path) != sha256.lower():
+        discard(partial_path)
+        raise IncompleteDownloadError(f"{partial_path.name} has the wrong SHA-256")
+
+
+def content_range(
+    header: str,
+) -> typing.Tuple[typing.Optional[int], typing.Optional[int]]:
+    """Returns the first byte and the full size of e.g. `bytes 100-199/200`"""
+    try:
+        _, byte_range = header.split(" ", 1)
+        first_last, size = byte_range.split("/", 1)
+        first = None if first_last == "*" else int(first_last.split("-", 1)[0])
+        return first, None if size == "*" else int(size)
+    except ValueError:
+        return None, None
+
+
+def file_sha256(path: pathlib.Path) -> str:
+    file_hash = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def validator_path(partial_path: pathlib.Path) -> pathlib.Path:
+    return partial_path.with_name(f"{partial_path.name}.json")
+
+
+def read_validator(partial_path: pathlib.Path) -> typing.Optional[str]:
+    try:
+        return json.loads(validator_path(partial_path).read_text()).get("validator")
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def write_validator(partial_path: pathlib.Path, headers: typing.Mapping) -> None:
+    """Keeps the validator `If-Range` resumes the partial file with, if any"""
+    # A weak ETag can't be used in `If-Range`
+    etag = headers.get("ETag")
+    validator = etag if etag and not etag.startswith("W/") else None
+    validator = validator or headers.get("Last-Modified")
+
+    if validator:
+        validator_path(partial_path).write_text(json.dumps({"validator": validator}))
+    else:
+        validator_path(partial_path).unlink(missing_ok=True)
+
+
+def discard(partial_path: pathlib.Path) -> None:
+    partial_path.unlink(missing_ok=True)
+    validator_path(partial_path).unlink(missing_ok=True)
@@ -0,0 +1,183 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Date watermarks for pipelines that append only the newer rows of a file.
+
+A pipeline opts in with an `incremental` entry in its `transform` section:
+
+    transform:
+      incremental:
+        date_column: date
+
+The transform script reads the watermark, the last loaded `YYYY-MM-DD` date,
+from the JSON file named by `WATERMARK_FILE` and only writes rows dated after
+it. Without a watermark file the whole history is written.
+
+The watermark is advanced only once the load succeeded, by running this module
+as a script after the load task. It takes the max date from the statistics
+sidecar of the transform, see `column_stats.py`:
+
+    WATERMARK_FILE=... STATS_JSON=... DATE_COLUMN=date python watermark.py
+
+Sources listing several series, like the screenshots of every state, keep a
+watermark per key instead. Those are taken from the loaded CSV itself, and
+kept for every run date, as the watermarks after that run:
+
+    WATERMARK_FILE=... CSV_PATH=... KEY_COLUMN=state_name DATE_COLUMN=date \
+        RUN_DATE=2021-03-07 DROPPED_CSV=... python watermark.py
+
+A run only reads the watermarks of the runs before it, so running a day again
+writes the same rows again, and its load can replace what the first try loaded.
+Only the last `KEPT_RUNS` runs are kept, so the file stays small. A day older
+than those has no watermarks before it, and rerunning it would scrape the
+whole history.
+
+The optional `DROPPED_CSV` lists the rows that were scraped but not loaded,
+like those of failed screenshot downloads. The watermark of a key then stays
+below its earliest dropped date, so the next run scrapes that date again. The
+rows loaded after it are scraped again too, as a watermark can't skip a gap.
+"""
+
+import csv
+import json
+import logging
+import os
+import pathlib
+import typing
+
+# A month of daily runs, far more than Airflow reruns in practice
+KEPT_RUNS = 31
+
+
+def read(path: typing.Optional[pathlib.Path]) -> typing.Optional[str]:
+    if path is None or not path.exists():
+        return None
+    return json.loads(path.read_text())["max_date"]
+
+
+def advance(
+    watermark_path: pathlib.Path, stats_path: pathlib.Path, date_column: str
+) -> typing.Optional[str]:
+    """Moves the watermark up to the max date of the loaded rows.
+
+    A run that loaded no rows leaves the watermark as it is.
+    """
+    stats = json.loads(stats_path.read_text())
+    if date_column not in stats["columns"]:
+        raise ValueError(f"No statistics found for the `{date_column}` column")
+
+    current = read(watermark_path)
+    loaded = stats["columns"][date_column].get("max_date")
+    if loaded is None or (current is not None and loaded <= current):
+        logging.info(f"Watermark stays at {current}")
+        return current
+
+    watermark_path.write_text(json.dumps({"max_date": loaded}))
+    logging.info(f"Watermark moved from {current} to {loaded}")
+    return loaded
+
+
+def read_per_key(
+    path: typing.Optional[pathlib.Path], run_date: typing.Optional[str] = None
+) -> typing.Dict[str, str]:
+    """Returns the watermarks after the last run before `run_date`, or any run"""
+    runs = read_runs(path)
+    earlier = [date for date in runs if run_date is None or date < run_date]
+    return dict(runs[max(earlier)]) if earlier else {}
+
+
+def advance_per_key(
+    watermark_path: pathlib.Path,
+    csv_path: pathlib.Path,
+    key_column: str,
+    date_column: str,
+    run_date: str,
+    dropped_path: typing.Optional[pathlib.Path] = None,
+) -> typing.Dict[str, str]:
+    """Sets the watermarks after `run_date` to the max dates of its loaded rows.
+
+    Given the rows the run dropped, a key's watermark only moves up to its
+    last loaded date before the earliest dropped one.
+    """
+    max_dates = read_per_key(watermark_path, run_date)
+    dropped = min_dates(dropped_path, key_column, date_column)
+    moved = {}
+    with open(csv_path) as csv_file:
+        for row in csv.DictReader(csv_file):
+            key, loaded = row[key_column], row[date_column]
+            if key in dropped and loaded >= dropped[key]:
+                continue
+            if loaded and loaded > moved.get(key, max_dates.get(key, "")):
+                moved[key] = loaded
+
+    max_dates.update(moved)
+    runs = read_runs(watermark_path)
+    runs[run_date] = max_dates
+    kept_runs = {date: runs[date] for date in sorted(runs)[-KEPT_RUNS:]}
+    watermark_path.write_text(json.dumps({"runs": kept_runs}, sort_keys=True))
+    logging.info(
+        f"Watermarks after {run_date} moved for {len(moved)} of "
+        f"{len(max_dates)} keys, {len(dropped)} keys held below dropped rows"
+    )
+    return max_dates
+
+
+def min_dates(
+    csv_path: typing.Optional[pathlib.Path], key_column: str, date_column: str
+) -> typing.Dict[str, str]:
+    """Returns the earliest date of every key in the CSV, if there's one"""
+    dates = {}
+    if csv_path is None or not csv_path.exists():
+        return dates
+    with open(csv_path) as csv_file:
+        for row in csv.DictReader(csv_file):
+            key, date = row[key_column], row[date_column]
+            if date and (key not in dates or date < dates[key]):
+                dates[key] = date
+    return dates
+
+
+def read_runs(path: typing.Optional[pathlib.Path]) -> typing.Dict[str, dict]:
+    if path is None or not path.exists():
+        return {}
+    return json.loads(path.read_text())["runs"]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    assert os.environ["WATERMARK_FILE"]
+    assert os.environ["DATE_COLUMN"]
+    if os.environ.get("KEY_COLUMN"):
+        assert os.environ["CSV_PATH"]
+        assert os.environ["RUN_DATE"]
+        advance_per_key(
+            watermark_path=pathlib.Path(os.environ["WATERMARK_FILE"]).expanduser(),
+            csv_path=pathlib.Path(os.environ["CSV_PATH"]).expanduser(),
+            key_column=os.environ["KEY_COLUMN"],
+            date_column=os.environ["DATE_COLUMN"],
+            run_date=os.environ["RUN_DATE"],
+            dropped_path=(
+                pathlib.Path(os.environ["DROPPED_CSV"]).expanduser()
+                if os.environ.get("DROPPED_CSV")
+                else None
+            ),
+        )
+    else:
+        assert os.environ["STATS_JSON"]
+        advance(
+            watermark_path=pathlib.Path(os.environ["WATERMARK_FILE"]).expanduser(),
+            stats_path=pathlib.Path(os.environ["STATS_JSON"]).expanduser(),
+            date_column=os.environ["DATE_COLUMN"],
+        )
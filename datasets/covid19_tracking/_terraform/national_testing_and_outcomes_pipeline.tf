@@ -22,6 +22,11 @@ resource "google_bigquery_table" "national_testing_and_outcomes" {
 
 
 
+  time_partitioning {
+    type  = "DAY"
+    field = "date"
+  }
+
   depends_on = [
     google_bigquery_dataset.covid19_tracking
   ]
@@ -22,6 +22,11 @@ resource "google_bigquery_table" "state_screenshots" {
 
 
 
+  time_partitioning {
+    type = "DAY"
+
+  }
+
   depends_on = [
     google_bigquery_dataset.covid19_tracking
   ]
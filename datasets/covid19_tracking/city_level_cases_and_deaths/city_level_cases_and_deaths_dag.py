@@ -15,7 +15,7 @@
 
 from airflow import DAG
 from airflow.contrib.operators import gcs_to_bq, gcs_to_gcs
-from airflow.operators import bash_operator
+from airflow.operators import bash_operator, python_operator
 
 default_args = {
     "owner": "Google",
@@ -36,13 +36,24 @@ with DAG(
     # Task to copy full data for city-level cases and deaths from COVID-19 Tracking Project to GCS
     download_raw_csv_file = bash_operator.BashOperator(
         task_id="download_raw_csv_file",
-        bash_command="mkdir -p $airflow_data_folder/covid19_tracking/city_level_cases_and_deaths/{{ ds }}\ncurl -o $airflow_data_folder/covid19_tracking/city_level_cases_and_deaths/{{ ds }}/raw-data.csv -L $csv_source_url\n",
+        xcom_push=True,
+        bash_command="mkdir -p $airflow_data_folder/covid19_tracking/city_level_cases_and_deaths/{{ ds }}\nSOURCE_URL=$csv_source_url TARGET_FILE=$airflow_data_folder/covid19_tracking/city_level_cases_and_deaths/{{ ds }}/raw-data.csv FINGERPRINT_FILE=$airflow_data_folder/covid19_tracking/city_level_cases_and_deaths/fingerprints.json python $airflow_home/dags/covid19_tracking/_custom/fingerprints.py fetch\n",
         env={
             "csv_source_url": "https://docs.google.com/spreadsheets/d/e/2PACX-1vRg-dB5Pjt-zN38BZNoCdOk_RJ_MyYFAl3QIkK5fKSddUy44DUgJwZuhjCz8KPMpiFKRwhoIwfs0NbZ/pub?gid=0&single=true&output=csv",
             "airflow_data_folder": "{{ var.json.shared.airflow_data_folder }}",
+            "airflow_home": "{{ var.json.shared.airflow_home }}",
         },
     )
 
+    # Skip the transform and load when the source didn't change since the last load
+    skip_if_source_unchanged = python_operator.ShortCircuitOperator(
+        task_id="skip_if_source_unchanged",
+        python_callable=bool,
+        op_args=[
+            "{{ ti.xcom_pull(task_ids='download_raw_csv_file') == 'changed' or '' }}"
+        ],
+    )
+
     # Run the custom/csv_transform.py script to process the raw CSV contents into a BigQuery friendly format
     process_raw_csv_file = bash_operator.BashOperator(
         task_id="process_raw_csv_file",
@@ -51,6 +62,7 @@ with DAG(
             "airflow_home": "{{ var.json.shared.airflow_home }}",
             "dataset": "covid19_tracking",
             "pipeline": "city_level_cases_and_deaths",
+            "TRANSFORM_RULES": '{"columns": [{"index": 0, "rules": ["yyyymmdd_to_iso"]}, {"from_index": 4, "rules": [{"null_values": ["N/A"]}, {"null_prefixes": ["<", "~"]}, "thousands_separator", {"replace": {"7/1": 7}}]}]}',
         },
     )
 
@@ -164,6 +176,16 @@ with DAG(
         ],
     )
 
+    # Record the fingerprint of the source loaded into BigQuery
+    commit_source_fingerprint = bash_operator.BashOperator(
+        task_id="commit_source_fingerprint",
+        bash_command="FINGERPRINT_FILE=$airflow_data_folder/covid19_tracking/city_level_cases_and_deaths/fingerprints.json python $airflow_home/dags/covid19_tracking/_custom/fingerprints.py commit\n",
+        env={
+            "airflow_data_folder": "{{ var.json.shared.airflow_data_folder }}",
+            "airflow_home": "{{ var.json.shared.airflow_home }}",
+        },
+    )
+
     # Task to archive the CSV file in the destination bucket
     archive_csv_file_to_destination_bucket = gcs_to_gcs.GoogleCloudStorageToGoogleCloudStorageOperator(
         task_id="archive_csv_file_to_destination_bucket",
@@ -174,6 +196,8 @@ with DAG(
         move_object=True,
     )
 
-    download_raw_csv_file >> process_raw_csv_file
+    download_raw_csv_file >> skip_if_source_unchanged
+    skip_if_source_unchanged >> process_raw_csv_file
     process_raw_csv_file >> load_csv_file_to_bq_table
-    load_csv_file_to_bq_table >> archive_csv_file_to_destination_bucket
+    load_csv_file_to_bq_table >> commit_source_fingerprint
+    commit_source_fingerprint >> archive_csv_file_to_destination_bucket
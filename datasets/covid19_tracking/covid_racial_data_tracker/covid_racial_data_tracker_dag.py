@@ -15,7 +15,7 @@
 
 from airflow import DAG
 from airflow.contrib.operators import gcs_to_bq, gcs_to_gcs
-from airflow.operators import bash_operator
+from airflow.operators import bash_operator, python_operator
 
 default_args = {
     "owner": "Google",
@@ -36,13 +36,23 @@ with DAG(
     # Task to copy CRDT CSV file from COVID-19 Tracking Project to GCS
     download_raw_csv_file = bash_operator.BashOperator(
         task_id="download_raw_csv_file",
-        bash_command="mkdir -p $airflow_home/data/covid19_tracking/covid_racial_data_tracker\ncurl -o $airflow_home/data/covid19_tracking/covid_racial_data_tracker/raw-crdt-data-{{ ds }}.csv -L $csv_source_url\n",
+        xcom_push=True,
+        bash_command="mkdir -p $airflow_home/data/covid19_tracking/covid_racial_data_tracker\nSOURCE_URL=$csv_source_url TARGET_FILE=$airflow_home/data/covid19_tracking/covid_racial_data_tracker/raw-crdt-data-{{ ds }}.csv FINGERPRINT_FILE=$airflow_home/data/covid19_tracking/covid_racial_data_tracker/fingerprints.json python $airflow_home/dags/covid19_tracking/_custom/fingerprints.py fetch\n",
         env={
             "csv_source_url": "https://docs.google.com/spreadsheets/d/e/2PACX-1vS8SzaERcKJOD_EzrtCDK1dX1zkoMochlA9iHoHg_RSw3V8bkpfk1mpw4pfL5RdtSOyx_oScsUtyXyk/pub?gid=43720681&single=true&output=csv",
             "airflow_home": "{{ var.json.shared.airflow_home }}",
         },
     )
 
+    # Skip the transform and load when the source didn't change since the last load
+    skip_if_source_unchanged = python_operator.ShortCircuitOperator(
+        task_id="skip_if_source_unchanged",
+        python_callable=bool,
+        op_args=[
+            "{{ ti.xcom_pull(task_ids='download_raw_csv_file') == 'changed' or '' }}"
+        ],
+    )
+
     # Run a custom/*.py script to process the raw CSV contents into a BigQuery friendly format
     process_raw_csv_file = bash_operator.BashOperator(
         task_id="process_raw_csv_file",
@@ -51,6 +61,7 @@ with DAG(
             "airflow_home": "{{ var.json.shared.airflow_home }}",
             "dataset": "covid19_tracking",
             "pipeline": "covid_racial_data_tracker",
+            "TRANSFORM_RULES": '{"compression": "gzip", "columns": [{"index": 0, "rules": ["yyyymmdd_to_iso"]}]}',
         },
     )
 
@@ -59,7 +70,7 @@ with DAG(
         task_id="load_csv_file_to_bq_table",
         bucket="{{ var.json.shared.composer_bucket }}",
         source_objects=[
-            "data/covid19_tracking/covid_racial_data_tracker/crdt-data-{{ ds }}.csv"
+            "data/covid19_tracking/covid_racial_data_tracker/crdt-data-{{ ds }}.csv.gz"
         ],
         source_format="CSV",
         destination_project_dataset_table="covid19_tracking.covid_racial_data_tracker",
@@ -158,16 +169,25 @@ with DAG(
         ],
     )
 
+    # Record the fingerprint of the source loaded into BigQuery
+    commit_source_fingerprint = bash_operator.BashOperator(
+        task_id="commit_source_fingerprint",
+        bash_command="FINGERPRINT_FILE=$airflow_home/data/covid19_tracking/covid_racial_data_tracker/fingerprints.json python $airflow_home/dags/covid19_tracking/_custom/fingerprints.py commit\n",
+        env={"airflow_home": "{{ var.json.shared.airflow_home }}"},
+    )
+
     # Task to archive the CSV file in the destination bucket
     archive_csv_file_to_destination_bucket = gcs_to_gcs.GoogleCloudStorageToGoogleCloudStorageOperator(
         task_id="archive_csv_file_to_destination_bucket",
         source_bucket="{{ var.json.shared.composer_bucket }}",
-        source_object="data/covid19_tracking/covid_racial_data_tracker/crdt-data-{{ ds }}.csv",
+        source_object="data/covid19_tracking/covid_racial_data_tracker/crdt-data-{{ ds }}.csv.gz",
         destination_bucket="{{ var.json.covid19_tracking.destination_bucket }}",
-        destination_object="datasets/covid19_tracking/covid_racial_data_tracker/crdt-data-{{ ds }}.csv",
+        destination_object="datasets/covid19_tracking/covid_racial_data_tracker/crdt-data-{{ ds }}.csv.gz",
         move_object=True,
     )
 
-    download_raw_csv_file >> process_raw_csv_file
+    download_raw_csv_file >> skip_if_source_unchanged
+    skip_if_source_unchanged >> process_raw_csv_file
     process_raw_csv_file >> load_csv_file_to_bq_table
-    load_csv_file_to_bq_table >> archive_csv_file_to_destination_bucket
+    load_csv_file_to_bq_table >> commit_source_fingerprint
+    commit_source_fingerprint >> archive_csv_file_to_destination_bucket
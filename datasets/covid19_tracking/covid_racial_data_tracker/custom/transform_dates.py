@@ -13,39 +13,29 @@
 # limitations under the License.
 
 
-import csv
-import os
 import pathlib
-from datetime import datetime
+import sys
+import typing
 
+# Shared transforms live in the dataset-level `_custom` folder
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[2] / "_custom"))
 
-def main(source_path: pathlib.Path, target_path: pathlib.Path):
-    with open(source_path) as csv_source:
-        csv_reader = csv.reader(csv_source, delimiter=",")
-        headers = next(csv_reader)
+import column_rules  # noqa: E402
+import columnar_transform  # noqa: E402
 
-        with open(target_path, "w") as csv_target:
-            csv_writer = csv.writer(csv_target, delimiter=",")
-            csv_writer.writerow(headers)
 
-            for row in csv_reader:
-                csv_writer.writerow(parse_row(row))
-
-
-def parse_row(raw_row: list) -> list:
-    row = []
-    for idx, val in enumerate(raw_row):
-        if idx == 0:  # index 0 is the `Date` field with format `YYYYMMDD`
-            val = str(datetime.strptime(val, "%Y%m%d").date())
-
-        row.append(val)
-    return row
+def main(
+    source_path: typing.Optional[pathlib.Path],
+    target_path: typing.Optional[pathlib.Path],
+    transform_rules: dict,
+):
+    columnar_transform.transform_csv(source_path, target_path, transform_rules)
 
 
 if __name__ == "__main__":
-    assert os.environ["SOURCE_CSV"]
-    assert os.environ["TARGET_CSV"]
+    # Unset paths read from stdin and write to stdout
     main(
-        source_path=pathlib.Path(os.environ["SOURCE_CSV"]).expanduser(),
-        target_path=pathlib.Path(os.environ["TARGET_CSV"]).expanduser(),
+        source_path=columnar_transform.path_from_env("SOURCE_CSV"),
+        target_path=columnar_transform.path_from_env("TARGET_CSV"),
+        transform_rules=column_rules.from_env(),
     )
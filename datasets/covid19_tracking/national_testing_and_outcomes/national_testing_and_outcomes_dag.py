@@ -14,7 +14,7 @@
 
 
 from airflow import DAG
-from airflow.contrib.operators import gcs_to_bq, gcs_to_gcs
+from airflow.contrib.operators import gcs_delete_operator, gcs_to_bq, gcs_to_gcs
 from airflow.operators import bash_operator
 
 default_args = {
@@ -28,7 +28,7 @@ with DAG(
     dag_id="covid19_tracking.national_testing_and_outcomes",
     default_args=default_args,
     max_active_runs=1,
-    schedule_interval="@once",
+    schedule_interval="@daily",
     catchup=False,
     default_view="graph",
 ) as dag:
@@ -36,13 +36,26 @@ with DAG(
     # Task to copy `national-history.csv` from COVID-19 Tracking Project to GCS
     copy_csv_file_to_gcs = bash_operator.BashOperator(
         task_id="copy_csv_file_to_gcs",
-        bash_command="echo $airflow_data_folder\necho $csv_source_url\nmkdir -p $airflow_data_folder/covid19_tracking/national_testing_and_outcomes\ncurl -o $airflow_data_folder/covid19_tracking/national_testing_and_outcomes/national-history-{{ ds }}.csv -L $csv_source_url\n",
+        bash_command="echo $airflow_data_folder\necho $csv_source_url\nmkdir -p $airflow_data_folder/covid19_tracking/national_testing_and_outcomes\ncurl -o $airflow_data_folder/covid19_tracking/national_testing_and_outcomes/raw-national-history-{{ ds }}.csv -L $csv_source_url\n",
         env={
             "csv_source_url": "https://covidtracking.com/data/download/national-history.csv",
             "airflow_data_folder": "{{ var.json.shared.airflow_data_folder }}",
         },
     )
 
+    # Run the custom/csv_transform.py script to keep the rows dated after the watermark
+    process_raw_csv_file = bash_operator.BashOperator(
+        task_id="process_raw_csv_file",
+        bash_command="SOURCE_CSV=$airflow_data_folder/$dataset/$pipeline/raw-national-history-{{ ds }}.csv TARGET_CSV=$airflow_data_folder/$dataset/$pipeline/national-history-{{ ds }}.csv WATERMARK_FILE=$airflow_data_folder/$dataset/$pipeline/watermark.json python $airflow_home/dags/$dataset/$pipeline/custom/csv_transform.py\n",
+        env={
+            "airflow_home": "{{ var.json.shared.airflow_home }}",
+            "airflow_data_folder": "{{ var.json.shared.airflow_data_folder }}",
+            "dataset": "covid19_tracking",
+            "pipeline": "national_testing_and_outcomes",
+            "TRANSFORM_RULES": '{"columns": [], "incremental": {"date_column": "date"}, "stats": true}',
+        },
+    )
+
     # Task to load the data from Airflow data folder to BigQuery
     load_csv_file_to_bq_table = gcs_to_bq.GoogleCloudStorageToBigQueryOperator(
         task_id="load_csv_file_to_bq_table",
@@ -53,7 +66,8 @@ with DAG(
         source_format="CSV",
         destination_project_dataset_table="covid19_tracking.national_testing_and_outcomes",
         skip_leading_rows=1,
-        write_disposition="WRITE_TRUNCATE",
+        write_disposition="WRITE_APPEND",
+        time_partitioning={"type": "DAY", "field": "date"},
         schema_fields=[
             {
                 "name": "date",
@@ -160,6 +174,18 @@ with DAG(
         ],
     )
 
+    # Move the watermark to the last date loaded into BigQuery
+    update_watermark = bash_operator.BashOperator(
+        task_id="update_watermark",
+        bash_command="WATERMARK_FILE=$airflow_data_folder/$dataset/$pipeline/watermark.json STATS_JSON=$airflow_data_folder/$dataset/$pipeline/national-history-{{ ds }}.csv.stats.json DATE_COLUMN=date python $airflow_home/dags/$dataset/_custom/watermark.py\n",
+        env={
+            "airflow_home": "{{ var.json.shared.airflow_home }}",
+            "airflow_data_folder": "{{ var.json.shared.airflow_data_folder }}",
+            "dataset": "covid19_tracking",
+            "pipeline": "national_testing_and_outcomes",
+        },
+    )
+
     # Task to archive the CSV file in the destination bucket
     archive_csv_file_to_destination_bucket = gcs_to_gcs.GoogleCloudStorageToGoogleCloudStorageOperator(
         task_id="archive_csv_file_to_destination_bucket",
@@ -170,5 +196,18 @@ with DAG(
         move_object=True,
     )
 
-    copy_csv_file_to_gcs >> load_csv_file_to_bq_table
-    load_csv_file_to_bq_table >> archive_csv_file_to_destination_bucket
+    # Delete the raw CSV file and the statistics sidecar from the Cloud Composer bucket
+    delete_intermediate_files = gcs_delete_operator.GoogleCloudStorageDeleteOperator(
+        task_id="delete_intermediate_files",
+        bucket_name="{{ var.json.shared.composer_bucket }}",
+        objects=[
+            "data/covid19_tracking/national_testing_and_outcomes/raw-national-history-{{ ds }}.csv",
+            "data/covid19_tracking/national_testing_and_outcomes/national-history-{{ ds }}.csv.stats.json",
+        ],
+    )
+
+    copy_csv_file_to_gcs >> process_raw_csv_file
+    process_raw_csv_file >> load_csv_file_to_bq_table
+    load_csv_file_to_bq_table >> update_watermark
+    update_watermark >> archive_csv_file_to_destination_bucket
+    archive_csv_file_to_destination_bucket >> delete_intermediate_files
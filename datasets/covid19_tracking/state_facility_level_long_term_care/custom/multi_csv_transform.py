@@ -13,26 +13,72 @@
 # limitations under the License.
 
 
-import csv
+import logging
+import multiprocessing
 import os
 import pathlib
+import sys
+import time
 import typing
-from datetime import datetime
 
+# Shared transforms live in the dataset-level `_custom` folder
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[2] / "_custom"))
 
-def main(working_dir: pathlib.Path):
-    for raw_csv_filename in csv_files(working_dir):
-        with open(working_dir / raw_csv_filename) as csv_source:
-            csv_reader = csv.reader(csv_source, delimiter=",")
-            headers = parse_headers(next(csv_reader))
+import column_rules  # noqa: E402
+import columnar_transform  # noqa: E402
 
-            target_filename = raw_csv_filename.replace("raw-", "")
-            with open(working_dir / target_filename, "w") as csv_target:
-                csv_writer = csv.writer(csv_target, delimiter=",")
-                csv_writer.writerow(headers)
 
-                for row in csv_reader:
-                    csv_writer.writerow(parse_row(row))
+def main(
+    working_dir: pathlib.Path,
+    transform_rules: dict,
+    processes: typing.Optional[int] = None,
+):
+    """Transforms every raw CSV in `working_dir` on a pool of processes.
+
+    `processes` defaults to the number of cores. Each file keeps its own
+    deterministic target name, so the scheduling order doesn't matter.
+    """
+    # Largest files first, so a big state doesn't start last and run alone
+    jobs = [
+        (working_dir / name, working_dir / target_filename(name), transform_rules)
+        for name in sorted(
+            csv_files(working_dir),
+            key=lambda name: (-(working_dir / name).stat().st_size, name),
+        )
+    ]
+    processes = min(processes or os.cpu_count() or 1, len(jobs) or 1)
+
+    started_at = time.perf_counter()
+    if processes == 1:
+        report_timings(map(transform_file, jobs))
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            report_timings(pool.imap_unordered(transform_file, jobs))
+
+    logging.info(
+        f"Transformed {len(jobs)} files with {processes} processes "
+        f"in {time.perf_counter() - started_at:.2f}s"
+    )
+
+
+def transform_file(
+    job: typing.Tuple[pathlib.Path, pathlib.Path, dict],
+) -> typing.Tuple[pathlib.Path, float]:
+    source_path, target_path, transform_rules = job
+    started_at = time.perf_counter()
+    target_path = columnar_transform.transform_csv(
+        source_path, target_path, transform_rules, parse_headers=parse_headers
+    )
+    return target_path, time.perf_counter() - started_at
+
+
+def report_timings(timings: typing.Iterable[typing.Tuple[pathlib.Path, float]]):
+    for target_path, seconds in timings:
+        logging.info(f"Wrote {target_path.name} in {seconds:.2f}s")
+
+
+def target_filename(raw_csv_filename: str) -> str:
+    return raw_csv_filename.replace("raw-", "")
 
 
 def csv_files(dir_: pathlib.Path) -> typing.List[str]:
@@ -43,26 +89,21 @@ def csv_files(dir_: pathlib.Path) -> typing.List[str]:
     ]
 
 
-def parse_headers(raw_headers: list) -> typing.List[str]:
+def parse_headers(raw_headers: list) -> typing.Tuple[list, set]:
     headers = []
     for header in raw_headers:
         if header == "date_outreak_closed":  # Fix typo from data source
             header = "date_outbreak_closed"
         headers.append(header)
-    return headers
-
-
-def parse_row(raw_row: list) -> list:
-    row = []
-    for idx, val in enumerate(raw_row):
-        if idx == 0:  # index 0 is the `Date` field with format `YYYYMMDD`
-            val = str(datetime.strptime(val, "%Y%m%d").date())
-        row.append(val)
-    return row
+    return headers, set()
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
     assert os.environ["WORKING_DIR"]
     main(
         working_dir=pathlib.Path(os.environ["WORKING_DIR"]).expanduser(),
+        transform_rules=column_rules.from_env(),
+        processes=int(os.environ["PROCESSES"]) if os.environ.get("PROCESSES") else None,
     )
@@ -15,7 +15,7 @@
 
 from airflow import DAG
 from airflow.contrib.operators import gcs_to_bq, gcs_to_gcs
-from airflow.operators import bash_operator
+from airflow.operators import bash_operator, python_operator
 
 default_args = {
     "owner": "Google",
@@ -36,12 +36,23 @@ with DAG(
     # Task to copy data from HTTP source to GCS or Airflow home dir
     download_raw_csv_files = bash_operator.BashOperator(
         task_id="download_raw_csv_files",
+        xcom_push=True,
         env={
             "airflow_home": "{{ var.json.shared.airflow_home }}",
             "dataset": "covid19_tracking",
             "pipeline": "state_facility_level_long_term_care",
+            "DOWNLOAD_MANIFEST": '{"base_url": "https://github.com/COVID19Tracking/long-term-care-data/raw/master/", "max_workers": 8, "files": [{"url": "facilities_ar.csv", "target": "raw-facilities-ar.csv"}, {"url": "facilities_ga.csv", "target": "raw-facilities-ga.csv"}, {"url": "facilities_in.csv", "target": "raw-facilities-in.csv"}, {"url": "facilities_il.csv", "target": "raw-facilities-il.csv"}, {"url": "facilities_ks.csv", "target": "raw-facilities-ks.csv"}, {"url": "facilities_sc.csv", "target": "raw-facilities-sc.csv"}, {"url": "facilities_hi.csv", "target": "raw-facilities-hi.csv"}, {"url": "facilities_ny.csv", "target": "raw-facilities-ny.csv"}, {"url": "facilities_ok.csv", "target": "raw-facilities-ok.csv"}, {"url": "facilities_nm.csv", "target": "raw-facilities-nm.csv"}, {"url": "facilities_wy.csv", "target": "raw-facilities-wy.csv"}, {"url": "facilities_oh.csv", "target": "raw-facilities-oh.csv"}, {"url": "facilities_md.csv", "target": "raw-facilities-md.csv"}, {"url": "facilities_ms.csv", "target": "raw-facilities-ms.csv"}, {"url": "facilities_co.csv", "target": "raw-facilities-co.csv"}, {"url": "facilities_la.csv", "target": "raw-facilities-la.csv"}, {"url": "facilities_me.csv", "target": "raw-facilities-me.csv"}, {"url": "facilities_nj.csv", "target": "raw-facilities-nj.csv"}, {"url": "facilities_va.csv", "target": "raw-facilities-va.csv"}, {"url": "facilities_ca.csv", "target": "raw-facilities-ca.csv"}, {"url": "facilities_nd.csv", "target": "raw-facilities-nd.csv"}, {"url": "facilities_ct.csv", "target": "raw-facilities-ct.csv"}, {"url": "facilities_vt.csv", "target": "raw-facilities-vt.csv"}, {"url": "facilities_mi.csv", "target": "raw-facilities-mi.csv"}, {"url": "facilities_or.csv", "target": "raw-facilities-or.csv"}, {"url": "facilities_tx.csv", "target": "raw-facilities-tx.csv"}, {"url": "facilities_tn.csv", "target": "raw-facilities-tn.csv"}, {"url": "facilities_mn.csv", "target": "raw-facilities-mn.csv"}, {"url": "facilities_wv.csv", "target": "raw-facilities-wv.csv"}, {"url": "facilities_nc.csv", "target": "raw-facilities-nc.csv"}, {"url": "facilities_ia.csv", "target": "raw-facilities-ia.csv"}, {"url": "facilities_fl.csv", "target": "raw-facilities-fl.csv"}, {"url": "facilities_ri.csv", "target": "raw-facilities-ri.csv"}, {"url": "facilities_pa.csv", "target": "raw-facilities-pa.csv"}, {"url": "facilities_de.csv", "target": "raw-facilities-de.csv"}, {"url": "facilities_ky.csv", "target": "raw-facilities-ky.csv"}, {"url": "facilities_dc.csv", "target": "raw-facilities-dc.csv"}, {"url": "facilities_id.csv", "target": "raw-facilities-id.csv"}]}',
         },
-        bash_command="mkdir -p $airflow_home/data/$dataset/$pipeline\ncurl -o $airflow_home/data/$dataset/$pipeline/raw-facilities-ar.csv -L https://github.com/COVID19Tracking/long-term-care-data/raw/master/facilities_ar.csv\ncurl -o $airflow_home/data/$dataset/$pipeline/raw-facilities-ga.csv https://github.com/COVID19Tracking/long-term-care-data/raw/master/facilities_ga.csv\ncurl -o $airflow_home/data/$dataset/$pipeline/raw-facilities-in.csv https://github.com/COVID19Tracking/long-term-care-data/raw/master/facilities_in.csv\ncurl -o $airflow_home/data/$dataset/$pipeline/raw-facilities-il.csv https://github.com/COVID19Tracking/long-term-care-data/raw/master/facilities_il.csv\ncurl -o $airflow_home/data/$dataset/$pipeline/raw-facilities-ks.csv https://github.com/COVID19Tracking/long-term-care-data/raw/master/facilities_ks.csv\ncurl -o $airflow_home/data/$dataset/$pipeline/raw-facilities-sc.csv https://github.com/COVID19Tracking/long-term-care-data/raw/master/facilities_sc.csv\ncurl -o $airflow_home/data/$dataset/$pipeline/raw-facilities-hi.csv https://github.com/COVID19Tracking/long-term-care-data/raw/master/facilities_hi.csv\ncurl -o $airflow_home/data/$dataset/$pipeline/raw-facilities-ny.csv https://github.com/COVID19Tracking/long-term-care-data/raw/master/facilities_ny.csv\ncurl -o $airflow_home/data/$dataset/$pipeline/raw-facilities-ok.csv https://github.com/COVID19Tracking/long-term-care-data/raw/master/facilities_ok.csv\ncurl -o $airflow_home/data/$dataset/$pipeline/raw-facilities-nm.csv https://github.com/COVID19Tracking/long-term-care-data/raw/master/facilities_nm.csv\ncurl -o $airflow_home/data/$dataset/$pipeline/raw-facilities-wy.csv https://github.com/COVID19Tracking/long-term-care-data/raw/master/facilities_wy.csv\ncurl -o $airflow_home/data/$dataset/$pipeline/raw-facilities-oh.csv https://github.com/COVID19Tracking/long-term-care-data/raw/master/facilities_oh.csv\ncurl -o $airflow_home/data/$dataset/$pipeline/raw-facilities-md.csv https://github.com/COVID19Tracking/long-term-care-data/raw/master/facilities_md.csv\ncurl -o $airflow_home/data/$dataset/$pipeline/raw-facilities-ms.csv https://github.com/COVID19Tracking/long-term-care-data/raw/master/facilities_ms.csv\ncurl -o $airflow_home/data/$dataset/$pipeline/raw-facilities-co.csv https://github.com/COVID19Tracking/long-term-care-data/raw/master/facilities_co.csv\ncurl -o $airflow_home/data/$dataset/$pipeline/raw-facilities-la.csv https://github.com/COVID19Tracking/long-term-care-data/raw/master/facilities_la.csv\ncurl -o $airflow_home/data/$dataset/$pipeline/raw-facilities-me.csv https://github.com/COVID19Tracking/long-term-care-data/raw/master/facilities_me.csv\ncurl -o $airflow_home/data/$dataset/$pipeline/raw-facilities-ar.csv https://github.com/COVID19Tracking/long-term-care-data/raw/master/facilities_ar.csv\ncurl -o $airflow_home/data/$dataset/$pipeline/raw-facilities-nj.csv https://github.com/COVID19Tracking/long-term-care-data/raw/master/facilities_nj.csv\ncurl -o $airflow_home/data/$dataset/$pipeline/raw-facilities-va.csv https://github.com/COVID19Tracking/long-term-care-data/raw/master/facilities_va.csv\ncurl -o $airflow_home/data/$dataset/$pipeline/raw-facilities-ca.csv https://github.com/COVID19Tracking/long-term-care-data/raw/master/facilities_ca.csv\ncurl -o $airflow_home/data/$dataset/$pipeline/raw-facilities-nd.csv https://github.com/COVID19Tracking/long-term-care-data/raw/master/facilities_nd.csv\ncurl -o $airflow_home/data/$dataset/$pipeline/raw-facilities-ct.csv https://github.com/COVID19Tracking/long-term-care-data/raw/master/facilities_ct.csv\ncurl -o $airflow_home/data/$dataset/$pipeline/raw-facilities-vt.csv https://github.com/COVID19Tracking/long-term-care-data/raw/master/facilities_vt.csv\ncurl -o $airflow_home/data/$dataset/$pipeline/raw-facilities-mi.csv https://github.com/COVID19Tracking/long-term-care-data/raw/master/facilities_mi.csv\ncurl -o $airflow_home/data/$dataset/$pipeline/raw-facilities-or.csv https://github.com/COVID19Tracking/long-term-care-data/raw/master/facilities_or.csv\ncurl -o $airflow_home/data/$dataset/$pipeline/raw-facilities-tx.csv https://github.com/COVID19Tracking/long-term-care-data/raw/master/facilities_tx.csv\ncurl -o $airflow_home/data/$dataset/$pipeline/raw-facilities-tn.csv https://github.com/COVID19Tracking/long-term-care-data/raw/master/facilities_tn.csv\ncurl -o $airflow_home/data/$dataset/$pipeline/raw-facilities-mn.csv https://github.com/COVID19Tracking/long-term-care-data/raw/master/facilities_mn.csv\ncurl -o $airflow_home/data/$dataset/$pipeline/raw-facilities-wv.csv https://github.com/COVID19Tracking/long-term-care-data/raw/master/facilities_wv.csv\ncurl -o $airflow_home/data/$dataset/$pipeline/raw-facilities-nc.csv https://github.com/COVID19Tracking/long-term-care-data/raw/master/facilities_nc.csv\ncurl -o $airflow_home/data/$dataset/$pipeline/raw-facilities-ia.csv https://github.com/COVID19Tracking/long-term-care-data/raw/master/facilities_ia.csv\ncurl -o $airflow_home/data/$dataset/$pipeline/raw-facilities-fl.csv https://github.com/COVID19Tracking/long-term-care-data/raw/master/facilities_fl.csv\ncurl -o $airflow_home/data/$dataset/$pipeline/raw-facilities-ri.csv https://github.com/COVID19Tracking/long-term-care-data/raw/master/facilities_ri.csv\ncurl -o $airflow_home/data/$dataset/$pipeline/raw-facilities-pa.csv https://github.com/COVID19Tracking/long-term-care-data/raw/master/facilities_pa.csv\ncurl -o $airflow_home/data/$dataset/$pipeline/raw-facilities-de.csv https://github.com/COVID19Tracking/long-term-care-data/raw/master/facilities_de.csv\ncurl -o $airflow_home/data/$dataset/$pipeline/raw-facilities-ky.csv https://github.com/COVID19Tracking/long-term-care-data/raw/master/facilities_ky.csv\ncurl -o $airflow_home/data/$dataset/$pipeline/raw-facilities-dc.csv https://github.com/COVID19Tracking/long-term-care-data/raw/master/facilities_dc.csv\ncurl -o $airflow_home/data/$dataset/$pipeline/raw-facilities-id.csv https://github.com/COVID19Tracking/long-term-care-data/raw/master/facilities_id.csv\n",
+        bash_command="TARGET_DIR=$airflow_home/data/$dataset/$pipeline METRICS_FILE=$airflow_home/data/$dataset/$pipeline/download_metrics.json FINGERPRINT_FILE=$airflow_home/data/$dataset/$pipeline.fingerprints.json python $airflow_home/dags/$dataset/_custom/downloader.py\n",
+    )
+
+    # Skip the transform and load when no source file changed since the last load
+    skip_if_sources_unchanged = python_operator.ShortCircuitOperator(
+        task_id="skip_if_sources_unchanged",
+        python_callable=bool,
+        op_args=[
+            "{{ ti.xcom_pull(task_ids='download_raw_csv_files') == 'changed' or '' }}"
+        ],
     )
 
     # Run the custom/csv_transform.py script to process the raw CSV contents into a BigQuery friendly format
@@ -52,6 +63,7 @@ with DAG(
             "airflow_home": "{{ var.json.shared.airflow_home }}",
             "dataset": "covid19_tracking",
             "pipeline": "state_facility_level_long_term_care",
+            "TRANSFORM_RULES": '{"columns": [{"index": 0, "rules": ["yyyymmdd_to_iso"]}]}',
         },
     )
 
@@ -218,6 +230,17 @@ with DAG(
         ],
     )
 
+    # Record the fingerprints of the source files loaded into BigQuery
+    commit_source_fingerprints = bash_operator.BashOperator(
+        task_id="commit_source_fingerprints",
+        bash_command="FINGERPRINT_FILE=$airflow_home/data/$dataset/$pipeline.fingerprints.json python $airflow_home/dags/$dataset/_custom/fingerprints.py commit\n",
+        env={
+            "airflow_home": "{{ var.json.shared.airflow_home }}",
+            "dataset": "covid19_tracking",
+            "pipeline": "state_facility_level_long_term_care",
+        },
+    )
+
     # Task to archive the CSV file in the destination bucket
     archive_csv_files_to_destination_bucket = gcs_to_gcs.GoogleCloudStorageToGoogleCloudStorageOperator(
         task_id="archive_csv_files_to_destination_bucket",
@@ -228,6 +251,8 @@ with DAG(
         move_object=True,
     )
 
-    download_raw_csv_files >> process_raw_csv_files
+    download_raw_csv_files >> skip_if_sources_unchanged
+    skip_if_sources_unchanged >> process_raw_csv_files
     process_raw_csv_files >> load_csv_files_to_bq_table
-    load_csv_files_to_bq_table >> archive_csv_files_to_destination_bucket
+    load_csv_files_to_bq_table >> commit_source_fingerprints
+    commit_source_fingerprints >> archive_csv_files_to_destination_bucket
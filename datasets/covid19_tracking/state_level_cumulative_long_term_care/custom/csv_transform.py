@@ -13,11 +13,15 @@
 # limitations under the License.
 
 
-import csv
-import os
 import pathlib
+import sys
 import typing
-from datetime import datetime
+
+# Shared transforms live in the dataset-level `_custom` folder
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[2] / "_custom"))
+
+import column_rules  # noqa: E402
+import columnar_transform  # noqa: E402
 
 FACILITY_CATEGORY = (
     "nursing_homes",
@@ -43,23 +47,20 @@ FACILITY_COLS = (
 )
 
 
-def main(source_path: pathlib.Path, target_path: pathlib.Path):
-    with open(source_path) as csv_source:
-        csv_reader = csv.reader(csv_source, delimiter=",")
-
-        # Skip the unnecessary first line in the raw CSV
-        next(csv_reader)
-
-        # The 2nd line contains the raw CSV headers
-        raw_headers = next(csv_reader)
-        headers, skip_col_indices = parse_headers(raw_headers)
-
-        with open(target_path, "w") as csv_target:
-            csv_writer = csv.writer(csv_target, delimiter=",")
-            csv_writer.writerow(headers)
-
-            for row in csv_reader:
-                csv_writer.writerow(parse_row(row, skip_col_indices))
+def main(
+    source_path: typing.Optional[pathlib.Path],
+    target_path: typing.Optional[pathlib.Path],
+    transform_rules: dict,
+):
+    # Skip the unnecessary first line in the raw CSV. The 2nd line contains the
+    # raw CSV headers.
+    columnar_transform.transform_csv(
+        source_path,
+        target_path,
+        transform_rules,
+        parse_headers=parse_headers,
+        skip_lines=1,
+    )
 
 
 def parse_headers(raw_headers: list) -> typing.Tuple[list, set]:
@@ -86,29 +87,10 @@ def parse_headers(raw_headers: list) -> typing.Tuple[list, set]:
     return headers, skip_col_indices
 
 
-def parse_row(raw_row: list, skip_col_indices: set) -> list:
-    row = []
-    for idx, val in enumerate(raw_row):
-        if idx in skip_col_indices:
-            continue
-
-        if idx == 0:  # index 0 uses a BQ-improper date format `YYYYMMDD`
-            val = str(datetime.strptime(val, "%Y%m%d").date())
-
-        if "," in val:  # convert integers represented as strings, e.g. "1,234"
-            val = int(val.replace(",", ""))
-
-        if val == "7/1":  # a row for Idaho has a string value "7/1"
-            val = 7
-
-        row.append(val)
-    return row
-
-
 if __name__ == "__main__":
-    assert os.environ["SOURCE_CSV"]
-    assert os.environ["TARGET_CSV"]
+    # Unset paths read from stdin and write to stdout
     main(
-        source_path=pathlib.Path(os.environ["SOURCE_CSV"]).expanduser(),
-        target_path=pathlib.Path(os.environ["TARGET_CSV"]).expanduser(),
+        source_path=columnar_transform.path_from_env("SOURCE_CSV"),
+        target_path=columnar_transform.path_from_env("TARGET_CSV"),
+        transform_rules=column_rules.from_env(),
     )
@@ -15,7 +15,7 @@
 
 from airflow import DAG
 from airflow.contrib.operators import gcs_to_bq, gcs_to_gcs
-from airflow.operators import bash_operator
+from airflow.operators import bash_operator, python_operator
 
 default_args = {
     "owner": "Google",
@@ -36,13 +36,23 @@ with DAG(
     # Task to copy data from HTTP source to GCS or Airflow home dir
     download_raw_csv_file = bash_operator.BashOperator(
         task_id="download_raw_csv_file",
-        bash_command="mkdir -p $airflow_home/data/covid19_tracking/state_level_current_outbreak_long_term_care/{{ ds }}\ncurl -o $airflow_home/data/covid19_tracking/state_level_current_outbreak_long_term_care/{{ ds }}/raw-data.csv -L $csv_source_url\n",
+        xcom_push=True,
+        bash_command="mkdir -p $airflow_home/data/covid19_tracking/state_level_current_outbreak_long_term_care/{{ ds }}\nSOURCE_URL=$csv_source_url TARGET_FILE=$airflow_home/data/covid19_tracking/state_level_current_outbreak_long_term_care/{{ ds }}/raw-data.csv FINGERPRINT_FILE=$airflow_home/data/covid19_tracking/state_level_current_outbreak_long_term_care/fingerprints.json python $airflow_home/dags/covid19_tracking/_custom/fingerprints.py fetch\n",
         env={
             "csv_source_url": "https://docs.google.com/spreadsheets/d/e/2PACX-1vRa9HnmEl83YXHfbgSPpt0fJe4SyuYLc0GuBAglF4yMYaoKSPRCyXASaWXMrTu1WEYp1oeJZIYHpj7t/pub?gid=467018747&single=true&output=csv",
             "airflow_home": "{{ var.json.shared.airflow_home }}",
         },
     )
 
+    # Skip the transform and load when the source didn't change since the last load
+    skip_if_source_unchanged = python_operator.ShortCircuitOperator(
+        task_id="skip_if_source_unchanged",
+        python_callable=bool,
+        op_args=[
+            "{{ ti.xcom_pull(task_ids='download_raw_csv_file') == 'changed' or '' }}"
+        ],
+    )
+
     # Run the custom/csv_transform.py script to process the raw CSV contents into a BigQuery friendly format
     process_raw_csv_file = bash_operator.BashOperator(
         task_id="process_raw_csv_file",
@@ -51,6 +61,7 @@ with DAG(
             "airflow_home": "{{ var.json.shared.airflow_home }}",
             "dataset": "covid19_tracking",
             "pipeline": "state_level_current_outbreak_long_term_care",
+            "TRANSFORM_RULES": '{"columns": [{"index": 0, "rules": ["yyyymmdd_to_iso"]}, {"rules": [{"null_prefixes": ["<", "~"]}, "thousands_separator", {"replace": {"7/1": 7}}]}]}',
         },
     )
 
@@ -343,6 +354,13 @@ with DAG(
         ],
     )
 
+    # Record the fingerprint of the source loaded into BigQuery
+    commit_source_fingerprint = bash_operator.BashOperator(
+        task_id="commit_source_fingerprint",
+        bash_command="FINGERPRINT_FILE=$airflow_home/data/covid19_tracking/state_level_current_outbreak_long_term_care/fingerprints.json python $airflow_home/dags/covid19_tracking/_custom/fingerprints.py commit\n",
+        env={"airflow_home": "{{ var.json.shared.airflow_home }}"},
+    )
+
     # Task to archive the CSV file in the destination bucket
     archive_csv_file_to_destination_bucket = gcs_to_gcs.GoogleCloudStorageToGoogleCloudStorageOperator(
         task_id="archive_csv_file_to_destination_bucket",
@@ -353,6 +371,8 @@ with DAG(
         move_object=True,
     )
 
-    download_raw_csv_file >> process_raw_csv_file
+    download_raw_csv_file >> skip_if_source_unchanged
+    skip_if_source_unchanged >> process_raw_csv_file
     process_raw_csv_file >> load_csv_file_to_bq_table
-    load_csv_file_to_bq_table >> archive_csv_file_to_destination_bucket
+    load_csv_file_to_bq_table >> commit_source_fingerprint
+    commit_source_fingerprint >> archive_csv_file_to_destination_bucket
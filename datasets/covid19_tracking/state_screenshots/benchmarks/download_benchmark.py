@@ -0,0 +1,134 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Times the scrape and the screenshot downloads at several concurrency levels.
+
+Both run against `stand_in_server.py` rather than the screenshots site, with
+the latency, error rate and bandwidth given on the command line. The scrape is
+timed with each number of workers, writing the CSV only, then the screenshots
+it listed are downloaded to a new folder with each number of requests in
+flight:
+
+    python benchmarks/download_benchmark.py --latency 0.02 --concurrency 1 8 32
+
+Every scrape is first checked to list the same rows.
+"""
+
+import argparse
+import csv
+import logging
+import pathlib
+import sys
+import tempfile
+import time
+import typing
+
+import stand_in_server
+
+CUSTOM_DIR = pathlib.Path(__file__).resolve().parents[1] / "custom"
+sys.path.append(str(CUSTOM_DIR))
+
+import download_screenshots  # noqa: E402
+import web_scrape_and_generate_csv  # noqa: E402
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[2] / "_custom"))
+
+import download_metrics  # noqa: E402
+
+GCS_PATH_PREFIX = "gs://bucket/datasets/covid19_tracking/state_screenshots"
+
+
+def scrape(base_url: str, csv_path: pathlib.Path, workers: int) -> float:
+    started_at = time.perf_counter()
+    web_scrape_and_generate_csv.main(
+        base_url, csv_path, GCS_PATH_PREFIX, workers=workers
+    )
+    return time.perf_counter() - started_at
+
+
+def download(
+    rows: typing.List[dict], download_dir: pathlib.Path, max_in_flight: int
+) -> dict:
+    metrics = download_metrics.Metrics()
+    outcomes = download_screenshots.download_rows(
+        rows, "source_url", download_dir, max_in_flight, metrics=metrics
+    )
+    if outcomes["failed"]:
+        raise AssertionError(f"{outcomes['failed']} downloads failed")
+    return metrics.summary()
+
+
+def main(
+    concurrency: typing.List[int],
+    latency: float,
+    error_rate: float,
+    bandwidth: typing.Optional[float],
+    states: typing.Optional[int],
+):
+    with stand_in_server.serve(
+        latency, error_rate, bandwidth, states=states
+    ) as server, tempfile.TemporaryDirectory() as temp_dir:
+        run_dir = pathlib.Path(temp_dir)
+        print(
+            f"Stand-in site with {len(server.state_slugs)} states, "
+            f"{latency * 1000:.0f} ms latency, {error_rate:.0%} errors"
+            + (f", {bandwidth / 1e6:.1f} MB/s" if bandwidth else "")
+        )
+
+        print("Scrape, CSV only")
+        expected_rows = None
+        for workers in concurrency:
+            csv_path = run_dir / f"scrape-{workers}.csv"
+            seconds = scrape(server.base_url, csv_path, workers)
+            rows = csv_path.read_text()
+            if expected_rows is not None and rows != expected_rows:
+                raise AssertionError(f"The scrape with {workers} workers differs")
+            expected_rows = rows
+            pages_per_second = len(server.state_slugs) / seconds
+            print(
+                f"  {workers:>4} workers: {seconds:7.2f}s "
+                f"({pages_per_second:.1f} pages/s)"
+            )
+
+        with open(csv_path) as csv_file:
+            rows = list(csv.DictReader(csv_file))
+        print(f"Downloads, {len(rows)} screenshots")
+        for max_in_flight in concurrency:
+            summary = download(
+                rows, run_dir / f"download-{max_in_flight}", max_in_flight
+            )
+            print(
+                f"  {max_in_flight:>4} in flight: {summary['seconds']:7.2f}s "
+                f"({summary['files_per_second']:.1f} files/s, "
+                f"{summary['bytes_per_second'] / 1e6:.2f} MB/s, latency p50 "
+                f"{summary['latency_seconds']['p50'] * 1000:.0f} ms, p99 "
+                f"{summary['latency_seconds']['p99'] * 1000:.0f} ms, "
+                f"{summary['retries']} retries)"
+            )
+
+
+if __name__ == "__main__":
+    # The scripts log every run, which would drown the results
+    logging.basicConfig(level=logging.ERROR)
+
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument(
+        "--concurrency", type=int, nargs="+", default=[1, 4, 8, 16, 32]
+    )
+    arg_parser.add_argument("--latency", type=float, default=0.02)
+    arg_parser.add_argument("--error-rate", type=float, default=0.0)
+    arg_parser.add_argument("--bandwidth", type=float)
+    arg_parser.add_argument("--states", type=int, default=10)
+    args = arg_parser.parse_args()
+    main(args.concurrency, args.latency, args.error_rate, args.bandwidth, args.states)
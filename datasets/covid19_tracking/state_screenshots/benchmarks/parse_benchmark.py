@@ -0,0 +1,96 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Times the `page_parser` backends against a full `html.parser` tree.
+
+The full tree is how the scraper parsed the pages before `page_parser`. Every
+backend is first checked to return the same links and rows from the saved
+pages in `fixtures/`, which follow the markup of the screenshots site:
+
+    python benchmarks/parse_benchmark.py --repeat 20
+"""
+
+import argparse
+import pathlib
+import sys
+import timeit
+import typing
+
+import bs4
+
+CUSTOM_DIR = pathlib.Path(__file__).resolve().parents[1] / "custom"
+FIXTURES_DIR = pathlib.Path(__file__).resolve().parent / "fixtures"
+sys.path.append(str(CUSTOM_DIR))
+
+import page_parser  # noqa: E402
+import web_scrape_and_generate_csv  # noqa: E402
+
+MAX_ROWS = web_scrape_and_generate_csv.SCRAPED_ROWS + 1
+
+
+def full_tree_links(html: str) -> typing.List[page_parser.Link]:
+    page = bs4.BeautifulSoup(html, "html.parser")
+    return [page_parser.bs4_link(a) for a in page.find_all("a")]
+
+
+def full_tree_rows(html: str) -> typing.List[page_parser.Row]:
+    page = bs4.BeautifulSoup(html, "html.parser")
+    return [
+        [page_parser.bs4_cell(td) for td in tr.find_all("td")]
+        for tr in page.find_all("tr")[:MAX_ROWS]
+    ]
+
+
+def parse_functions() -> typing.Dict[str, typing.Tuple[typing.Callable, ...]]:
+    functions = {"full tree": (full_tree_links, full_tree_rows)}
+    for parser in page_parser.PARSERS:
+        if parser == "lxml" and page_parser.default_parser() != "lxml":
+            print("Skipping the lxml backend, lxml isn't installed")
+            continue
+        functions[parser] = (
+            lambda html, parser=parser: page_parser.page_links(html, parser),
+            lambda html, parser=parser: page_parser.table_rows(html, MAX_ROWS, parser),
+        )
+    return functions
+
+
+def main(repeat: int):
+    index_html = (FIXTURES_DIR / "index.html").read_text()
+    state_html = (FIXTURES_DIR / "alabama.html").read_text()
+    functions = parse_functions()
+
+    expected_links, expected_rows = (
+        full_tree_links(index_html),
+        full_tree_rows(state_html),
+    )
+    for name, (parse_links, parse_rows) in functions.items():
+        if parse_links(index_html) != expected_links:
+            raise AssertionError(f"The {name} backend found different links")
+        if parse_rows(state_html) != expected_rows:
+            raise AssertionError(f"The {name} backend found different rows")
+
+    print(f"State page of {len(state_html) / 1024:.0f} KiB, first {MAX_ROWS} rows")
+    baseline = None
+    for name, (_, parse_rows) in functions.items():
+        seconds = min(
+            timeit.repeat(lambda: parse_rows(state_html), number=1, repeat=repeat)
+        )
+        baseline = baseline or seconds
+        print(f"  {name:>10}: {seconds * 1000:8.2f} ms ({baseline / seconds:.1f}x)")
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--repeat", type=int, default=10)
+    main(arg_parser.parse_args().repeat)
@@ -0,0 +1,233 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A local stand-in for the screenshots site, to run the scripts against.
+
+The index and state pages are the recorded ones in `fixtures/`, every state
+serving the Alabama page with its screenshot links pointed back at the server.
+The screenshots are synthetic PNGs of `png_size` bytes, which differ by path.
+
+Every response can be slowed down by `latency` seconds before its headers and
+capped at `bandwidth` bytes a second, and a share `error_rate` of the requests
+is answered with `503 Service Unavailable`.
+
+`serve` runs the server on a thread for as long as its context. The tests use
+it as the `screenshots_site` fixture of
+`tests/datasets/covid19_tracking/conftest.py`:
+
+    def test_scrape(screenshots_site, tmp_path):
+        web_scrape_and_generate_csv.main(
+            screenshots_site.base_url, tmp_path / "data.csv", "gs://bucket/prefix"
+        )
+
+Run on its own, it serves until interrupted:
+
+    python benchmarks/stand_in_server.py --port 8765 --latency 0.02
+"""
+
+import argparse
+import contextlib
+import hashlib
+import http.server
+import pathlib
+import random
+import re
+import struct
+import sys
+import threading
+import time
+import typing
+import zlib
+
+CUSTOM_DIR = pathlib.Path(__file__).resolve().parents[1] / "custom"
+FIXTURES_DIR = pathlib.Path(__file__).resolve().parent / "fixtures"
+sys.path.append(str(CUSTOM_DIR))
+
+import page_parser  # noqa: E402
+
+PNG_SIZE = 8000
+CHUNK_SIZE = 16 * 1024
+
+RECORDED_SCREENSHOTS = re.compile(r"https://covidtracking\.com/screenshots/AL/AL-")
+
+
+class StandInServer(http.server.ThreadingHTTPServer):
+    """Serves the pages and screenshots, counting the requests and errors"""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: typing.Tuple[str, int],
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        bandwidth: typing.Optional[float] = None,
+        png_size: int = PNG_SIZE,
+        states: typing.Optional[int] = None,
+    ) -> None:
+        if not 0 <= error_rate < 1:
+            raise ValueError("`error_rate` must be at least 0 and below 1")
+        if bandwidth is not None and bandwidth <= 0:
+            raise ValueError("`bandwidth` must be a positive number")
+
+        super().__init__(address, StandInHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.bandwidth = bandwidth
+        self.png_size = png_size
+        self.index_html, self.state_slugs = index_page(states)
+        self.state_html = (FIXTURES_DIR / "alabama.html").read_text()
+
+        self.requests = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def state_page(self, slug: str) -> str:
+        state = slug.upper()
+        return RECORDED_SCREENSHOTS.sub(
+            f"{self.base_url}/screenshots/{state}/{state}-", self.state_html
+        )
+
+
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    # Keeps the connections alive, as the origin does
+    protocol_version = "HTTP/1.1"
+    server: StandInServer
+
+    def do_GET(self) -> None:
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            failed = random.random() < server.error_rate
+            if failed:
+                server.errors += 1
+        time.sleep(server.latency)
+
+        path = self.path.split("?")[0]
+        if failed:
+            self.respond(503, b"Service Unavailable", "text/plain")
+        elif path == "/":
+            self.respond(200, server.index_html.encode(), "text/html")
+        elif path.lstrip("/") in server.state_slugs:
+            self.respond(200, server.state_page(path.lstrip("/")).encode(), "text/html")
+        elif path.startswith("/screenshots/") and path.endswith(".png"):
+            self.respond(200, synthetic_png(path, server.png_size), "image/png")
+        else:
+            self.respond(404, b"Not Found", "text/plain")
+
+    def respond(self, status: int, body: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        for start in range(0, len(body), CHUNK_SIZE):
+            chunk = body[start : start + CHUNK_SIZE]
+            self.wfile.write(chunk)
+            if self.server.bandwidth:
+                time.sleep(len(chunk) / self.server.bandwidth)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+@contextlib.contextmanager
+def serve(
+    latency: float = 0.0,
+    error_rate: float = 0.0,
+    bandwidth: typing.Optional[float] = None,
+    png_size: int = PNG_SIZE,
+    states: typing.Optional[int] = None,
+    port: int = 0,
+) -> typing.Iterator[StandInServer]:
+    """Runs the server on a free port, or `port`, until the context exits"""
+    server = StandInServer(
+        ("127.0.0.1", port), latency, error_rate, bandwidth, png_size, states
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+def index_page(
+    states: typing.Optional[int] = None,
+) -> typing.Tuple[str, typing.Set[str]]:
+    """Returns the index, cut to its first `states` states, and their slugs"""
+    html = (FIXTURES_DIR / "index.html").read_text()
+    # The first link is the site's, not a state's
+    site_link, *state_links = page_parser.page_links(html, "bs4")
+    if states is not None:
+        state_links = state_links[:states]
+        html = "".join(
+            f'<a href="{link.href}">{link.text}</a>'
+            for link in [site_link, *state_links]
+        )
+    return html, {link.href.lstrip("/") for link in state_links}
+
+
+def synthetic_png(path: str, size: int) -> bytes:
+    """Returns a 1x1 PNG padded to `size` bytes with content seeded by the path"""
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return (
+            struct.pack(">I", len(data))
+            + kind
+            + data
+            + struct.pack(">I", zlib.crc32(kind + data))
+        )
+
+    header = chunk(b"IHDR", struct.pack(">IIBBBBB", 1, 1, 8, 0, 0, 0, 0))
+    pixels = chunk(b"IDAT", zlib.compress(b"\x00\x00"))
+    end = chunk(b"IEND", b"")
+    png_length = 8 + len(header) + len(pixels) + len(end)
+
+    # An ancillary chunk, which viewers skip, makes up the size
+    padding_size = max(0, size - png_length - 12)
+    seed = hashlib.sha256(path.encode()).digest()
+    padding = (seed * (padding_size // len(seed) + 1))[:padding_size]
+    return b"\x89PNG\r\n\x1a\n" + header + chunk(b"paDd", padding) + pixels + end
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--port", type=int, default=8765)
+    arg_parser.add_argument("--latency", type=float, default=0.0)
+    arg_parser.add_argument("--error-rate", type=float, default=0.0)
+    arg_parser.add_argument("--bandwidth", type=float)
+    arg_parser.add_argument("--png-size", type=int, default=PNG_SIZE)
+    arg_parser.add_argument("--states", type=int)
+    args = arg_parser.parse_args()
+
+    with serve(
+        args.latency,
+        args.error_rate,
+        args.bandwidth,
+        args.png_size,
+        args.states,
+        args.port,
+    ) as server:
+        print(f"Serving the screenshots site at {server.base_url}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
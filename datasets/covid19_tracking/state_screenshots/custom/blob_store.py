@@ -0,0 +1,267 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Screenshots stored by the SHA-256 of their content.
+
+A downloaded screenshot is moved to `blobs/<sha256>.png` in the run folder,
+unless a screenshot with the same content was archived by an earlier run or
+already stored by this one. The run's `manifest.csv` maps the logical path of
+every screenshot, `<state>/<filename>`, to its hash and the URI of the object
+holding it, so the upload only copies the new blobs while every screenshot can
+still be found.
+
+Given a `shard_store.ShardWriter`, the new blobs go to the shard of their
+state instead of `blobs/`. The shards are only written once the downloads are
+over, so a retried run starts over rather than skip screenshots whose shard
+never made it.
+
+The URIs are the run folder's `run_uri`, the GCS folder it's uploaded to,
+followed by the blob's or shard's path in the run folder. A sharded blob also
+has the name of its member in the shard, whose offset is in the shard's index,
+see `shard_store.py`. Once the downloads are over, `write_locations` fills
+both into the CSV loaded to BigQuery, and moves the rows of the failed
+downloads to `<csv>.dropped.csv` for the watermark task, see `watermark.py`.
+
+The index file maps the hash of every archived blob to its URI and member, as
+a blob stays in the folder of the run that first saw it. Running this script after
+the upload adds the run's manifest to it:
+
+    MANIFEST_PATH=.../run_date=2021-03-07/manifest.csv \\
+    BLOB_INDEX=.../blob_index.csv python blob_store.py
+"""
+
+import csv
+import logging
+import os
+import pathlib
+import sys
+import threading
+import typing
+
+# Shared download helpers live in the dataset-level `_custom` folder
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[2] / "_custom"))
+
+import resumable_download  # noqa: E402
+import shard_store  # noqa: E402
+
+BLOB_DIR = "blobs"
+MANIFEST_NAME = "manifest.csv"
+MANIFEST_HEADERS = ["path", "sha256", "uri", "member"]
+INDEX_HEADERS = ["sha256", "uri", "member"]
+URI_COLUMN = "google_cloud_storage_uri"
+MEMBER_COLUMN = "google_cloud_storage_member"
+
+# Where a blob is stored: the URI of its object, and its member in a shard
+Location = typing.Dict[str, str]
+
+
+class BlobStore:
+    """The blobs and manifest of a run, and the index of the archived blobs"""
+
+    def __init__(
+        self,
+        run_dir: pathlib.Path,
+        index_path: pathlib.Path,
+        shards: typing.Optional[shard_store.ShardWriter] = None,
+        run_uri: typing.Optional[str] = None,
+    ) -> None:
+        self.run_dir = run_dir
+        self.blob_dir = run_dir / BLOB_DIR
+        self.manifest_path = run_dir / MANIFEST_NAME
+        self.shards = shards
+        self.run_uri = run_uri.rstrip("/") if run_uri else None
+        if shards is not None and run_uri is not None:
+            if run_dir.resolve() not in shards.shard_dir.resolve().parents:
+                raise ValueError(
+                    "The shard folder must be in the run folder, which is "
+                    f"uploaded to {run_uri}"
+                )
+
+        self.archived = read_index(index_path)
+        if shards is None:
+            # A retried run skips the screenshots it stored already
+            self.manifest = read_manifest(self.manifest_path)
+            self.blob_dir.mkdir(parents=True, exist_ok=True)
+        else:
+            self.manifest = {}
+            self.manifest_path.unlink(missing_ok=True)
+            run_dir.mkdir(parents=True, exist_ok=True)
+        # The location of every blob stored by this run, by hash
+        self.stored = {row["sha256"]: location(row) for row in self.manifest.values()}
+        self.new_blobs = 0
+        self.lock = threading.Lock()
+
+        # Kept open for the run, so gcsfuse uploads it once
+        write_header = not self.manifest_path.exists()
+        self.manifest_file = open(self.manifest_path, "a")
+        self.manifest_writer = csv.DictWriter(
+            self.manifest_file, fieldnames=MANIFEST_HEADERS
+        )
+        if write_header:
+            self.manifest_writer.writeheader()
+
+    def __contains__(self, path: str) -> bool:
+        return path in self.manifest
+
+    def add(self, path: str, file_path: pathlib.Path) -> str:
+        """Stores the file as a blob, or drops it if known, and returns its hash"""
+        sha256 = resumable_download.file_sha256(file_path)
+        blob_name = f"{sha256}{file_path.suffix}"
+        with self.lock:
+            stored = self.archived.get(sha256) or self.stored.get(sha256)
+            if stored is not None:
+                file_path.unlink()
+            elif self.shards is not None:
+                state = path.split("/")[0]
+                self.shards.add(state, file_path, blob_name)
+                stored = {
+                    "uri": self.uri(self.shards.shard_path(state)),
+                    "member": blob_name,
+                }
+                self.new_blobs += 1
+            else:
+                file_path.replace(self.blob_dir / blob_name)
+                stored = {"uri": self.uri(self.blob_dir / blob_name), "member": ""}
+                self.new_blobs += 1
+
+            # Flushed as the screenshots come, so a killed run keeps the ones
+            # it got
+            row = {"path": path, "sha256": sha256, **stored}
+            self.manifest_writer.writerow(row)
+            self.manifest_file.flush()
+            self.manifest[path] = row
+            self.stored[sha256] = stored
+        return sha256
+
+    def uri(self, run_path: pathlib.Path) -> str:
+        """Returns where a file of the run folder is once uploaded"""
+        if self.run_uri is None:
+            return str(run_path)
+        return f"{self.run_uri}/{run_path.relative_to(self.run_dir).as_posix()}"
+
+    def close(self) -> None:
+        self.manifest_file.close()
+
+    def log_stats(self) -> None:
+        logging.info(
+            f"Blob store: {len(self.manifest)} screenshots in the manifest, "
+            f"{self.new_blobs} new blobs"
+        )
+
+
+def read_index(index_path: pathlib.Path) -> typing.Dict[str, Location]:
+    """Returns the location of every archived blob, by hash"""
+    if not index_path.exists():
+        return {}
+    with open(index_path) as index_file:
+        return {row["sha256"]: location(row) for row in csv.DictReader(index_file)}
+
+
+def read_manifest(manifest_path: pathlib.Path) -> typing.Dict[str, dict]:
+    if not manifest_path.exists():
+        return {}
+    with open(manifest_path) as manifest_file:
+        return {row["path"]: row for row in csv.DictReader(manifest_file)}
+
+
+def update_index(manifest_path: pathlib.Path, index_path: pathlib.Path) -> None:
+    """Adds the blobs of an uploaded run's manifest to the index"""
+    archived = read_index(index_path)
+    new_blobs = {}
+    for row in read_manifest(manifest_path).values():
+        if row["sha256"] not in archived:
+            new_blobs[row["sha256"]] = location(row)
+    if not new_blobs:
+        logging.info("No new blobs to add to the index")
+        return
+
+    write_header = not index_path.exists()
+    with open(index_path, "a") as index_file:
+        writer = csv.DictWriter(index_file, fieldnames=INDEX_HEADERS)
+        if write_header:
+            writer.writeheader()
+        writer.writerows(
+            {"sha256": sha256, **stored} for sha256, stored in sorted(new_blobs.items())
+        )
+    logging.info(f"Added {len(new_blobs)} blobs to the index")
+
+
+def location(row: dict) -> Location:
+    return {"uri": row["uri"], "member": row["member"]}
+
+
+def write_locations(
+    csv_path: pathlib.Path, source_column: str, manifest: typing.Dict[str, dict]
+) -> None:
+    """Points the rows of the CSV at the objects holding their screenshots.
+
+    Sharded screenshots get the name of their member in the shard too. Rows
+    whose screenshot isn't in the manifest, as its download failed, are moved
+    to the CSV at `dropped_path`, so the watermark of their state stays below
+    them and the next run scrapes them again.
+    """
+    with open(csv_path) as csv_file:
+        reader = csv.DictReader(csv_file)
+        scraped_fieldnames = list(reader.fieldnames or [])
+        scraped_rows = list(reader)
+    fieldnames = scraped_fieldnames + [
+        column
+        for column in [URI_COLUMN, MEMBER_COLUMN]
+        if column not in scraped_fieldnames
+    ]
+
+    rows, dropped_rows = [], []
+    for row in scraped_rows:
+        # Example:
+        # https://covidtracking.com/screenshots/AL/AL-20210307-230802.png
+        path = "/".join(row[source_column].split("/")[-2:])
+        if path in manifest:
+            stored = manifest[path]
+            rows.append(
+                {**row, URI_COLUMN: stored["uri"], MEMBER_COLUMN: stored["member"]}
+            )
+        else:
+            dropped_rows.append(row)
+
+    # Written even when empty, so a retry doesn't keep the rows its failed try
+    # dropped
+    write_rows(dropped_path(csv_path), scraped_fieldnames, dropped_rows)
+    write_rows(csv_path, fieldnames, rows)
+    if dropped_rows:
+        logging.warning(f"Dropped {len(dropped_rows)} rows without a stored screenshot")
+
+
+def dropped_path(csv_path: pathlib.Path) -> pathlib.Path:
+    return csv_path.with_name(f"{csv_path.stem}.dropped.csv")
+
+
+def write_rows(csv_path: pathlib.Path, fieldnames: list, rows: list) -> None:
+    # Written next to the CSV and renamed, so a killed run never leaves it cut
+    partial_path = csv_path.with_name(f"{csv_path.name}.part")
+    with open(partial_path, "w") as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+    partial_path.replace(csv_path)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    assert os.environ["MANIFEST_PATH"]
+    assert os.environ["BLOB_INDEX"]
+    update_index(
+        manifest_path=pathlib.Path(os.environ["MANIFEST_PATH"]).expanduser(),
+        index_path=pathlib.Path(os.environ["BLOB_INDEX"]).expanduser(),
+    )
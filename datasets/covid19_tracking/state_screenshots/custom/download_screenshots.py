@@ -12,59 +12,310 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+"""Downloads the screenshots listed in the CSV generated by the web scrape.
 
+Downloads are network-bound, so they run on an asyncio event loop with a fixed
+number of requests in flight, `MAX_IN_FLIGHT` in the environment. The CSV rows
+are fed to the downloaders through a bounded queue, so reading the CSV waits
+for the downloads to catch up instead of holding the whole list in memory, and
+the script only exits once every download has finished.
+
+The downloaders share a session keeping one connection alive per request in
+flight, see `_custom/http_client.py`, so a screenshot costs a request rather
+than a new connection and TLS handshake. The session backs off when the origin
+throttles the downloads, and caps them at `RATE_LIMIT` requests a second when
+it's set, see `_custom/rate_control.py`.
+
+Every screenshot is written to a partial file, in `PARTIAL_DIR` when it's set,
+and renamed once complete, see `_custom/resumable_download.py`. A screenshot
+that exists is therefore whole and skipped, and a retry resumes the partial
+files where they broke off.
+
+Given a `blob_store.BlobStore`, the screenshots are stored by the hash of their
+content instead, see `blob_store.py`. `BLOB_INDEX` in the environment turns it
+on, and the rows of the CSV are then pointed at the objects holding their
+screenshots once uploaded to `UPLOAD_URI`, the GCS folder of `DOWNLOAD_PREFIX`.
+
+With `SHARD_DIR` set, the screenshots are downloaded to the local disk and
+bundled into one tar per state, see `shard_store.py`. Only the finished shards
+are written to `SHARD_DIR`, rather than thousands of small files through the
+gcsfuse mount. The partial files are on the local disk too, so `PARTIAL_DIR`
+can't be set along with it.
+
+The throughput, request latencies and retries of the downloads are written as
+JSON to `METRICS_FILE`, and sent to StatsD at `STATSD_ADDRESS`, when they're
+set, see `_custom/download_metrics.py`.
+
+The scrape calls `download_rows` with its rows as they are scraped, so the
+downloads start before the scrape is over.
+"""
+
+import asyncio
+import collections
 import csv
+import functools
+import logging
 import os
 import pathlib
+import sys
 import typing
-from multiprocessing.pool import ThreadPool
+from concurrent.futures import ThreadPoolExecutor
 
+import blob_store
 import requests
+import shard_store
 
-CPU_FRACTION = 0.5
-WORKER_THREADS = max(int(os.cpu_count() * CPU_FRACTION), 1)
+# Shared HTTP sessions live in the dataset-level `_custom` folder
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[2] / "_custom"))
 
+import download_metrics  # noqa: E402
+import http_client  # noqa: E402
+import rate_control  # noqa: E402
+import resumable_download  # noqa: E402
 
-def download_item(source_target: typing.Tuple[str, pathlib.Path]):
-    """ThreadPool.imap_unordered accepts tuples as arguments to the callable"""
-    source_url, download_path = source_target
-    if not os.path.exists(download_path):
-        r = requests.get(source_url, stream=True)
-        if r.status_code == 200:
-            with open(download_path, "wb") as f:
-                for chunk in r:
-                    f.write(chunk)
+MAX_IN_FLIGHT = 32
+QUEUE_SIZE_PER_DOWNLOADER = 4
+STATSD_PREFIX = "covid19_tracking.state_screenshots"
 
+# The source URL, download path and partial download path of a screenshot
+SourceTarget = typing.Tuple[str, pathlib.Path, pathlib.Path]
 
-def download_parallel(source_targets: typing.List[typing.Tuple[str, pathlib.Path]]):
-    ThreadPool(WORKER_THREADS).imap_unordered(download_item, source_targets)
 
+def download_item(
+    http: requests.Session,
+    source_target: SourceTarget,
+    blobs: typing.Optional[blob_store.BlobStore] = None,
+    shards: typing.Optional[shard_store.ShardWriter] = None,
+    metrics: typing.Optional[download_metrics.Metrics] = None,
+) -> str:
+    """Downloads a screenshot unless it's there already, and returns the outcome"""
+    source_url, download_path, partial_path = source_target
+    # Stored screenshots are in the manifest rather than at their download path
+    path = f"{download_path.parent.name}/{download_path.name}"
+    stored = path in blobs if blobs is not None else download_path.exists()
+    if stored:
+        return "skipped"
 
-def main(csv_path: pathlib.Path, source_column: str, download_prefix: str):
-    with open(csv_path) as csv_file:
-        csv_reader = csv.DictReader(csv_file, delimiter=",")
-        download_dir = pathlib.Path(download_prefix)
+    size = resumable_download.download(
+        http, source_url, download_path, partial_path=partial_path
+    )
+    if metrics is not None:
+        metrics.record_file(size)
+    if blobs is not None:
+        blobs.add(path, download_path)
+    elif shards is not None:
+        shards.add(download_path.parent.name, download_path)
+    return "downloaded"
+
+
+async def download_all(
+    source_targets: typing.Iterable[SourceTarget],
+    max_in_flight: int,
+    rate: typing.Optional[rate_control.RateControl] = None,
+    blobs: typing.Optional[blob_store.BlobStore] = None,
+    shards: typing.Optional[shard_store.ShardWriter] = None,
+    metrics: typing.Optional[download_metrics.Metrics] = None,
+) -> typing.Counter[str]:
+    """Downloads everything with at most `max_in_flight` requests at a time"""
+    queue = asyncio.Queue(maxsize=max_in_flight * QUEUE_SIZE_PER_DOWNLOADER)
+    outcomes = collections.Counter()
+
+    async def feed() -> None:
+        # Getting the next item may block, on a scrape in progress for one, so
+        # it's done on a thread while the downloads carry on
+        loop = asyncio.get_running_loop()
+        items = iter(source_targets)
+        while True:
+            source_target = await loop.run_in_executor(None, next, items, None)
+            if source_target is None:
+                break
+            await queue.put(source_target)
+        await queue.join()
+
+    # requests is blocking, so every downloader hands its requests to a thread
+    # of its own. The pools never grow past the number of downloaders.
+    with http_client.session(
+        max_in_flight, rate=rate, metrics=metrics
+    ) as http, ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        fetch = functools.partial(
+            download_item, http, blobs=blobs, shards=shards, metrics=metrics
+        )
+        downloaders = [
+            asyncio.ensure_future(downloader(queue, executor, fetch, outcomes))
+            for _ in range(max_in_flight)
+        ]
+        feeder = asyncio.ensure_future(feed())
+        try:
+            # Downloaders only return on an unexpected error, which is raised
+            # here rather than leaving the feeder blocked on a full queue
+            done, _ = await asyncio.wait(
+                [feeder, *downloaders], return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                task.result()
+        finally:
+            for task in [feeder, *downloaders]:
+                task.cancel()
+            await asyncio.gather(feeder, *downloaders, return_exceptions=True)
+
+    return outcomes
+
+
+async def downloader(
+    queue: asyncio.Queue,
+    executor: ThreadPoolExecutor,
+    fetch: typing.Callable[[SourceTarget], str],
+    outcomes: typing.Counter[str],
+) -> None:
+    while True:
+        source_target = await queue.get()
+        try:
+            outcomes[await download(source_target, executor, fetch)] += 1
+        finally:
+            queue.task_done()
 
-        row_num = 0
-        source_targets = []
-        for row in csv_reader:
-            # Example:
-            # https://covidtracking.com/screenshots/AL/AL-20210307-230802.png
-            source_url = row[source_column]
-            state, filename = row[source_column].split("/")[-2:]
 
+async def download(
+    source_target: SourceTarget,
+    executor: ThreadPoolExecutor,
+    fetch: typing.Callable[[SourceTarget], str],
+) -> str:
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(executor, fetch, source_target)
+    except requests.exceptions.RequestException as e:
+        logging.warning(f"HTTP GET for {source_target[0]} failed: {e}")
+        return "failed"
+
+
+def download_rows(
+    rows: typing.Iterable[dict],
+    source_column: str,
+    download_dir: pathlib.Path,
+    max_in_flight: int = MAX_IN_FLIGHT,
+    partial_dir: typing.Optional[pathlib.Path] = None,
+    rate: typing.Optional[rate_control.RateControl] = None,
+    blobs: typing.Optional[blob_store.BlobStore] = None,
+    shards: typing.Optional[shard_store.ShardWriter] = None,
+    metrics: typing.Optional[download_metrics.Metrics] = None,
+) -> typing.Counter[str]:
+    """Downloads the screenshot of every row, reading the rows as they come"""
+    if max_in_flight < 1:
+        raise ValueError("`max_in_flight` must be a positive integer")
+
+    check_download_dirs(partial_dir, shards.shard_dir if shards else None)
+    if shards is not None:
+        # Everything is written to the local disk until the shards are done
+        download_dir = shards.staging_dir
+
+    source_targets = read_source_targets(rows, source_column, download_dir, partial_dir)
+    try:
+        outcomes = asyncio.run(
+            download_all(source_targets, max_in_flight, rate, blobs, shards, metrics)
+        )
+    finally:
+        # The shards are written first, so the manifest never lists a
+        # screenshot missing from them
+        if shards is not None:
+            shards.close()
+        if blobs is not None:
+            blobs.close()
+
+    logging.info(
+        f"Screenshots downloaded: {outcomes['downloaded']}, "
+        f"already there: {outcomes['skipped']}, failed: {outcomes['failed']}"
+    )
+    if metrics is not None:
+        metrics.record_failures(outcomes["failed"])
+    return outcomes
+
+
+def check_download_dirs(
+    partial_dir: typing.Optional[pathlib.Path],
+    shard_dir: typing.Optional[pathlib.Path],
+) -> None:
+    if partial_dir is not None and shard_dir is not None:
+        raise ValueError(
+            "`PARTIAL_DIR` can't be used with `SHARD_DIR`, as sharded screenshots "
+            "are downloaded to the local disk"
+        )
+
+
+def read_source_targets(
+    rows: typing.Iterable[dict],
+    source_column: str,
+    download_dir: pathlib.Path,
+    partial_dir: typing.Optional[pathlib.Path] = None,
+) -> typing.Iterator[SourceTarget]:
+    state_dirs = set()
+    download_paths = set()
+    for row in rows:
+        # Example:
+        # https://covidtracking.com/screenshots/AL/AL-20210307-230802.png
+        source_url = row[source_column]
+        state, filename = source_url.split("/")[-2:]
+        download_path = download_dir / state / filename
+
+        # A screenshot listed twice would have two downloaders writing its
+        # partial file at once
+        if download_path in download_paths:
+            continue
+        download_paths.add(download_path)
+
+        if state not in state_dirs:
             (download_dir / state).mkdir(parents=True, exist_ok=True)
-            source_targets.append((source_url, download_dir / state / filename))
+            state_dirs.add(state)
+        partial_path = (partial_dir or download_dir) / state / f"{filename}.part"
+        yield source_url, download_path, partial_path
 
-            row_num += 1
-            if row_num % WORKER_THREADS == 0:
-                download_parallel(source_targets)
-                source_targets = []
 
-        download_parallel(source_targets)
+def main(
+    csv_path: pathlib.Path,
+    source_column: str,
+    download_prefix: str,
+    max_in_flight: int = MAX_IN_FLIGHT,
+    partial_dir: typing.Optional[pathlib.Path] = None,
+    rate_limit: typing.Optional[float] = None,
+    blob_index_path: typing.Optional[pathlib.Path] = None,
+    shard_dir: typing.Optional[pathlib.Path] = None,
+    upload_uri: typing.Optional[str] = None,
+    metrics_path: typing.Optional[pathlib.Path] = None,
+    statsd_address: typing.Optional[str] = None,
+):
+    check_download_dirs(partial_dir, shard_dir)
+    rate = rate_control.RateControl(rate_limit, max_concurrency=max_in_flight)
+    metrics = download_metrics.Metrics()
+    shards = None
+    if shard_dir is not None:
+        shards = shard_store.ShardWriter(shard_dir)
+    blobs = None
+    if blob_index_path is not None:
+        blobs = blob_store.BlobStore(
+            pathlib.Path(download_prefix), blob_index_path, shards, upload_uri
+        )
+
+    with open(csv_path) as csv_file:
+        download_rows(
+            csv.DictReader(csv_file, delimiter=","),
+            source_column,
+            pathlib.Path(download_prefix),
+            max_in_flight,
+            partial_dir,
+            rate,
+            blobs,
+            shards,
+            metrics,
+        )
+    rate.log_stats()
+    if blobs is not None:
+        blob_store.write_locations(csv_path, source_column, blobs.manifest)
+        blobs.log_stats()
+    metrics.report(metrics_path, statsd_address, STATSD_PREFIX)
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
     assert os.environ["CSV_PATH"]
     assert os.environ["SOURCE_COLUMN"]
     assert os.environ["DOWNLOAD_PREFIX"]
@@ -72,4 +323,30 @@ if __name__ == "__main__":
         csv_path=pathlib.Path(os.environ["CSV_PATH"]).expanduser(),
         source_column=os.environ["SOURCE_COLUMN"],
         download_prefix=os.environ["DOWNLOAD_PREFIX"],
+        max_in_flight=int(os.environ.get("MAX_IN_FLIGHT", MAX_IN_FLIGHT)),
+        partial_dir=(
+            pathlib.Path(os.environ["PARTIAL_DIR"]).expanduser()
+            if os.environ.get("PARTIAL_DIR")
+            else None
+        ),
+        rate_limit=(
+            float(os.environ["RATE_LIMIT"]) if os.environ.get("RATE_LIMIT") else None
+        ),
+        blob_index_path=(
+            pathlib.Path(os.environ["BLOB_INDEX"]).expanduser()
+            if os.environ.get("BLOB_INDEX")
+            else None
+        ),
+        shard_dir=(
+            pathlib.Path(os.environ["SHARD_DIR"]).expanduser()
+            if os.environ.get("SHARD_DIR")
+            else None
+        ),
+        upload_uri=os.environ.get("UPLOAD_URI"),
+        metrics_path=(
+            pathlib.Path(os.environ["METRICS_FILE"]).expanduser()
+            if os.environ.get("METRICS_FILE")
+            else None
+        ),
+        statsd_address=os.environ.get("STATSD_ADDRESS"),
     )
@@ -0,0 +1,124 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Targeted parsing of the screenshots site pages.
+
+The scraper only needs the links of the index page and the first rows of the
+table on every state page, so nothing else is turned into Python objects:
+
+- `lxml`, the default when it's installed, parses the page incrementally with
+  libxml2 and stops as soon as the rows asked for have been read. State pages
+  list every day since early 2020, and at most the last 30 days are scraped.
+- `bs4` is the fallback, a `html.parser` tree restricted to the elements asked
+  for. It tokenizes the whole page in Python.
+
+Set the backend with the `HTML_PARSER` environment variable. See
+`benchmarks/parse_benchmark.py` for their timings on saved pages.
+"""
+
+import importlib.util
+import itertools
+import typing
+
+import bs4
+
+PARSERS = ("lxml", "bs4")
+
+# The pull parser is fed this many characters at a time, so it never reads
+# much past the last row asked for
+FEED_SIZE = 16 * 1024
+
+
+class Link(typing.NamedTuple):
+    href: typing.Optional[str]
+    text: str
+
+
+class Cell(typing.NamedTuple):
+    text: str
+    links: typing.List[Link]
+
+
+Row = typing.List[Cell]
+
+
+def default_parser() -> str:
+    return "lxml" if importlib.util.find_spec("lxml") else "bs4"
+
+
+def page_links(html: str, parser: str) -> typing.List[Link]:
+    """Returns every `<a>` of the page, in document order"""
+    check_parser(parser)
+    if parser == "lxml":
+        return [lxml_link(a) for a in lxml_elements(html, "a")]
+
+    page = bs4.BeautifulSoup(html, "html.parser", parse_only=bs4.SoupStrainer("a"))
+    return [bs4_link(a) for a in page.find_all("a")]
+
+
+def table_rows(html: str, max_rows: int, parser: str) -> typing.List[Row]:
+    """Returns the `<td>` cells of the first `max_rows` `<tr>` rows of the page.
+
+    A row of `<th>` headers has no cells.
+    """
+    return list(itertools.islice(iter_table_rows(html, parser), max_rows))
+
+
+def iter_table_rows(html: str, parser: str) -> typing.Iterator[Row]:
+    """Yields the `<td>` cells of the `<tr>` rows, parsing only as far as read"""
+    check_parser(parser)
+    if parser == "lxml":
+        for tr in lxml_elements(html, "tr"):
+            yield [lxml_cell(td) for td in tr.iter("td")]
+        return
+
+    page = bs4.BeautifulSoup(html, "html.parser", parse_only=bs4.SoupStrainer("tr"))
+    for tr in page.find_all("tr"):
+        yield [bs4_cell(td) for td in tr.find_all("td")]
+
+
+def check_parser(parser: str) -> None:
+    if parser not in PARSERS:
+        raise ValueError(f"The HTML parser must be one of {PARSERS}")
+
+
+def lxml_elements(html: str, tag: str) -> typing.Iterator:
+    """Yields the `tag` elements of the page as soon as each one is complete"""
+    # lxml is optional, and only imported when it's installed
+    from lxml import etree
+
+    parser = etree.HTMLPullParser(events=("end",), tag=tag)
+    for offset in range(0, len(html), FEED_SIZE):
+        parser.feed(html[offset : offset + FEED_SIZE])
+        for _, element in parser.read_events():
+            yield element
+    parser.close()
+    for _, element in parser.read_events():
+        yield element
+
+
+def lxml_link(a) -> Link:
+    return Link(a.get("href"), "".join(a.itertext()))
+
+
+def lxml_cell(td) -> Cell:
+    return Cell("".join(td.itertext()), [lxml_link(a) for a in td.iter("a")])
+
+
+def bs4_link(a: bs4.element.Tag) -> Link:
+    return Link(a.get("href"), a.text)
+
+
+def bs4_cell(td: bs4.element.Tag) -> Cell:
+    return Cell(td.text, [bs4_link(a) for a in td.find_all("a")])
@@ -0,0 +1,141 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Screenshots bundled into one tar shard per state.
+
+Every file written through the gcsfuse mount of the Airflow data folder costs
+a few round trips to GCS, which takes longer than downloading a screenshot.
+Shards are built on the local disk instead, and only the finished ones are
+moved to the shard folder: a tar and a sidecar `<shard>.tar.index.csv` per
+state, listing the byte offset and size of every member.
+
+A member is read without unpacking the tar by reading its bytes at its offset,
+which works the same on a ranged GCS read, e.g.
+
+    gsutil cat -r 1536-2559 gs://.../shards/AL.tar
+
+Running this script extracts a screenshot from a shard:
+
+    SHARD_PATH=.../shards/AL.tar MEMBER_NAME=AL-20210307-230802.png \\
+    OUTPUT_PATH=screenshot.png python shard_store.py
+"""
+
+import csv
+import logging
+import math
+import os
+import pathlib
+import shutil
+import tarfile
+import tempfile
+import threading
+import typing
+
+INDEX_HEADERS = ["name", "offset", "size"]
+
+
+class ShardWriter:
+    """Appends files to the shards staged on the local disk"""
+
+    def __init__(self, shard_dir: pathlib.Path) -> None:
+        self.shard_dir = shard_dir
+        # Downloads are written to the staging folder too, so no screenshot
+        # goes through the shard folder on its own
+        self.staging_dir = pathlib.Path(tempfile.mkdtemp(prefix="screenshot-shards-"))
+        self.tars = {}
+        self.indexes = {}
+        self.lock = threading.Lock()
+
+    def add(
+        self, shard: str, file_path: pathlib.Path, name: typing.Optional[str] = None
+    ) -> None:
+        """Moves the file into the shard, named `name` or after the file"""
+        name = name or file_path.name
+        with self.lock:
+            if shard not in self.tars:
+                self.tars[shard] = tarfile.open(self.staging_dir / f"{shard}.tar", "w")
+                self.indexes[shard] = []
+            tar = self.tars[shard]
+
+            info = tar.gettarinfo(file_path, arcname=name)
+            with open(file_path, "rb") as member_file:
+                tar.addfile(info, member_file)
+            # The member's data ends where the tar does, padded to a block
+            padded_size = math.ceil(info.size / tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+            self.indexes[shard].append(
+                {"name": name, "offset": tar.offset - padded_size, "size": info.size}
+            )
+        file_path.unlink()
+
+    def shard_path(self, shard: str) -> pathlib.Path:
+        """Returns where the shard is once it's finished"""
+        return self.shard_dir / f"{shard}.tar"
+
+    def close(self) -> None:
+        """Moves the finished shards and their indexes to the shard folder"""
+        with self.lock:
+            self.shard_dir.mkdir(parents=True, exist_ok=True)
+            for shard, tar in self.tars.items():
+                tar.close()
+                tar_path = self.staging_dir / f"{shard}.tar"
+                with open(index_path(tar_path), "w") as index_file:
+                    writer = csv.DictWriter(index_file, fieldnames=INDEX_HEADERS)
+                    writer.writeheader()
+                    writer.writerows(self.indexes[shard])
+
+                # The tar first, so an index is never there without its tar
+                shutil.move(str(tar_path), str(self.shard_path(shard)))
+                shutil.move(
+                    str(index_path(tar_path)), str(index_path(self.shard_path(shard)))
+                )
+            logging.info(
+                f"Shards: {sum(map(len, self.indexes.values()))} files in "
+                f"{len(self.tars)} shards"
+            )
+            self.tars = {}
+            shutil.rmtree(self.staging_dir, ignore_errors=True)
+
+
+def index_path(shard_path: pathlib.Path) -> pathlib.Path:
+    return shard_path.with_name(f"{shard_path.name}.index.csv")
+
+
+def read_index(shard_path: pathlib.Path) -> typing.Dict[str, typing.Tuple[int, int]]:
+    """Returns the offset and size of every member of the shard"""
+    with open(index_path(shard_path)) as index_file:
+        return {
+            row["name"]: (int(row["offset"]), int(row["size"]))
+            for row in csv.DictReader(index_file)
+        }
+
+
+def read_member(shard_path: pathlib.Path, name: str) -> bytes:
+    offset, size = read_index(shard_path)[name]
+    with open(shard_path, "rb") as shard_file:
+        shard_file.seek(offset)
+        return shard_file.read(size)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    assert os.environ["SHARD_PATH"]
+    assert os.environ["MEMBER_NAME"]
+    assert os.environ["OUTPUT_PATH"]
+    pathlib.Path(os.environ["OUTPUT_PATH"]).expanduser().write_bytes(
+        read_member(
+            pathlib.Path(os.environ["SHARD_PATH"]).expanduser(),
+            os.environ["MEMBER_NAME"],
+        )
+    )
@@ -13,14 +13,39 @@
 # limitations under the License.
 
 
+import collections
 import csv
+import functools
+import itertools
+import logging
 import os
 import pathlib
+import sys
 import typing
 from datetime import datetime
+from multiprocessing.pool import ThreadPool
 
-import bs4
+import blob_store
+import download_screenshots
+import page_parser
 import requests
+import shard_store
+
+# Shared HTTP sessions live in the dataset-level `_custom` folder
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[2] / "_custom"))
+
+import download_metrics  # noqa: E402
+import http_cache  # noqa: E402
+import http_client  # noqa: E402
+import rate_control  # noqa: E402
+import watermark  # noqa: E402
+
+# The state pages are fetched concurrently, each worker on a connection of its
+# own. Parsing holds the GIL, so more workers mostly add idle connections.
+SCRAPE_WORKERS = 8
+
+# Only the screenshots of the first rows, the last 30 days, are scraped
+SCRAPED_ROWS = 30
 
 CSV_HEADERS = [
     "state",
@@ -30,39 +55,156 @@ CSV_HEADERS = [
     "time_of_day",
     "source_url",
     "google_cloud_storage_uri",
+    # Only set for the screenshots stored in shards, see `blob_store.py`
+    "google_cloud_storage_member",
 ]
 
 
-def main(source_url: str, csv_output_path: pathlib.Path, screenshots_gcs_prefix: str):
-    response = requests.get(source_url)
+def main(
+    source_url: str,
+    csv_output_path: pathlib.Path,
+    screenshots_gcs_prefix: str,
+    workers: int = SCRAPE_WORKERS,
+    parser: str = None,
+    cache_dir: typing.Optional[pathlib.Path] = None,
+    cache_max_bytes: int = http_cache.MAX_BYTES,
+    watermark_path: typing.Optional[pathlib.Path] = None,
+    run_date: typing.Optional[str] = None,
+    download_prefix: typing.Optional[pathlib.Path] = None,
+    max_in_flight: int = download_screenshots.MAX_IN_FLIGHT,
+    partial_dir: typing.Optional[pathlib.Path] = None,
+    rate_limit: typing.Optional[float] = None,
+    blob_index_path: typing.Optional[pathlib.Path] = None,
+    shard_dir: typing.Optional[pathlib.Path] = None,
+    upload_uri: typing.Optional[str] = None,
+    metrics_path: typing.Optional[pathlib.Path] = None,
+    statsd_address: typing.Optional[str] = None,
+):
+    parser = parser or page_parser.default_parser()
+    if workers < 1:
+        raise ValueError("`workers` must be a positive integer")
+    if download_prefix is not None:
+        download_screenshots.check_download_dirs(partial_dir, shard_dir)
 
-    if response.status_code == 200:
-        html = bs4.BeautifulSoup(response.text, "html.parser")
-    else:
-        raise requests.exceptions.HTTPError
+    # Only the days after the last loaded one of every state are written, so
+    # the download and load tasks only get the new screenshots. Those loaded
+    # by an earlier try of this run are written again, as its load replaces
+    # them.
+    max_dates = watermark.read_per_key(watermark_path, run_date)
 
-    csv_rows = generate_csv_data_from_html(source_url, html, screenshots_gcs_prefix)
-    write_to_csv(csv_rows, csv_output_path)
+    # Pages unchanged since the last run, or the failed attempt a retry
+    # follows, are revalidated and read from the cache
+    cache = None
+    if cache_dir is not None:
+        cache = http_cache.Cache(cache_dir, cache_max_bytes)
 
+    # The scrape and the downloads running alongside it back off together
+    # when the site throttles them
+    max_concurrency = workers + (max_in_flight if download_prefix else 0)
+    rate = rate_control.RateControl(rate_limit, max_concurrency=max_concurrency)
+    metrics = download_metrics.Metrics()
 
-def generate_csv_data_from_html(
-    domain: str, html: bs4.BeautifulSoup, screenshots_gcs_prefix: str
-) -> typing.List[dict]:
-    rows = []
+    # The screenshots are bundled into a few large files, and stored by
+    # content so the upload skips the ones archived already
+    shards = None
+    if download_prefix is not None and shard_dir is not None:
+        shards = shard_store.ShardWriter(shard_dir)
+    blobs = None
+    if download_prefix is not None and blob_index_path is not None:
+        blobs = blob_store.BlobStore(
+            download_prefix, blob_index_path, shards, upload_uri
+        )
+
+    # The index and every state page are on the same host, so the workers
+    # share its kept-alive connections
+    with http_client.session(
+        pool_size=workers, cache=cache, rate=rate, metrics=metrics
+    ) as http:
+        response = http.get(source_url)
+
+        if response.status_code != 200:
+            raise requests.exceptions.HTTPError
+
+        csv_rows = generate_csv_data_from_html(
+            source_url,
+            response.text,
+            screenshots_gcs_prefix,
+            http,
+            workers,
+            parser,
+            max_dates,
+        )
+
+        with open(csv_output_path, "w") as csv_file:
+            written_rows = write_rows(csv_file, csv_rows)
 
+            # The rows are written as the state pages are scraped and, given a
+            # download prefix, their screenshots downloaded right after
+            if download_prefix is not None:
+                download_screenshots.download_rows(
+                    written_rows,
+                    "source_url",
+                    download_prefix,
+                    max_in_flight,
+                    partial_dir,
+                    rate,
+                    blobs,
+                    shards,
+                    metrics,
+                )
+            else:
+                collections.deque(written_rows, maxlen=0)
+
+    # Stored screenshots are only found through the manifest, so the rows are
+    # pointed at their blobs or shards
+    if blobs is not None:
+        blob_store.write_locations(csv_output_path, "source_url", blobs.manifest)
+
+    rate.log_stats()
+    if cache is not None:
+        cache.log_stats()
+    if blobs is not None:
+        blobs.log_stats()
+    metrics.report(
+        metrics_path, statsd_address, download_screenshots.STATSD_PREFIX, cache
+    )
+
+
+def generate_csv_data_from_html(
+    domain: str,
+    html: str,
+    screenshots_gcs_prefix: str,
+    http: requests.Session,
+    workers: int = 1,
+    parser: str = "bs4",
+    max_dates: typing.Dict[str, str] = None,
+) -> typing.Iterator[dict]:
     # Skip the first <a> tag because it's not a state-related link
-    for link in html.find_all("a")[1:]:
-        rows += generate_csv_rows(domain + link["href"], screenshots_gcs_prefix)
+    urls = [domain + link.href for link in page_parser.page_links(html, parser)[1:]]
+    scrape = functools.partial(
+        generate_csv_rows,
+        gcs_path_prefix=screenshots_gcs_prefix,
+        http=http,
+        parser=parser,
+        max_dates=max_dates or {},
+    )
 
-    return rows
+    with ThreadPool(min(workers, len(urls) or 1)) as pool:
+        # `imap` yields the rows in the order of the state links, whichever
+        # page loads first, as soon as the pages before it are scraped
+        yield from itertools.chain.from_iterable(pool.imap(scrape, urls))
 
 
-def generate_csv_rows(url: str, gcs_path_prefix: str) -> typing.List[dict]:
-    response = requests.get(url)
+def generate_csv_rows(
+    url: str,
+    gcs_path_prefix: str,
+    http: requests.Session,
+    parser: str = "bs4",
+    max_dates: typing.Dict[str, str] = None,
+) -> typing.List[dict]:
+    response = http.get(url)
 
-    if response.status_code == 200:
-        page = bs4.BeautifulSoup(response.text, "html.parser")
-    else:
+    if response.status_code != 200:
         raise requests.exceptions.HTTPError(
             f"HTTP GET for {url} failed: {response.text}"
         )
@@ -70,24 +212,30 @@ def generate_csv_rows(url: str, gcs_path_prefix: str) -> typing.List[dict]:
     # Example `url`:
     # https://screenshots.covidtracking.com/alabama
     state_name = url.split("/")[-1]
+    last_loaded = (max_dates or {}).get(state_name)
 
     # Skip the headers row at index 0
-    tr_tags = page.find_all("tr")[1:]
+    tr_tags = itertools.islice(
+        page_parser.iter_table_rows(response.text, parser), 1, SCRAPED_ROWS + 1
+    )
 
     rows = []
     current_date = None
-    # Only get screenshots for the last 30 days
-    for tr in tr_tags[:30]:
-        td_date, td_source_type, td_screenshots = tr.find_all("td")
+    for tr in tr_tags:
+        td_date, td_source_type, td_screenshots = tr
 
         if td_date.text:
             current_date = datetime.strptime(td_date.text, "%B %d, %Y").date()
 
+            # The newest days come first, so the rest of the page is loaded
+            if last_loaded is not None and str(current_date) <= last_loaded:
+                break
+
         # Only get the last screenshot taken for the day
-        for link in td_screenshots.find_all("a")[-1:]:
+        for link in td_screenshots.links[-1:]:
             # Example:
             # https://covidtracking.com/screenshots/AL/AL-20200315-163235.png
-            screenshot_url = link["href"]
+            screenshot_url = link.href
             *_, state, filename = screenshot_url.split("/")
 
             # Example: "4:22 pm"
@@ -108,15 +256,20 @@ def generate_csv_rows(url: str, gcs_path_prefix: str) -> typing.List[dict]:
     return rows
 
 
-def write_to_csv(rows: typing.List[dict], output_path: pathlib.Path):
-    with open(output_path, "w") as csv_file:
-        csv_writer = csv.DictWriter(csv_file, fieldnames=CSV_HEADERS)
-        csv_writer.writeheader()
-        for row in rows:
-            csv_writer.writerow(row)
+def write_rows(
+    csv_file: typing.TextIO, rows: typing.Iterable[dict]
+) -> typing.Iterator[dict]:
+    """Writes every row to the CSV file, then passes it on"""
+    csv_writer = csv.DictWriter(csv_file, fieldnames=CSV_HEADERS)
+    csv_writer.writeheader()
+    for row in rows:
+        csv_writer.writerow(row)
+        yield row
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
     assert os.environ["SOURCE_URL"]
     assert os.environ["GCS_PATH_PREFIX"]
     assert os.environ["CSV_OUTPUT_PATH"]
@@ -124,4 +277,53 @@ if __name__ == "__main__":
         source_url=os.environ["SOURCE_URL"],
         csv_output_path=pathlib.Path(os.environ["CSV_OUTPUT_PATH"]).expanduser(),
         screenshots_gcs_prefix=os.environ["GCS_PATH_PREFIX"],
+        workers=int(os.environ.get("SCRAPE_WORKERS", SCRAPE_WORKERS)),
+        parser=os.environ.get("HTML_PARSER"),
+        cache_dir=(
+            pathlib.Path(os.environ["HTTP_CACHE_DIR"]).expanduser()
+            if os.environ.get("HTTP_CACHE_DIR")
+            else None
+        ),
+        cache_max_bytes=int(
+            os.environ.get("HTTP_CACHE_MAX_BYTES", http_cache.MAX_BYTES)
+        ),
+        watermark_path=(
+            pathlib.Path(os.environ["WATERMARK_FILE"]).expanduser()
+            if os.environ.get("WATERMARK_FILE")
+            else None
+        ),
+        run_date=os.environ.get("RUN_DATE"),
+        download_prefix=(
+            pathlib.Path(os.environ["DOWNLOAD_PREFIX"]).expanduser()
+            if os.environ.get("DOWNLOAD_PREFIX")
+            else None
+        ),
+        max_in_flight=int(
+            os.environ.get("MAX_IN_FLIGHT", download_screenshots.MAX_IN_FLIGHT)
+        ),
+        partial_dir=(
+            pathlib.Path(os.environ["PARTIAL_DIR"]).expanduser()
+            if os.environ.get("PARTIAL_DIR")
+            else None
+        ),
+        rate_limit=(
+            float(os.environ["RATE_LIMIT"]) if os.environ.get("RATE_LIMIT") else None
+        ),
+        blob_index_path=(
+            pathlib.Path(os.environ["BLOB_INDEX"]).expanduser()
+            if os.environ.get("BLOB_INDEX")
+            else None
+        ),
+        shard_dir=(
+            pathlib.Path(os.environ["SHARD_DIR"]).expanduser()
+            if os.environ.get("SHARD_DIR")
+            else None
+        ),
+        upload_uri=os.environ.get("UPLOAD_URI"),
+        metrics_path=(
+            pathlib.Path(os.environ["METRICS_FILE"]).expanduser()
+            if os.environ.get("METRICS_FILE")
+            else None
+        ),
+        statsd_address=os.environ.get("STATSD_ADDRESS"),
     )
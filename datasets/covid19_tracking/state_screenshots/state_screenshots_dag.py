@@ -28,15 +28,15 @@ with DAG(
     dag_id="covid19_tracking.state_screenshots",
     default_args=default_args,
     max_active_runs=1,
-    schedule_interval="@once",
+    schedule_interval="@daily",
     catchup=False,
     default_view="graph",
 ) as dag:
 
-    # Run the custom/generate_csv.py script to scrape the webpage and generate a CSV file of the state screenshots
+    # Run the custom/web_scrape_and_generate_csv.py script to scrape the webpage, generate a CSV file of the state screenshots and download them to the local file system (mounted GCS) as they are scraped
     generate_csv_data_from_web_scraping = bash_operator.BashOperator(
         task_id="generate_csv_data_from_web_scraping",
-        bash_command='mkdir -p $airflow_home/data/$dataset/$pipeline/run_date={{ ds }}\nSOURCE_URL=$source_url CSV_OUTPUT_PATH=$airflow_home/data/$dataset/$pipeline/run_date={{ ds }}/data.csv GCS_PATH_PREFIX="gs://$destination_bucket/datasets/$dataset/$pipeline/run_date={{ ds }}/screenshots" python $airflow_home/dags/$dataset/$pipeline/custom/web_scrape_and_generate_csv.py\n',
+        bash_command='mkdir -p $airflow_home/data/$dataset/$pipeline/run_date={{ ds }}\nSOURCE_URL=$source_url SCRAPE_WORKERS=8 HTTP_CACHE_DIR=$airflow_home/data/$dataset/$pipeline/http_cache WATERMARK_FILE=$airflow_home/data/$dataset/$pipeline/watermark.json RUN_DATE={{ ds }} DOWNLOAD_PREFIX=$airflow_home/data/$dataset/$pipeline/run_date={{ ds }} MAX_IN_FLIGHT=32 BLOB_INDEX=$airflow_home/data/$dataset/$pipeline/blob_index.csv SHARD_DIR=$airflow_home/data/$dataset/$pipeline/run_date={{ ds }}/shards UPLOAD_URI="gs://$destination_bucket/datasets/$dataset/$pipeline/run_date={{ ds }}" METRICS_FILE=$airflow_home/data/$dataset/$pipeline/run_date={{ ds }}/metrics.json CSV_OUTPUT_PATH=$airflow_home/data/$dataset/$pipeline/run_date={{ ds }}/data.csv GCS_PATH_PREFIX="gs://$destination_bucket/datasets/$dataset/$pipeline/run_date={{ ds }}/screenshots" python $airflow_home/dags/$dataset/$pipeline/custom/web_scrape_and_generate_csv.py\n',
         env={
             "airflow_home": "{{ var.json.shared.airflow_home }}",
             "destination_bucket": "{{ var.json.covid19_tracking.destination_bucket }}",
@@ -46,18 +46,7 @@ with DAG(
         },
     )
 
-    # Run the custom/download_screenshots.py script to download all the screenshots to the local file system (mounted GCS)
-    download_screenshots = bash_operator.BashOperator(
-        task_id="download_screenshots",
-        bash_command='CSV_PATH=$airflow_home/data/$dataset/$pipeline/run_date={{ ds }}/data.csv \\\nSOURCE_COLUMN="source_url" \\\nDOWNLOAD_PREFIX=$airflow_home/data/$dataset/$pipeline/run_date={{ ds }} \\\npython $airflow_home/dags/$dataset/$pipeline/custom/download_screenshots.py\n',
-        env={
-            "airflow_home": "{{ var.json.shared.airflow_home }}",
-            "dataset": "covid19_tracking",
-            "pipeline": "state_screenshots",
-        },
-    )
-
-    # Upload all downloaded screenshots to the destination bucket
+    # Upload the CSV files and the shards of new screenshots to the destination bucket
     upload_screenshots_to_destination_bucket = gcs_to_gcs.GoogleCloudStorageToGoogleCloudStorageOperator(
         task_id="upload_screenshots_to_destination_bucket",
         source_bucket="{{ var.json.shared.composer_bucket }}",
@@ -67,6 +56,17 @@ with DAG(
         move_object=False,
     )
 
+    # Add the uploaded blobs to the index of archived screenshots
+    update_blob_index = bash_operator.BashOperator(
+        task_id="update_blob_index",
+        bash_command="MANIFEST_PATH=$airflow_home/data/$dataset/$pipeline/run_date={{ ds }}/manifest.csv BLOB_INDEX=$airflow_home/data/$dataset/$pipeline/blob_index.csv python $airflow_home/dags/$dataset/$pipeline/custom/blob_store.py\n",
+        env={
+            "airflow_home": "{{ var.json.shared.airflow_home }}",
+            "dataset": "covid19_tracking",
+            "pipeline": "state_screenshots",
+        },
+    )
+
     # Task to load the data from Airflow data folder to BigQuery
     load_screenshots_to_bq_table = gcs_to_bq.GoogleCloudStorageToBigQueryOperator(
         task_id="load_screenshots_to_bq_table",
@@ -75,9 +75,11 @@ with DAG(
             "data/covid19_tracking/state_screenshots/run_date={{ ds }}/data.csv"
         ],
         source_format="CSV",
-        destination_project_dataset_table="covid19_tracking.state_screenshots",
+        destination_project_dataset_table="covid19_tracking.state_screenshots${{ ds_nodash }}",
         skip_leading_rows=1,
         write_disposition="WRITE_TRUNCATE",
+        time_partitioning={"type": "DAY"},
+        schema_update_options=["ALLOW_FIELD_ADDITION"],
         schema_fields=[
             {
                 "name": "state",
@@ -121,9 +123,26 @@ with DAG(
                 "mode": "REQUIRED",
                 "description": "The GCS location where the screenshot or file was copied to",
             },
+            {
+                "name": "google_cloud_storage_member",
+                "type": "STRING",
+                "mode": "NULLABLE",
+                "description": "The name of the screenshot in the tar shard at `google_cloud_storage_uri`, when it's stored in one",
+            },
         ],
     )
 
+    # Move the per-state watermarks up to the newest loaded screenshot dates
+    update_watermark = bash_operator.BashOperator(
+        task_id="update_watermark",
+        bash_command="WATERMARK_FILE=$airflow_home/data/$dataset/$pipeline/watermark.json CSV_PATH=$airflow_home/data/$dataset/$pipeline/run_date={{ ds }}/data.csv KEY_COLUMN=state_name DATE_COLUMN=date RUN_DATE={{ ds }} DROPPED_CSV=$airflow_home/data/$dataset/$pipeline/run_date={{ ds }}/data.dropped.csv python $airflow_home/dags/$dataset/_custom/watermark.py\n",
+        env={
+            "airflow_home": "{{ var.json.shared.airflow_home }}",
+            "dataset": "covid19_tracking",
+            "pipeline": "state_screenshots",
+        },
+    )
+
     # Delete downloaded screenshots from the Cloud Composer bucket
     delete_screenshots_from_composer_bucket = (
         gcs_delete_operator.GoogleCloudStorageDeleteOperator(
@@ -133,7 +152,8 @@ with DAG(
         )
     )
 
-    generate_csv_data_from_web_scraping >> download_screenshots
-    download_screenshots >> upload_screenshots_to_destination_bucket
-    upload_screenshots_to_destination_bucket >> load_screenshots_to_bq_table
-    load_screenshots_to_bq_table >> delete_screenshots_from_composer_bucket
+    generate_csv_data_from_web_scraping >> upload_screenshots_to_destination_bucket
+    upload_screenshots_to_destination_bucket >> update_blob_index
+    update_blob_index >> load_screenshots_to_bq_table
+    load_screenshots_to_bq_table >> update_watermark
+    update_watermark >> delete_screenshots_from_composer_bucket
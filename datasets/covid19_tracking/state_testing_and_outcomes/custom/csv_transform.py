@@ -0,0 +1,48 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import pathlib
+import sys
+import typing
+
+# Shared transforms live in the dataset-level `_custom` folder
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[2] / "_custom"))
+
+import column_rules  # noqa: E402
+import columnar_transform  # noqa: E402
+import watermark  # noqa: E402
+
+
+def main(
+    source_path: typing.Optional[pathlib.Path],
+    target_path: typing.Optional[pathlib.Path],
+    transform_rules: dict,
+    since: typing.Optional[str] = None,
+):
+    # Only the days after the last loaded one are written, so the load task
+    # appends them to the date-partitioned table
+    columnar_transform.transform_csv(
+        source_path, target_path, transform_rules, since=since
+    )
+
+
+if __name__ == "__main__":
+    # Unset paths read from stdin and write to stdout
+    main(
+        source_path=columnar_transform.path_from_env("SOURCE_CSV"),
+        target_path=columnar_transform.path_from_env("TARGET_CSV"),
+        transform_rules=column_rules.from_env(),
+        since=watermark.read(columnar_transform.path_from_env("WATERMARK_FILE")),
+    )
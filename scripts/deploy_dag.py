@@ -41,6 +41,10 @@ def main(
     )
 
     print("========== AIRFLOW DAGS ==========")
+    copy_shared_callables_to_airflow_dags_folder(
+        local, env_path, dataset_id, composer_bucket, airflow_home
+    )
+
     for pipeline_path in list_subdirs(env_path / "datasets" / dataset_id):
         copy_custom_callables_to_airflow_dags_folder(
             local,
@@ -228,6 +232,47 @@ def copy_custom_callables_to_airflow_dags_folder(
         subprocess.check_call(["gsutil", "cp", "-r", "custom", target], cwd=cwd)
 
 
+def copy_shared_callables_to_airflow_dags_folder(
+    local: bool,
+    env_path: pathlib.Path,
+    dataset_id: str,
+    composer_bucket: str = None,
+    airflow_home: pathlib.Path = None,
+):
+    """
+    cd {DATASET_ID}
+
+    [local]
+    mkdir -p {AIRFLOW_HOME}/dags/DATASET_ID/_custom
+    cp -rf _custom {AIRFLOW_HOME}/dags/DATASET_ID/_custom
+
+    [remote]
+    gsutil cp -r _custom gs://{COMPOSER_BUCKET}/dags/{DATASET_ID}/
+    """
+    cwd = env_path / "datasets" / dataset_id
+
+    if not (cwd / "_custom").exists():
+        return
+
+    if local:
+        target_parent = airflow_home / "dags" / dataset_id
+        target_parent.mkdir(parents=True, exist_ok=True)
+        print(
+            f"\nCopying shared callables folder for dataset `{dataset_id}` into Airflow DAGs folder\n\n"
+            f"  Source:\n  {cwd / '_custom'}\n\n"
+            f"  Destination:\n  {target_parent / '_custom'}\n"
+        )
+        subprocess.check_call(["cp", "-rf", "_custom", str(target_parent)], cwd=cwd)
+    else:
+        target = f"gs://{composer_bucket}/dags/{dataset_id}/"
+        print(
+            f"\nCopying shared callables folder for dataset `{dataset_id}` into Cloud Composer DAG folder\n\n"
+            f"  Source:\n  {cwd / '_custom'}\n\n"
+            f"  Destination:\n  {target}\n"
+        )
+        subprocess.check_call(["gsutil", "cp", "-r", "_custom", target], cwd=cwd)
+
+
 def check_existence_of_variables_file(file_path: pathlib.Path):
     if not file_path:
         raise FileNotFoundError(f"Airflow variables file {file_path} does not exist.")
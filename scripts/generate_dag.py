@@ -33,6 +33,7 @@ OPERATORS = {
     "GoogleCloudStorageDeleteOperator",
     "BigQueryOperator",
     "KubernetesPodOperator",
+    "ShortCircuitOperator",
 }
 
 CURRENT_PATH = pathlib.Path(__file__).resolve().parent
@@ -74,6 +75,7 @@ def main(dataset_id: str, pipeline_id: str, env: str):
         pipeline_id,
         PROJECT_ROOT / f".{env}",
     )
+    copy_shared_callables_to_dot_dir(dataset_id, PROJECT_ROOT / f".{env}")
 
     print_airflow_variables(dataset_id, dag_contents, env)
     format_python_code(target_path)
@@ -98,7 +100,7 @@ def generate_package_imports(config: dict) -> str:
 
 def generate_tasks(config: dict) -> list:
     contents = []
-    for task in config["dag"]["tasks"]:
+    for task in apply_transform_output_formats(config["dag"]["tasks"]):
         contents.append(generate_task_contents(task))
     return contents
 
@@ -119,12 +121,128 @@ def generate_dag_context(config: dict, dataset_id: str) -> str:
 
 def generate_task_contents(task: dict) -> str:
     validate_task(task)
+    if task.get("transform"):
+        task = pass_transform_rules_to_env(task)
+    if task.get("download"):
+        task = pass_download_manifest_to_env(task)
+    if task["operator"] == "ShortCircuitOperator":
+        task = pass_short_circuit_condition(task)
+
     return jinja2.Template(TEMPLATE_PATHS["task"].read_text()).render(
         **task,
         namespaced_operator=AIRFLOW_IMPORTS[AIRFLOW_VERSION][task["operator"]]["class"],
     )
 
 
+def pass_transform_rules_to_env(task: dict) -> dict:
+    """Passes the task's `transform` section to its script as JSON"""
+    env = {**task["args"].get("env", {})}
+    env["TRANSFORM_RULES"] = json.dumps(task["transform"])
+    return {**task, "args": {**task["args"], "env": env}}
+
+
+def pass_download_manifest_to_env(task: dict) -> dict:
+    """Passes the task's `download` section to its script as JSON"""
+    env = {**task["args"].get("env", {})}
+    env["DOWNLOAD_MANIFEST"] = json.dumps(task["download"])
+    return {**task, "args": {**task["args"], "env": env}}
+
+
+class PythonExpression:
+    """A task argument rendered as Python code instead of a string literal"""
+
+    def __init__(self, code: str):
+        self.code = code
+
+    def __str__(self) -> str:
+        return self.code
+
+
+def pass_short_circuit_condition(task: dict) -> dict:
+    """Skips the downstream tasks when the templated `condition` renders empty.
+
+    The rendered condition is passed to `bool`, so a pipeline.yaml can
+    short-circuit on e.g. an XCom value without defining a Python callable.
+    """
+    args = {key: val for key, val in task["args"].items() if key != "condition"}
+    args["python_callable"] = PythonExpression("bool")
+    args["op_args"] = [task["args"]["condition"]]
+    return {**task, "args": args}
+
+
+def apply_transform_output_formats(tasks: list) -> list:
+    """Points the BigQuery load at the file actually written by the transform.
+
+    Parquet output is loaded from the `.parquet` object, and the transform gets
+    the column types from the load task's schema. Gzipped CSV output is loaded
+    from the `.csv.gz` object, which BigQuery decompresses on its own. Archive
+    tasks that move the CSV object move the renamed object instead.
+    """
+    renamed_transforms = [
+        task
+        for task in tasks
+        if transform_output_suffix(task.get("transform") or {}) != ".csv"
+    ]
+    if not renamed_transforms:
+        return tasks
+
+    load_tasks = [
+        task
+        for task in tasks
+        if task.get("operator") == "GoogleCloudStorageToBigQueryOperator"
+    ]
+    if len(renamed_transforms) != 1 or len(load_tasks) != 1:
+        raise ValueError(
+            "`transform.output_format: parquet` and `transform.compression` "
+            "require exactly one transform task and one "
+            "GoogleCloudStorageToBigQueryOperator task"
+        )
+
+    transform_task, load_task = renamed_transforms[0], load_tasks[0]
+    transform = transform_task["transform"]
+    suffix = transform_output_suffix(transform)
+
+    def rename(obj: str) -> str:
+        return re.sub(r"\.csv$", suffix, obj)
+
+    load_args = {**load_task["args"]}
+    load_args["source_objects"] = [rename(obj) for obj in load_args["source_objects"]]
+    if transform.get("output_format") == "parquet":
+        load_args.pop("skip_leading_rows", None)
+        load_args["source_format"] = "PARQUET"
+        column_types = {
+            field["name"]: field["type"] for field in load_args["schema_fields"]
+        }
+        transform = {**transform, "column_types": column_types}
+
+    applied = []
+    for task in tasks:
+        if task is transform_task:
+            task = {**task, "transform": transform}
+        elif task is load_task:
+            task = {**task, "args": load_args}
+        elif (
+            task.get("operator") == "GoogleCloudStorageToGoogleCloudStorageOperator"
+            and task["args"].get("source_object") in load_task["args"]["source_objects"]
+        ):
+            archive_args = {**task["args"]}
+            archive_args["source_object"] = rename(archive_args["source_object"])
+            archive_args["destination_object"] = rename(
+                archive_args["destination_object"]
+            )
+            task = {**task, "args": archive_args}
+        applied.append(task)
+    return applied
+
+
+def transform_output_suffix(transform: dict) -> str:
+    if transform.get("output_format") == "parquet":
+        return ".parquet"
+    if transform.get("compression") == "gzip":
+        return ".csv.gz"
+    return ".csv"
+
+
 def dag_init(config: dict) -> dict:
     return config["dag"].get("initialize") or config["dag"].get("init")
 
@@ -155,6 +273,15 @@ def validate_task(task: dict):
     if not task["args"].get("task_id"):
         raise KeyError(f"`args.task_id` key must exist in {task}")
 
+    if task.get("transform") and task["operator"] != "BashOperator":
+        raise ValueError("`transform` is only supported for BashOperator tasks")
+
+    if task.get("download") and task["operator"] != "BashOperator":
+        raise ValueError("`download` is only supported for BashOperator tasks")
+
+    if task["operator"] == "ShortCircuitOperator" and not task["args"].get("condition"):
+        raise KeyError(f"`args.condition` key must exist in {task}")
+
 
 def list_subdirs(path: pathlib.Path) -> typing.List[pathlib.Path]:
     """Returns a list of subdirectories"""
@@ -222,6 +349,17 @@ def copy_custom_callables_to_dot_dir(
         )
 
 
+def copy_shared_callables_to_dot_dir(dataset_id: str, env_dir: pathlib.Path):
+    """Copies the dataset-level `_custom` folder shared by all its pipelines"""
+    shared_dir = DATASETS_PATH / dataset_id / "_custom"
+    if shared_dir.exists():
+        target_dir = env_dir / "datasets" / dataset_id
+        target_dir.mkdir(parents=True, exist_ok=True)
+        subprocess.check_call(
+            ["cp", "-rf", str(shared_dir), str(target_dir)], cwd=PROJECT_ROOT
+        )
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="Generate Terraform infra code for BigQuery datasets"
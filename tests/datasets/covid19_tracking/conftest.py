@@ -0,0 +1,110 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import hashlib
+import http.server
+import pathlib
+import sys
+import threading
+
+import pytest
+
+PROJECT_ROOT = pathlib.Path(__file__).resolve().parents[3]
+DATASET_PATH = PROJECT_ROOT / "datasets" / "covid19_tracking"
+
+# The custom callables import their shared modules from the dataset's
+# `_custom` folder, the same way they do on Composer
+sys.path.append(str(DATASET_PATH / "_custom"))
+sys.path.append(str(DATASET_PATH / "state_screenshots" / "custom"))
+sys.path.append(str(DATASET_PATH / "state_screenshots" / "benchmarks"))
+
+import stand_in_server  # noqa: E402
+
+LAST_MODIFIED = "Sun, 07 Mar 2021 00:00:00 GMT"
+
+
+class SourceHandler(http.server.BaseHTTPRequestHandler):
+    """Serves the `files` of the server with validators and byte ranges"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        server = self.server
+        server.requests.append({"path": self.path, "headers": dict(self.headers)})
+        if self.path not in server.files:
+            self.respond(404, b"")
+            return
+
+        body = server.files[self.path]
+        etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.respond(304, b"", {"ETag": etag})
+            return
+
+        headers = {"ETag": etag, "Last-Modified": LAST_MODIFIED}
+        range_header = self.headers.get("Range")
+        if range_header and server.ranges:
+            start = int(range_header.split("=")[1].split("-")[0])
+            headers["Content-Range"] = f"bytes {start}-{len(body) - 1}/{len(body)}"
+            self.respond(206, body[start:], headers)
+        else:
+            self.respond(200, body, headers)
+
+    def respond(self, status: int, body: bytes, headers: dict = None) -> None:
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+class SourceServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address) -> None:
+        # Clients closing a response early reset the connection
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+@pytest.fixture
+def source_server():
+    """A local origin for the download tests, serving `server.files` by path"""
+    server = SourceServer(("127.0.0.1", 0), SourceHandler)
+    server.files = {}
+    server.requests = []
+    server.ranges = True
+    server.base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+@pytest.fixture
+def screenshots_site(request):
+    """The stand-in screenshots site, see `benchmarks/stand_in_server.py`.
+
+    It serves 3 states, unless a test passes other `serve` arguments through
+    indirect parametrization.
+    """
+    with stand_in_server.serve(**getattr(request, "param", {"states": 3})) as server:
+        yield server
@@ -0,0 +1,173 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import csv
+
+import blob_store
+import shard_store
+
+RUN_URI = "gs://bucket/datasets/covid19_tracking/state_screenshots/run_date=2021-03-07"
+
+
+def screenshot(tmp_path, name, content):
+    path = tmp_path / "downloads" / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    return path
+
+
+def test_add_stores_every_content_once(tmp_path):
+    run_dir = tmp_path / "run"
+    blobs = blob_store.BlobStore(run_dir, tmp_path / "index.csv", run_uri=RUN_URI)
+
+    sha256 = blobs.add("AL/AL-1.png", screenshot(tmp_path, "AL-1.png", b"one"))
+    assert blobs.add("AL/AL-2.png", screenshot(tmp_path, "AL-2.png", b"one")) == sha256
+    blobs.close()
+
+    assert [path.name for path in (run_dir / "blobs").iterdir()] == [f"{sha256}.png"]
+    assert not (tmp_path / "downloads" / "AL-2.png").exists()
+    assert blobs.new_blobs == 1
+    manifest = blob_store.read_manifest(run_dir / "manifest.csv")
+    assert manifest["AL/AL-2.png"]["uri"] == f"{RUN_URI}/blobs/{sha256}.png"
+    assert "AL/AL-1.png" in blobs
+
+
+def test_archived_blobs_keep_the_uri_of_the_run_that_stored_them(tmp_path):
+    first_run = blob_store.BlobStore(
+        tmp_path / "first", tmp_path / "index.csv", run_uri="gs://bucket/first"
+    )
+    sha256 = first_run.add("AL/AL-1.png", screenshot(tmp_path, "AL-1.png", b"one"))
+    first_run.close()
+    blob_store.update_index(first_run.manifest_path, tmp_path / "index.csv")
+
+    second_run = blob_store.BlobStore(
+        tmp_path / "second", tmp_path / "index.csv", run_uri="gs://bucket/second"
+    )
+    second_run.add("AK/AK-1.png", screenshot(tmp_path, "AK-1.png", b"one"))
+    second_run.close()
+
+    assert second_run.new_blobs == 0
+    assert not any((tmp_path / "second" / "blobs").iterdir())
+    assert second_run.manifest["AK/AK-1.png"]["uri"] == (
+        f"gs://bucket/first/blobs/{sha256}.png"
+    )
+    assert second_run.manifest["AK/AK-1.png"]["member"] == ""
+
+
+def test_update_index_adds_only_new_blobs(tmp_path):
+    blobs = blob_store.BlobStore(tmp_path / "run", tmp_path / "index.csv")
+    blobs.add("AL/AL-1.png", screenshot(tmp_path, "AL-1.png", b"one"))
+    blobs.add("AL/AL-2.png", screenshot(tmp_path, "AL-2.png", b"two"))
+    blobs.close()
+
+    blob_store.update_index(blobs.manifest_path, tmp_path / "index.csv")
+    blob_store.update_index(blobs.manifest_path, tmp_path / "index.csv")
+
+    index = blob_store.read_index(tmp_path / "index.csv")
+    assert len(index) == 2
+    assert len((tmp_path / "index.csv").read_text().splitlines()) == 3
+
+
+def test_retried_run_reads_its_manifest(tmp_path):
+    run_dir = tmp_path / "run"
+    blobs = blob_store.BlobStore(run_dir, tmp_path / "index.csv")
+    blobs.add("AL/AL-1.png", screenshot(tmp_path, "AL-1.png", b"one"))
+    blobs.close()
+
+    retried = blob_store.BlobStore(run_dir, tmp_path / "index.csv")
+    retried.close()
+    assert "AL/AL-1.png" in retried
+
+
+def test_sharded_blobs_point_at_their_shard(tmp_path):
+    run_dir = tmp_path / "run"
+    shards = shard_store.ShardWriter(run_dir / "shards")
+    blobs = blob_store.BlobStore(run_dir, tmp_path / "index.csv", shards, RUN_URI)
+
+    sha256 = blobs.add("AL/AL-1.png", screenshot(tmp_path, "AL-1.png", b"one"))
+    shards.close()
+    blobs.close()
+
+    assert blobs.manifest["AL/AL-1.png"]["uri"] == f"{RUN_URI}/shards/AL.tar"
+    assert blobs.manifest["AL/AL-1.png"]["member"] == f"{sha256}.png"
+    assert shard_store.read_member(run_dir / "shards" / "AL.tar", f"{sha256}.png") == (
+        b"one"
+    )
+
+
+def test_write_locations_points_rows_at_their_blobs(tmp_path):
+    csv_path = tmp_path / "data.csv"
+    with open(csv_path, "w") as csv_file:
+        writer = csv.DictWriter(
+            csv_file,
+            fieldnames=[
+                "state",
+                "source_url",
+                "google_cloud_storage_uri",
+                "google_cloud_storage_member",
+            ],
+        )
+        writer.writeheader()
+        for name in ["AL-1.png", "AL-2.png"]:
+            writer.writerow(
+                {
+                    "state": "AL",
+                    "source_url": f"https://covidtracking.com/screenshots/AL/{name}",
+                    "google_cloud_storage_uri": f"gs://bucket/screenshots/AL/{name}",
+                    "google_cloud_storage_member": "",
+                }
+            )
+    manifest = {
+        "AL/AL-1.png": {
+            "sha256": "ab",
+            "uri": "gs://bucket/run/shards/AL.tar",
+            "member": "ab.png",
+        }
+    }
+
+    blob_store.write_locations(csv_path, "source_url", manifest)
+
+    with open(csv_path) as csv_file:
+        rows = list(csv.DictReader(csv_file))
+    # The second screenshot failed to download, so its row is dropped
+    assert rows == [
+        {
+            "state": "AL",
+            "source_url": "https://covidtracking.com/screenshots/AL/AL-1.png",
+            "google_cloud_storage_uri": "gs://bucket/run/shards/AL.tar",
+            "google_cloud_storage_member": "ab.png",
+        }
+    ]
+    with open(tmp_path / "data.dropped.csv") as csv_file:
+        dropped_rows = list(csv.DictReader(csv_file))
+    assert [row["source_url"] for row in dropped_rows] == [
+        "https://covidtracking.com/screenshots/AL/AL-2.png"
+    ]
+
+
+def test_sharded_blobs_archived_earlier_keep_their_member(tmp_path):
+    first_dir = tmp_path / "first"
+    shards = shard_store.ShardWriter(first_dir / "shards")
+    first_run = blob_store.BlobStore(
+        first_dir, tmp_path / "index.csv", shards, "gs://bucket/first"
+    )
+    sha256 = first_run.add("AL/AL-1.png", screenshot(tmp_path, "AL-1.png", b"one"))
+    shards.close()
+    first_run.close()
+    blob_store.update_index(first_run.manifest_path, tmp_path / "index.csv")
+
+    assert blob_store.read_index(tmp_path / "index.csv") == {
+        sha256: {"uri": "gs://bucket/first/shards/AL.tar", "member": f"{sha256}.png"}
+    }
@@ -0,0 +1,110 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import json
+
+import column_rules
+import pytest
+
+CONFIG = {
+    "columns": [
+        {"index": 0, "rules": ["yyyymmdd_to_iso"]},
+        {"index": 2, "rules": [{"replace": {"x": "y"}}]},
+        {
+            "from_index": 4,
+            "rules": [
+                {"null_values": ["N/A"]},
+                {"null_prefixes": ["<", "~"]},
+                "thousands_separator",
+                {"replace": {"7/1": 7}},
+            ],
+        },
+    ]
+}
+
+
+def test_compile_rules_matches_columns_by_index_and_from_index():
+    column_op = column_rules.compile_rules(CONFIG)
+
+    assert column_op(0)("20210307") == "2021-03-07"
+    assert column_op(1) is None
+    assert column_op(2)("x") == "y"
+    assert column_op(3) is None
+    assert column_op(4) is column_op(9)
+
+
+def test_compile_rules_without_index_matches_every_column():
+    column_op = column_rules.compile_rules(
+        {"columns": [{"rules": ["thousands_separator"]}]}
+    )
+
+    assert column_op(0)("1,234") == 1234
+    assert column_op(7)("1,234") == 1234
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("N/A", ""),
+        ("<5", ""),
+        ("~12", ""),
+        ("1,234", 1234),
+        ("7/1", 7),
+        ("42", "42"),
+        ("", ""),
+    ],
+)
+def test_chain_applies_the_first_matching_rule(value, expected):
+    op = column_rules.compile_rules(CONFIG)(4)
+
+    assert op(value) == expected
+
+
+def test_chain_stops_at_a_rule_that_returns_an_equal_value():
+    # "N/A" is replaced by an equal but new string, which still counts as a match
+    op = column_rules.chain(
+        [{"replace": {"N/A": "".join(["N", "/", "A"])}}, {"null_values": ["N/A"]}]
+    )
+
+    assert op("N/A") == "N/A"
+
+
+def test_chain_keeps_values_no_rule_applies_to():
+    op = column_rules.chain([{"null_values": ["N/A"]}, {"replace": {"a": "b"}}])
+
+    assert op("c") == "c"
+
+
+@pytest.mark.parametrize("rule", ["not_a_rule", {"a": 1, "b": 2}, 3])
+def test_build_rule_rejects_unknown_rules(rule):
+    with pytest.raises(ValueError):
+        column_rules.build_rule(rule)
+
+
+def test_from_env_reads_the_rules(monkeypatch):
+    monkeypatch.setenv("TRANSFORM_RULES", json.dumps(CONFIG))
+
+    assert column_rules.from_env() == CONFIG
+
+
+@pytest.mark.parametrize("value", [None, "", "{not json"])
+def test_from_env_names_the_variable_on_errors(monkeypatch, value):
+    if value is None:
+        monkeypatch.delenv("TRANSFORM_RULES", raising=False)
+    else:
+        monkeypatch.setenv("TRANSFORM_RULES", value)
+
+    with pytest.raises(ValueError, match="TRANSFORM_RULES"):
+        column_rules.from_env()
@@ -0,0 +1,88 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import json
+
+import column_stats
+import columnar_transform
+
+
+def test_update_collects_nulls_dates_and_numbers_across_batches():
+    stats = column_stats.ColumnStats(["date", "cases", "notes"])
+
+    stats.update([("2020-03-02", 1234, ""), ("2020-03-01", "", "a")])
+    stats.update([("2020-03-05", "5.5", "b"), ("2020-03-03", "-3", "")])
+    stats.update([])
+
+    assert stats.to_dict() == {
+        "rows": 4,
+        "columns": {
+            "date": {"nulls": 0, "min_date": "2020-03-01", "max_date": "2020-03-05"},
+            "cases": {"nulls": 1, "min": -3, "max": 1234},
+            "notes": {"nulls": 2},
+        },
+    }
+
+
+def test_update_counts_the_missing_cells_of_short_rows_as_nulls():
+    stats = column_stats.ColumnStats(["date", "cases"])
+
+    stats.update([("2020-03-01", "1"), ("2020-03-02",)])
+
+    assert stats.to_dict()["columns"]["cases"] == {"nulls": 1, "min": 1, "max": 1}
+
+
+def test_classify_skips_text_and_non_finite_numbers():
+    numbers, dates = column_stats.classify(
+        ["12", "1.5", "1e3", "nan", "inf", "N/A", "", "2020-13-01", float("nan")]
+    )
+
+    assert sorted(numbers) == [1.5, 12, 1000.0]
+    assert dates == ["2020-13-01"]
+
+
+def test_transform_csv_writes_the_sidecar_when_asked(tmp_path):
+    source_path = tmp_path / "source.csv"
+    source_path.write_text('date,cases\n20200301,"1,234"\n20200302,N/A\n')
+    target_path = tmp_path / "target.csv"
+    rules = {
+        "columns": [
+            {"index": 0, "rules": ["yyyymmdd_to_iso"]},
+            {"index": 1, "rules": [{"null_values": ["N/A"]}, "thousands_separator"]},
+        ],
+        "stats": True,
+    }
+
+    columnar_transform.transform_csv(source_path, target_path, rules)
+
+    sidecar = json.loads(column_stats.sidecar_path(target_path).read_text())
+    assert column_stats.sidecar_path(target_path).name == "target.csv.stats.json"
+    assert sidecar == {
+        "rows": 2,
+        "columns": {
+            "date": {"nulls": 0, "min_date": "2020-03-01", "max_date": "2020-03-02"},
+            "cases": {"nulls": 1, "min": 1234, "max": 1234},
+        },
+    }
+
+
+def test_transform_csv_skips_the_sidecar_by_default(tmp_path):
+    source_path = tmp_path / "source.csv"
+    source_path.write_text("date\n20200301\n")
+    target_path = tmp_path / "target.csv"
+
+    columnar_transform.transform_csv(source_path, target_path, {"columns": []})
+
+    assert not column_stats.sidecar_path(target_path).exists()
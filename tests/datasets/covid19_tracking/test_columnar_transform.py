@@ -0,0 +1,251 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import csv
+import gzip
+import io
+import json
+import os
+import pathlib
+import subprocess
+import sys
+
+import column_rules
+import columnar_transform
+import pytest
+
+PROJECT_ROOT = pathlib.Path(__file__).resolve().parents[3]
+DATASET_PATH = PROJECT_ROOT / "datasets" / "covid19_tracking"
+
+RULES = {
+    "columns": [
+        {"index": 0, "rules": ["yyyymmdd_to_iso"]},
+        {"from_index": 2, "rules": [{"null_values": ["N/A"]}, "thousands_separator"]},
+    ]
+}
+
+SOURCE = (
+    "date,state,cases,deaths\n"
+    '20210305,AL,"1,234",N/A\n'
+    '20210306,AL,"2,345",12\n'
+    '20210307,AL,N/A,"1,013"\n'
+)
+
+
+def read_batches(text: str, batch_rows: int, max_batch_bytes: int) -> list:
+    lines = columnar_transform.CountedLines(io.StringIO(text))
+    return list(
+        columnar_transform.read_batches(
+            csv.reader(lines), lines, batch_rows, max_batch_bytes
+        )
+    )
+
+
+def test_read_batches_caps_the_rows_of_a_batch():
+    batches = read_batches("a\nb\nc\nd\ne\n", batch_rows=2, max_batch_bytes=1000)
+
+    assert batches == [[["a"], ["b"]], [["c"], ["d"]], [["e"]]]
+
+
+def test_read_batches_caps_the_text_of_a_batch():
+    batches = read_batches("aaaa\nbbbb\ncccc\n", batch_rows=100, max_batch_bytes=8)
+
+    assert batches == [[["aaaa"], ["bbbb"]], [["cccc"]]]
+
+
+def test_read_batches_keeps_a_quoted_field_spanning_lines_whole():
+    batches = read_batches('"a\nb\nc",1\nd,2\n', batch_rows=100, max_batch_bytes=2)
+
+    assert batches == [[["a\nb\nc", "1"]], [["d", "2"]]]
+
+
+def test_transform_batch_converts_columns():
+    ops_for_width = columnar_transform.column_plan(
+        column_rules.compile_rules(RULES), set()
+    )
+    rows = [["20210306", "AL", "1,234", "N/A"], ["20210307", "AK", "5", "1,013"]]
+
+    assert list(columnar_transform.transform_batch(rows, ops_for_width)) == [
+        ("2021-03-06", "AL", 1234, ""),
+        ("2021-03-07", "AK", "5", 1013),
+    ]
+
+
+def test_transform_batch_converts_ragged_and_blank_rows_one_by_one():
+    ops_for_width = columnar_transform.column_plan(
+        column_rules.compile_rules(RULES), {1}
+    )
+    rows = [["20210306", "AL", "1,234", "N/A"], [], ["20210307", "AK", "1,013"]]
+
+    assert list(columnar_transform.transform_batch(rows, ops_for_width)) == [
+        ["2021-03-06", 1234, ""],
+        [],
+        ["2021-03-07", 1013],
+    ]
+
+
+def test_map_distinct_matches_map():
+    op = column_rules.compile_rules(RULES)(2)
+    column = ["1,234", "N/A", "1,234", "N/A", "1,234", "7"]
+
+    assert list(columnar_transform.map_distinct(op, column)) == list(map(op, column))
+
+
+@pytest.mark.parametrize("batch_rows", [1, 2, 10000])
+def test_transform_csv_output_does_not_depend_on_the_batches(tmp_path, batch_rows):
+    source_path = tmp_path / "source.csv"
+    source_path.write_text(SOURCE + "20210308,AL\n")
+    target_path = tmp_path / "target.csv"
+
+    columnar_transform.transform_csv(
+        source_path, target_path, {**RULES, "batch_rows": batch_rows}
+    )
+
+    assert target_path.read_text() == (
+        "date,state,cases,deaths\n"
+        "2021-03-05,AL,1234,\n"
+        "2021-03-06,AL,2345,12\n"
+        "2021-03-07,AL,,1013\n"
+        "2021-03-08,AL\n"
+    )
+
+
+def test_transform_csv_writes_the_rows_dated_after_since(tmp_path):
+    source_path = tmp_path / "source.csv"
+    source_path.write_text(SOURCE)
+    target_path = tmp_path / "target.csv"
+    rules = {**RULES, "incremental": {"date_column": "date"}, "batch_rows": 2}
+
+    columnar_transform.transform_csv(
+        source_path, target_path, rules, since="2021-03-05"
+    )
+
+    assert target_path.read_text().splitlines() == [
+        "date,state,cases,deaths",
+        "2021-03-06,AL,2345,12",
+        "2021-03-07,AL,,1013",
+    ]
+
+
+def test_date_filter_finds_the_date_column_past_dropped_columns():
+    rules = {
+        "columns": [{"index": 1, "rules": ["yyyymmdd_to_iso"]}],
+        "incremental": {"date_column": "date"},
+    }
+    newer_rows = columnar_transform.date_filter(
+        rules, column_rules.compile_rules(rules), ["date", "state"], {0}, "2021-03-06"
+    )
+
+    rows = [["x", "20210306", "AL"], ["x", "20210307", "AL"], ["x"]]
+    assert newer_rows(rows) == [["x", "20210307", "AL"]]
+
+
+def test_date_filter_requires_a_known_date_column():
+    column_op = column_rules.compile_rules(RULES)
+
+    with pytest.raises(ValueError, match="incremental"):
+        columnar_transform.date_filter(RULES, column_op, ["date"], set(), "2021-03-06")
+    with pytest.raises(ValueError, match="day"):
+        columnar_transform.date_filter(
+            {**RULES, "incremental": {"date_column": "day"}},
+            column_op,
+            ["date"],
+            set(),
+            "2021-03-06",
+        )
+
+
+def test_stream_settings_must_be_positive():
+    with pytest.raises(ValueError, match="batch_rows"):
+        columnar_transform.stream_settings({"batch_rows": 0})
+
+
+def run_filter(script_path, source, rules, cwd, **env) -> bytes:
+    env = {**os.environ, "TRANSFORM_RULES": json.dumps(rules), **env}
+    result = subprocess.run(
+        [sys.executable, str(script_path)],
+        input=source.encode(),
+        capture_output=True,
+        cwd=cwd,
+        env=env,
+        check=True,
+    )
+    return result.stdout
+
+
+@pytest.mark.parametrize("path", [None, "-"])
+def test_script_filters_stdin_to_stdout(tmp_path, path):
+    env = {} if path is None else {"SOURCE_CSV": path, "TARGET_CSV": path}
+    script_path = DATASET_PATH / "covid_racial_data_tracker/custom/transform_dates.py"
+
+    stdout = run_filter(script_path, SOURCE, {**RULES, "stats": True}, tmp_path, **env)
+
+    assert stdout.decode().splitlines() == [
+        "date,state,cases,deaths",
+        "2021-03-05,AL,1234,",
+        "2021-03-06,AL,2345,12",
+        "2021-03-07,AL,,1013",
+    ]
+    # There's no target file to put the statistics next to
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_script_gzips_to_stdout(tmp_path):
+    script_path = DATASET_PATH / "covid_racial_data_tracker/custom/transform_dates.py"
+    rules = {**RULES, "compression": "gzip", "stats": True}
+
+    stdout = run_filter(script_path, SOURCE, rules, tmp_path)
+
+    assert gzip.decompress(stdout).decode().splitlines()[1] == "2021-03-05,AL,1234,"
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_stdout_stays_open_and_in_order_around_the_csv(tmp_path):
+    # Printed text comes out before the CSV, and stdout can still be written
+    # to once the transform closed its own file on the descriptor
+    code = (
+        "import columnar_transform, sys\n"
+        "print('before')\n"
+        f"columnar_transform.transform_csv(None, None, {RULES!r})\n"
+        "print('after')\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        input=SOURCE.encode(),
+        capture_output=True,
+        cwd=tmp_path,
+        env={**os.environ, "PYTHONPATH": str(DATASET_PATH / "_custom")},
+        check=True,
+    )
+
+    lines = result.stdout.decode().splitlines()
+    assert lines[0] == "before"
+    assert lines[1] == "date,state,cases,deaths"
+    assert lines[-1] == "after"
+    assert len(lines) == 6
+
+
+@pytest.mark.parametrize(
+    "value, expected", [(None, None), ("-", None), ("a.csv", "a.csv")]
+)
+def test_path_from_env_reads_unset_and_dash_as_stdio(monkeypatch, value, expected):
+    if value is None:
+        monkeypatch.delenv("SOURCE_CSV", raising=False)
+    else:
+        monkeypatch.setenv("SOURCE_CSV", value)
+
+    path = columnar_transform.path_from_env("SOURCE_CSV")
+
+    assert path == (None if expected is None else pathlib.Path(expected))
@@ -0,0 +1,147 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import json
+import logging
+import socket
+import time
+
+import download_metrics
+import downloader
+import http_cache
+import pytest
+
+SUMMARY = {
+    "seconds": 2.0,
+    "files": 3,
+    "bytes": 300,
+    "failures": 1,
+    "files_per_second": 1.5,
+    "bytes_per_second": 150.0,
+    "requests": 4,
+    "retries": 0,
+    "latency_seconds": {"p50": 0.012, "p95": 0.0485, "p99": 0.1},
+    "cache": {"hits": 2, "misses": 1, "bytes_served": 20},
+}
+
+
+@pytest.mark.parametrize(
+    "values, p, expected",
+    [
+        ([], 50, 0.0),
+        ([7.0], 99, 7.0),
+        ([1.0, 2.0, 3.0, 4.0], 50, 2.0),
+        ([1.0, 2.0, 3.0, 4.0], 95, 4.0),
+        ([float(n) for n in range(1, 11)], 50, 5.0),
+        ([float(n) for n in range(1, 11)], 95, 10.0),
+        ([float(n) for n in range(1, 101)], 99, 99.0),
+        ([1.0, 2.0], 0, 1.0),
+    ],
+)
+def test_percentile_is_the_nearest_rank(values, p, expected):
+    assert download_metrics.percentile(values, p) == expected
+
+
+def test_summary_counts_files_requests_and_cache_hits(tmp_path):
+    metrics = download_metrics.Metrics()
+    metrics.started_at = time.monotonic() - 2
+    for latency in [0.3, 0.1, 0.2]:
+        metrics.record_request(latency)
+    metrics.record_retry()
+    metrics.record_file(100)
+    metrics.record_file(50)
+    metrics.record_failures(2)
+    cache = http_cache.Cache(tmp_path)
+    cache.miss()
+
+    summary = metrics.summary(cache)
+
+    assert summary["files"] == 2
+    assert summary["bytes"] == 150
+    assert summary["failures"] == 2
+    assert summary["requests"] == 3
+    assert summary["retries"] == 1
+    assert summary["latency_seconds"] == {"p50": 0.2, "p95": 0.3, "p99": 0.3}
+    assert summary["cache"] == {"hits": 0, "misses": 1, "bytes_served": 0}
+    assert summary["files_per_second"] == pytest.approx(1, rel=0.05)
+    assert summary["bytes_per_second"] == pytest.approx(75, rel=0.05)
+
+
+def test_statsd_lines_are_gauges_with_latencies_in_milliseconds():
+    assert download_metrics.statsd_lines("covid19_tracking.test", SUMMARY) == [
+        "covid19_tracking.test.seconds:2.0|g",
+        "covid19_tracking.test.files:3|g",
+        "covid19_tracking.test.bytes:300|g",
+        "covid19_tracking.test.failures:1|g",
+        "covid19_tracking.test.files_per_second:1.5|g",
+        "covid19_tracking.test.bytes_per_second:150.0|g",
+        "covid19_tracking.test.requests:4|g",
+        "covid19_tracking.test.retries:0|g",
+        "covid19_tracking.test.latency_ms.p50:12.0|g",
+        "covid19_tracking.test.latency_ms.p95:48.5|g",
+        "covid19_tracking.test.latency_ms.p99:100.0|g",
+        "covid19_tracking.test.cache.hits:2|g",
+        "covid19_tracking.test.cache.misses:1|g",
+        "covid19_tracking.test.cache.bytes_served:20|g",
+    ]
+
+
+def test_statsd_lines_without_prefix():
+    summary = {"files": 1, "latency_seconds": {"p50": 0.001}}
+
+    assert download_metrics.statsd_lines("", summary) == [
+        "files:1|g",
+        "latency_ms.p50:1.0|g",
+    ]
+
+
+def test_send_statsd_sends_one_datagram():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as statsd:
+        statsd.bind(("127.0.0.1", 0))
+        statsd.settimeout(5)
+        port = statsd.getsockname()[1]
+
+        download_metrics.send_statsd(f"127.0.0.1:{port}", "prefix", SUMMARY)
+
+        datagram = statsd.recv(65536).decode()
+    assert datagram.splitlines() == download_metrics.statsd_lines("prefix", SUMMARY)
+
+
+@pytest.mark.parametrize(
+    "address", ["statsd.invalid:8125", "localhost:70000", "localhost", "localhost:x"]
+)
+def test_send_statsd_only_logs_failures(address, caplog):
+    with caplog.at_level(logging.WARNING):
+        download_metrics.send_statsd(address, "prefix", SUMMARY)
+
+    assert f"StatsD at {address} failed" in caplog.text
+
+
+def test_unreachable_statsd_does_not_fail_the_download(source_server, tmp_path):
+    source_server.files["/a.csv"] = b"a\n1\n"
+    metrics_path = tmp_path / "metrics.json"
+
+    downloader.main(
+        tmp_path / "data",
+        {
+            "base_url": f"{source_server.base_url}/",
+            "files": [{"url": "a.csv", "target": "a.csv"}],
+        },
+        metrics_path=metrics_path,
+        statsd_address="statsd.invalid:8125",
+    )
+
+    assert (tmp_path / "data" / "a.csv").read_bytes() == b"a\n1\n"
+    assert json.loads(metrics_path.read_text())["files"] == 1
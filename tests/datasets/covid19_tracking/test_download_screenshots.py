@@ -0,0 +1,38 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import download_screenshots
+import pytest
+import shard_store
+
+
+def test_partial_dir_cant_be_used_with_shards(tmp_path):
+    shards = shard_store.ShardWriter(tmp_path / "shards")
+    try:
+        with pytest.raises(ValueError, match="PARTIAL_DIR"):
+            download_screenshots.download_rows(
+                [], "source_url", tmp_path, partial_dir=tmp_path, shards=shards
+            )
+    finally:
+        shards.close()
+
+    with pytest.raises(ValueError, match="SHARD_DIR"):
+        download_screenshots.main(
+            tmp_path / "data.csv",
+            "source_url",
+            str(tmp_path),
+            partial_dir=tmp_path / "partial",
+            shard_dir=tmp_path / "shards",
+        )
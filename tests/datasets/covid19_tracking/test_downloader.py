@@ -0,0 +1,96 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import hashlib
+import json
+import pathlib
+
+import downloader
+import pytest
+import resumable_download
+
+
+def test_download_jobs_resolve_urls_and_drop_repeated_entries():
+    manifest = {
+        "base_url": "https://example.com/data/",
+        "files": [
+            {"url": "a.csv", "target": "raw-a.csv"},
+            {"url": "https://mirror.example.com/b.csv", "target": "raw-b.csv"},
+            {"url": "a.csv", "target": "raw-a.csv"},
+        ],
+    }
+
+    assert downloader.download_jobs(pathlib.Path("/data"), manifest) == [
+        ("https://example.com/data/a.csv", pathlib.Path("/data/raw-a.csv"), None),
+        ("https://mirror.example.com/b.csv", pathlib.Path("/data/raw-b.csv"), None),
+    ]
+
+
+@pytest.mark.parametrize(
+    "second",
+    [
+        {"url": "b.csv", "target": "raw-a.csv"},
+        {"url": "a.csv", "target": "raw-a.csv", "sha256": "ab"},
+    ],
+)
+def test_download_jobs_reject_conflicting_targets(second):
+    manifest = {"files": [{"url": "a.csv", "target": "raw-a.csv"}, second]}
+
+    with pytest.raises(ValueError, match="raw-a.csv"):
+        downloader.download_jobs(pathlib.Path("/data"), manifest)
+
+
+def test_main_downloads_every_file_of_the_manifest_once(source_server, tmp_path):
+    files = {f"/{state}.csv": f"state\n{state}\n".encode() for state in "abcde"}
+    source_server.files = files
+    manifest = {
+        "base_url": f"{source_server.base_url}/",
+        "max_workers": 3,
+        "files": [
+            {
+                "url": path.lstrip("/"),
+                "target": f"raw/{path.lstrip('/')}",
+                "sha256": hashlib.sha256(body).hexdigest(),
+            }
+            for path, body in files.items()
+        ],
+    }
+    manifest["files"].append(manifest["files"][0])
+    metrics_path = tmp_path / "metrics.json"
+
+    downloader.main(tmp_path / "data", manifest, metrics_path)
+
+    for path, body in files.items():
+        assert (tmp_path / "data" / "raw" / path.lstrip("/")).read_bytes() == body
+    assert sorted(request["path"] for request in source_server.requests) == sorted(
+        files
+    )
+    assert not list((tmp_path / "data").glob("**/*.part"))
+    assert json.loads(metrics_path.read_text())["files"] == len(files)
+
+
+def test_main_fails_on_a_missing_file(source_server, tmp_path):
+    source_server.files = {"/a.csv": b"a\n"}
+    manifest = {
+        "base_url": f"{source_server.base_url}/",
+        "files": [
+            {"url": "a.csv", "target": "a.csv"},
+            {"url": "missing.csv", "target": "missing.csv"},
+        ],
+    }
+
+    with pytest.raises(resumable_download.requests.exceptions.HTTPError):
+        downloader.main(tmp_path, manifest)
+    assert not (tmp_path / "missing.csv").exists()
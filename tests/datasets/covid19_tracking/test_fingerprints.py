@@ -0,0 +1,116 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import json
+
+import downloader
+import fingerprints
+import http_client
+
+
+def fetch(server, tmp_path, known=None, conditional=True):
+    with http_client.session(1) as http:
+        return fingerprints.fetch(
+            http,
+            f"{server.base_url}/data.csv",
+            tmp_path / "raw-data.csv",
+            known or {},
+            conditional,
+        )
+
+
+def test_fetch_hashes_the_source_and_keeps_its_validators(source_server, tmp_path):
+    source_server.files["/data.csv"] = b"date,state\n20210307,AL\n"
+
+    fingerprint = fetch(source_server, tmp_path)
+
+    assert (tmp_path / "raw-data.csv").read_bytes() == b"date,state\n20210307,AL\n"
+    assert not (tmp_path / "raw-data.csv.part").exists()
+    assert fingerprint["size"] == 23
+    assert len(fingerprint["sha256"]) == 64
+    assert fingerprint["etag"]
+    assert fingerprint["last_modified"]
+
+
+def test_fetch_returns_none_when_not_modified(source_server, tmp_path):
+    source_server.files["/data.csv"] = b"date,state\n"
+    known = fetch(source_server, tmp_path)
+    (tmp_path / "raw-data.csv").write_bytes(b"kept")
+
+    assert fetch(source_server, tmp_path, known) is None
+    assert source_server.requests[-1]["headers"]["If-None-Match"] == known["etag"]
+    assert (tmp_path / "raw-data.csv").read_bytes() == b"kept"
+
+
+def test_fetch_downloads_again_unless_conditional(source_server, tmp_path):
+    source_server.files["/data.csv"] = b"date,state\n"
+    known = fetch(source_server, tmp_path)
+
+    assert fetch(source_server, tmp_path, known, conditional=False) == known
+    assert "If-None-Match" not in source_server.requests[-1]["headers"]
+
+
+def test_record_stages_changed_sources_until_committed(tmp_path):
+    store_path = tmp_path / "fingerprints.json"
+    fingerprint = {"sha256": "ab", "size": 2, "etag": '"1"', "last_modified": None}
+
+    assert fingerprints.record(store_path, {"http://a": fingerprint})
+    assert fingerprints.load(store_path) == {}
+
+    fingerprints.commit(store_path)
+    assert fingerprints.load(store_path) == {"http://a": fingerprint}
+    assert not fingerprints.staging_path(store_path).exists()
+
+
+def test_record_keeps_refreshed_validators_of_unchanged_sources(tmp_path):
+    store_path = tmp_path / "fingerprints.json"
+    known = {"sha256": "ab", "size": 2, "etag": '"1"', "last_modified": None}
+    store_path.write_text(json.dumps({"http://a": known}))
+    refreshed = {**known, "etag": '"2"'}
+
+    assert not fingerprints.record(store_path, {"http://a": refreshed})
+    assert fingerprints.load(store_path) == {"http://a": refreshed}
+    assert not fingerprints.staging_path(store_path).exists()
+
+
+def test_downloader_reports_whether_any_file_changed(source_server, tmp_path, capsys):
+    source_server.files = {"/a.csv": b"a\n1\n", "/b.csv": b"b\n2\n"}
+    manifest = {
+        "base_url": f"{source_server.base_url}/",
+        "files": [
+            {"url": "a.csv", "target": "raw-a.csv"},
+            {"url": "b.csv", "target": "raw-b.csv"},
+        ],
+    }
+    store_path = tmp_path / "fingerprints.json"
+    target_dir = tmp_path / "data"
+    target_dir.mkdir()
+
+    downloader.main(target_dir, manifest, fingerprint_path=store_path)
+    assert capsys.readouterr().out.splitlines()[-1] == "changed"
+    fingerprints.commit(store_path)
+
+    # The files are still there, so both requests are conditional
+    downloader.main(target_dir, manifest, fingerprint_path=store_path)
+    assert capsys.readouterr().out.splitlines()[-1] == "unchanged"
+    assert all("If-None-Match" in r["headers"] for r in source_server.requests[-2:])
+
+    # A changed file is downloaded, and the moved one again without validators
+    source_server.files["/a.csv"] = b"a\n3\n"
+    (target_dir / "raw-b.csv").unlink()
+    downloader.main(target_dir, manifest, fingerprint_path=store_path)
+    assert capsys.readouterr().out.splitlines()[-1] == "changed"
+    assert (target_dir / "raw-a.csv").read_bytes() == b"a\n3\n"
+    assert (target_dir / "raw-b.csv").read_bytes() == b"b\n2\n"
@@ -0,0 +1,93 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+
+import http_cache
+import http_client
+import pytest
+
+
+def get(server, cache, path="/page.html", **kwargs):
+    with http_client.session(1, cache=cache) as http:
+        response = http.get(f"{server.base_url}{path}", **kwargs)
+        response.content
+        return response
+
+
+def test_unmodified_page_is_served_from_the_cache(source_server, tmp_path):
+    source_server.files["/page.html"] = b"<html>AL</html>"
+    cache = http_cache.Cache(tmp_path)
+
+    first = get(source_server, cache)
+    second = get(source_server, cache)
+
+    assert "If-None-Match" not in source_server.requests[0]["headers"]
+    assert (
+        source_server.requests[1]["headers"]["If-None-Match"] == first.headers["ETag"]
+    )
+    assert second.status_code == 200
+    assert second.reason == "OK (cached)"
+    assert second.content == b"<html>AL</html>"
+    assert (cache.hits, cache.misses, cache.bytes_served) == (1, 1, 15)
+
+
+def test_modified_page_replaces_the_cached_one(source_server, tmp_path):
+    source_server.files["/page.html"] = b"old"
+    cache = http_cache.Cache(tmp_path)
+    get(source_server, cache)
+
+    source_server.files["/page.html"] = b"new"
+    assert get(source_server, cache).content == b"new"
+    assert get(source_server, cache).content == b"new"
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_streamed_and_failed_responses_are_not_cached(source_server, tmp_path):
+    source_server.files["/image.png"] = b"png"
+    cache = http_cache.Cache(tmp_path)
+
+    get(source_server, cache, "/image.png", stream=True)
+    get(source_server, cache, "/missing.html")
+
+    assert list(tmp_path.iterdir()) == []
+    assert cache.lookup(f"{source_server.base_url}/missing.html") is None
+
+
+def test_evict_drops_the_least_recently_used_entries(source_server, tmp_path):
+    source_server.files = {"/a.html": b"a" * 10, "/b.html": b"b" * 10}
+    cache = http_cache.Cache(tmp_path, max_bytes=15)
+    get(source_server, cache, "/a.html")
+    a_body = cache.paths(f"{source_server.base_url}/a.html")[1]
+    os.utime(a_body, (0, 0))
+
+    get(source_server, cache, "/b.html")
+
+    assert cache.lookup(f"{source_server.base_url}/a.html") is None
+    assert cache.lookup(f"{source_server.base_url}/b.html") is not None
+
+
+def test_cache_evicts_down_to_a_lowered_cap(tmp_path):
+    (tmp_path / "entry.body").write_bytes(b"x" * 10)
+    (tmp_path / "entry.json").write_text("{}")
+
+    http_cache.Cache(tmp_path, max_bytes=5)
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_cache_requires_a_positive_cap(tmp_path):
+    with pytest.raises(ValueError, match="max_bytes"):
+        http_cache.Cache(tmp_path, max_bytes=0)
@@ -0,0 +1,102 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import datetime
+
+import pytest
+
+pq = pytest.importorskip("pyarrow.parquet")
+parquet_output = pytest.importorskip("parquet_output")
+
+
+@pytest.mark.parametrize(
+    "value, expected", [("1", 1), ("1.0", 1), ("-3.00", -3), ("1e3", 1000), (7, 7)]
+)
+def test_to_int_accepts_whole_numbers(value, expected):
+    assert parquet_output.to_int(value) == expected
+
+
+@pytest.mark.parametrize("value", ["1.5", "N/A", "NaN"])
+def test_to_int_rejects_other_values(value):
+    with pytest.raises((ValueError, ArithmeticError)):
+        parquet_output.to_int(value)
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("true", True),
+        ("T", True),
+        ("1", True),
+        ("False", False),
+        ("f", False),
+        ("0", False),
+    ],
+)
+def test_to_bool_accepts_the_bigquery_spellings(value, expected):
+    assert parquet_output.to_bool(value) is expected
+
+
+@pytest.mark.parametrize("value", ["yes", "tru", "2", "N/A"])
+def test_to_bool_rejects_other_values(value):
+    with pytest.raises(ValueError, match="boolean"):
+        parquet_output.to_bool(value)
+
+
+def test_writer_writes_typed_columns_with_nulls(tmp_path):
+    target_path = tmp_path / "data.parquet"
+    column_types = {"date": "DATE", "state": "STRING", "cases": "INTEGER"}
+
+    with parquet_output.ParquetWriter(
+        target_path, list(column_types), column_types
+    ) as writer:
+        writer.writerows([["2021-03-07", "AL", "1.0"], ["2021-03-06", "AK", ""]])
+        writer.writerows([["2021-03-05", "AZ", 1234]])
+
+    assert pq.read_table(target_path).to_pydict() == {
+        "date": [
+            datetime.date(2021, 3, 7),
+            datetime.date(2021, 3, 6),
+            datetime.date(2021, 3, 5),
+        ],
+        "state": ["AL", "AK", "AZ"],
+        "cases": [1, None, 1234],
+    }
+
+
+def test_writer_names_the_column_it_cant_convert(tmp_path):
+    column_types = {"cases": "INTEGER"}
+
+    with parquet_output.ParquetWriter(
+        tmp_path / "data.parquet", ["cases"], column_types
+    ) as writer:
+        with pytest.raises(ValueError, match="cases"):
+            writer.writerows([["1.5"]])
+
+
+def test_writer_pads_short_rows_and_drops_extra_cells(tmp_path):
+    target_path = tmp_path / "data.parquet"
+    column_types = {"state": "STRING", "cases": "INTEGER", "reported": "BOOLEAN"}
+
+    with parquet_output.ParquetWriter(
+        target_path, list(column_types), column_types
+    ) as writer:
+        writer.writerows([["AL", "1", "t"], ["AK"], ["AZ", "2", "0", "extra"]])
+
+    assert pq.read_table(target_path).to_pydict() == {
+        "state": ["AL", "AK", "AZ"],
+        "cases": [1, None, 2],
+        "reported": [True, None, False],
+    }
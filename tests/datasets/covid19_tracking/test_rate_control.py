@@ -0,0 +1,75 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import http_client
+import pytest
+import rate_control
+
+
+def test_streamed_request_holds_its_slot_until_the_body_is_read(source_server):
+    source_server.files["/big.bin"] = b"x" * 100_000
+    rate = rate_control.RateControl(max_concurrency=2)
+
+    with http_client.session(2, rate=rate) as http:
+        response = http.get(f"{source_server.base_url}/big.bin", stream=True)
+        assert rate.in_flight == 1
+
+        assert len(b"".join(response.iter_content(8192))) == 100_000
+        assert rate.in_flight == 0
+
+        # Closing the response again doesn't free a second slot
+        response.close()
+        assert rate.in_flight == 0
+
+
+def test_closed_streamed_request_frees_its_slot(source_server):
+    source_server.files["/big.bin"] = b"x" * 100_000
+    rate = rate_control.RateControl(max_concurrency=2)
+
+    with http_client.session(2, rate=rate) as http:
+        with http.get(f"{source_server.base_url}/big.bin", stream=True):
+            assert rate.in_flight == 1
+        assert rate.in_flight == 0
+
+
+def test_request_frees_its_slot_once_the_body_is_loaded(source_server):
+    source_server.files["/page.html"] = b"<html></html>"
+    rate = rate_control.RateControl(max_concurrency=2)
+
+    with http_client.session(2, rate=rate) as http:
+        assert http.get(f"{source_server.base_url}/page.html").ok
+        assert http.get(f"{source_server.base_url}/missing").status_code == 404
+        assert rate.in_flight == 0
+
+
+def test_request_failing_on_this_side_frees_its_slot(source_server):
+    source_server.files["/page.html"] = b"<html></html>"
+    rate = rate_control.RateControl(max_concurrency=1)
+
+    with http_client.session(1, rate=rate) as http:
+        # The adapter rejects the timeout, after the slot was taken
+        with pytest.raises(ValueError):
+            http.get(f"{source_server.base_url}/page.html", timeout=(1, 2, 3))
+        assert rate.in_flight == 0
+        assert rate.throttled == 0
+
+        assert http.get(f"{source_server.base_url}/page.html", timeout=5).ok
+
+
+def test_retry_after_seconds_reads_seconds_and_dates():
+    assert rate_control.retry_after_seconds("3") == 3.0
+    assert rate_control.retry_after_seconds("Sun, 07 Mar 2021 00:00:00 GMT") == 0.0
+    assert rate_control.retry_after_seconds("soon") is None
+    assert rate_control.retry_after_seconds(None) is None
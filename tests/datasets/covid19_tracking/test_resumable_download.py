@@ -0,0 +1,136 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import hashlib
+
+import pytest
+import requests
+import resumable_download
+
+BODY = bytes(range(256)) * 40
+
+
+def download(server, tmp_path, sha256=None) -> int:
+    with requests.Session() as http:
+        return resumable_download.download(
+            http, f"{server.base_url}/file.bin", tmp_path / "file.bin", sha256
+        )
+
+
+def test_download_renames_the_complete_file(source_server, tmp_path):
+    source_server.files["/file.bin"] = BODY
+
+    sha256 = hashlib.sha256(BODY).hexdigest()
+
+    assert download(source_server, tmp_path, sha256) == len(BODY)
+    assert (tmp_path / "file.bin").read_bytes() == BODY
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["file.bin"]
+    assert source_server.requests[0]["headers"]["Accept-Encoding"] == "identity"
+
+
+def test_download_resumes_a_partial_file_with_its_validator(source_server, tmp_path):
+    source_server.files["/file.bin"] = BODY
+    partial_path = tmp_path / "file.bin.part"
+    partial_path.write_bytes(BODY[:1000])
+    resumable_download.write_validator(partial_path, {"ETag": '"abc"'})
+
+    download(source_server, tmp_path)
+
+    headers = source_server.requests[0]["headers"]
+    assert headers["Range"] == "bytes=1000-"
+    assert headers["If-Range"] == '"abc"'
+    assert (tmp_path / "file.bin").read_bytes() == BODY
+    assert not partial_path.exists()
+    assert not resumable_download.validator_path(partial_path).exists()
+
+
+def test_download_starts_over_without_a_validator(source_server, tmp_path):
+    source_server.files["/file.bin"] = BODY
+    (tmp_path / "file.bin.part").write_bytes(b"stale bytes")
+
+    download(source_server, tmp_path)
+
+    assert "Range" not in source_server.requests[0]["headers"]
+    assert (tmp_path / "file.bin").read_bytes() == BODY
+
+
+def test_download_takes_a_full_body_in_place_of_a_range(source_server, tmp_path):
+    source_server.files["/file.bin"] = BODY
+    source_server.ranges = False
+    partial_path = tmp_path / "file.bin.part"
+    partial_path.write_bytes(b"x" * 1000)
+    resumable_download.write_validator(partial_path, {"ETag": '"abc"'})
+
+    download(source_server, tmp_path)
+
+    assert (tmp_path / "file.bin").read_bytes() == BODY
+
+
+def test_download_discards_a_partial_file_longer_than_the_file(source_server, tmp_path):
+    source_server.files["/file.bin"] = BODY
+    partial_path = tmp_path / "file.bin.part"
+    partial_path.write_bytes(BODY + b"extra")
+    resumable_download.write_validator(partial_path, {"ETag": '"abc"'})
+
+    download(source_server, tmp_path)
+
+    assert len(source_server.requests) == 2
+    assert "Range" not in source_server.requests[1]["headers"]
+    assert (tmp_path / "file.bin").read_bytes() == BODY
+
+
+def test_download_rejects_the_wrong_sha256(source_server, tmp_path):
+    source_server.files["/file.bin"] = BODY
+
+    with pytest.raises(resumable_download.IncompleteDownloadError, match="SHA-256"):
+        download(source_server, tmp_path, "0" * 64)
+    assert len(source_server.requests) == resumable_download.ATTEMPTS
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_download_raises_http_errors(source_server, tmp_path):
+    with pytest.raises(requests.exceptions.HTTPError):
+        download(source_server, tmp_path)
+    assert not (tmp_path / "file.bin").exists()
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ("bytes 100-199/200", (100, 200)),
+        ("bytes 100-199/*", (100, None)),
+        ("bytes */200", (None, 200)),
+        ("", (None, None)),
+        ("bytes x-y/z", (None, None)),
+    ],
+)
+def test_content_range(header, expected):
+    assert resumable_download.content_range(header) == expected
+
+
+@pytest.mark.parametrize(
+    "headers, expected",
+    [
+        ({"ETag": '"abc"', "Last-Modified": "Sun"}, '"abc"'),
+        ({"ETag": 'W/"abc"', "Last-Modified": "Sun"}, "Sun"),
+        ({}, None),
+    ],
+)
+def test_write_validator_prefers_a_strong_etag(tmp_path, headers, expected):
+    partial_path = tmp_path / "file.bin.part"
+
+    resumable_download.write_validator(partial_path, headers)
+
+    assert resumable_download.read_validator(partial_path) == expected
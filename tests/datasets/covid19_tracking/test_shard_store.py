@@ -0,0 +1,51 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import tarfile
+
+import shard_store
+
+
+def test_shards_are_readable_tars_with_member_offsets(tmp_path):
+    shards = shard_store.ShardWriter(tmp_path / "shards")
+    contents = {"a.png": b"a" * 700, "b.png": b"b" * 10, "c.png": b""}
+    for name, content in contents.items():
+        file_path = shards.staging_dir / name
+        file_path.write_bytes(content)
+        shards.add("AL", file_path)
+    staging_dir = shards.staging_dir
+    shards.close()
+
+    shard_path = tmp_path / "shards" / "AL.tar"
+    assert shards.shard_path("AL") == shard_path
+    assert not staging_dir.exists()
+    with tarfile.open(shard_path) as tar:
+        assert tar.getnames() == list(contents)
+    for name, content in contents.items():
+        assert shard_store.read_member(shard_path, name) == content
+
+
+def test_add_names_members_and_moves_the_files(tmp_path):
+    shards = shard_store.ShardWriter(tmp_path / "shards")
+    file_path = tmp_path / "AK-20210307-230802.png"
+    file_path.write_bytes(b"png")
+
+    shards.add("AK", file_path, "ab.png")
+    shards.close()
+
+    assert not file_path.exists()
+    index = shard_store.read_index(tmp_path / "shards" / "AK.tar")
+    assert list(index) == ["ab.png"]
+    assert index["ab.png"][1] == 3
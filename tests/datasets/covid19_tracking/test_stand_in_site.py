@@ -0,0 +1,146 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import collections
+import csv
+import json
+
+import download_screenshots
+import pytest
+import rate_control
+import shard_store
+import stand_in_server
+import watermark
+import web_scrape_and_generate_csv
+
+GCS_PATH_PREFIX = "gs://bucket/datasets/covid19_tracking/state_screenshots"
+RUN_URI = f"{GCS_PATH_PREFIX}/run_date=2021-03-07"
+
+
+@pytest.fixture(autouse=True)
+def short_backoff(monkeypatch):
+    # The injected errors are retried without waiting seconds for them
+    monkeypatch.setattr(rate_control, "BACKOFF", 0.01)
+
+
+def read_rows(csv_path):
+    with open(csv_path) as csv_file:
+        return list(csv.DictReader(csv_file))
+
+
+def test_scrape_lists_the_screenshots_of_every_state(screenshots_site, tmp_path):
+    csv_path = tmp_path / "data.csv"
+    web_scrape_and_generate_csv.main(
+        screenshots_site.base_url, csv_path, GCS_PATH_PREFIX, workers=2
+    )
+
+    rows = read_rows(csv_path)
+    assert {row["state_name"] for row in rows} == screenshots_site.state_slugs
+    assert all(
+        row["source_url"].startswith(f"{screenshots_site.base_url}/screenshots/")
+        for row in rows
+    )
+    # Every state serves the recorded page, at most 30 days of it
+    per_state = collections.Counter(row["state_name"] for row in rows)
+    assert len(set(per_state.values())) == 1
+    assert 0 < per_state.most_common(1)[0][1] <= 30
+
+
+def test_download_screenshots_fetches_every_listed_screenshot(
+    screenshots_site, tmp_path
+):
+    csv_path = tmp_path / "data.csv"
+    web_scrape_and_generate_csv.main(
+        screenshots_site.base_url, csv_path, GCS_PATH_PREFIX
+    )
+
+    download_screenshots.main(csv_path, "source_url", str(tmp_path / "run"))
+
+    for row in read_rows(csv_path):
+        state, filename = row["source_url"].split("/")[-2:]
+        assert (tmp_path / "run" / state / filename).stat().st_size == (
+            stand_in_server.PNG_SIZE
+        )
+
+
+@pytest.mark.parametrize(
+    "screenshots_site", [{"states": 3, "error_rate": 0.1}], indirect=True
+)
+def test_scrape_stores_the_screenshots_in_shards_despite_errors(
+    screenshots_site, tmp_path
+):
+    run_dir = tmp_path / "run_date=2021-03-07"
+    csv_path = run_dir / "data.csv"
+    metrics_path = run_dir / "metrics.json"
+    run_dir.mkdir()
+
+    web_scrape_and_generate_csv.main(
+        screenshots_site.base_url,
+        csv_path,
+        GCS_PATH_PREFIX,
+        download_prefix=run_dir,
+        max_in_flight=8,
+        blob_index_path=tmp_path / "blob_index.csv",
+        shard_dir=run_dir / "shards",
+        upload_uri=RUN_URI,
+        metrics_path=metrics_path,
+    )
+
+    assert screenshots_site.errors > 0
+    assert json.loads(metrics_path.read_text())["retries"] > 0
+    rows = read_rows(csv_path)
+    assert {row["state_name"] for row in rows} == screenshots_site.state_slugs
+    for row in rows:
+        shard_name = row["google_cloud_storage_uri"][len(RUN_URI) + 1 :]
+        assert shard_name == f"shards/{row['state']}.tar"
+        member = shard_store.read_member(
+            run_dir / shard_name, row["google_cloud_storage_member"]
+        )
+        assert member == stand_in_server.synthetic_png(
+            row["source_url"][len(screenshots_site.base_url) :],
+            stand_in_server.PNG_SIZE,
+        )
+
+
+def test_rerun_scrapes_the_rows_of_its_run_again(screenshots_site, tmp_path):
+    watermark_path = tmp_path / "watermark.json"
+
+    def scrape(run_date):
+        csv_path = tmp_path / f"{run_date}.csv"
+        web_scrape_and_generate_csv.main(
+            screenshots_site.base_url,
+            csv_path,
+            GCS_PATH_PREFIX,
+            watermark_path=watermark_path,
+            run_date=run_date,
+        )
+        return csv_path
+
+    first_csv = scrape("2021-03-07")
+    watermark.advance_per_key(
+        watermark_path, first_csv, "state_name", "date", "2021-03-07"
+    )
+
+    assert read_rows(scrape("2021-03-07")) == read_rows(first_csv)
+    assert read_rows(scrape("2021-03-08")) == []
+
+
+def test_failed_downloads_are_counted(screenshots_site, tmp_path):
+    rows = [{"source_url": f"{screenshots_site.base_url}/missing/AL/AL-1.png"}]
+
+    outcomes = download_screenshots.download_rows(rows, "source_url", tmp_path)
+
+    assert outcomes["failed"] == 1
+    assert not (tmp_path / "AL" / "AL-1.png").exists()
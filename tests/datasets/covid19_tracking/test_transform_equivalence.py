@@ -0,0 +1,101 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import gzip
+import json
+import os
+import pathlib
+import shutil
+import subprocess
+import sys
+
+import pytest
+from ruamel import yaml
+
+PROJECT_ROOT = pathlib.Path(__file__).resolve().parents[3]
+DATASET_PATH = PROJECT_ROOT / "datasets" / "covid19_tracking"
+
+# A sample `raw-*.csv` per pipeline, next to the output the per-cell scripts the
+# column rules replaced wrote for it. Each pipeline's script runs with the
+# `transform` section of its `pipeline.yaml` and must write the same bytes.
+GOLDEN_PATH = pathlib.Path(__file__).resolve().parent / "golden"
+
+SCRIPTS = {
+    "city_level_cases_and_deaths": "csv_transform.py",
+    "covid_racial_data_tracker": "transform_dates.py",
+    "state_level_aggregate_long_term_care": "csv_transform.py",
+    "state_level_cumulative_long_term_care": "csv_transform.py",
+    "state_level_current_outbreak_long_term_care": "csv_transform.py",
+}
+
+
+def transform_rules(pipeline: str) -> dict:
+    config = yaml.YAML(typ="safe").load(DATASET_PATH / pipeline / "pipeline.yaml")
+    (rules,) = [
+        task["transform"] for task in config["dag"]["tasks"] if "transform" in task
+    ]
+    return rules
+
+
+def run(script_path: pathlib.Path, **env) -> None:
+    subprocess.run(
+        [sys.executable, str(script_path)], env={**os.environ, **env}, check=True
+    )
+
+
+@pytest.mark.parametrize("batch_rows", [None, 2])
+@pytest.mark.parametrize("pipeline", sorted(SCRIPTS))
+def test_transform_writes_the_golden_bytes(pipeline, batch_rows, tmp_path):
+    rules = transform_rules(pipeline)
+    if batch_rows:
+        rules["batch_rows"] = batch_rows
+
+    run(
+        DATASET_PATH / pipeline / "custom" / SCRIPTS[pipeline],
+        SOURCE_CSV=str(GOLDEN_PATH / pipeline / "raw-data.csv"),
+        TARGET_CSV=str(tmp_path / "data.csv"),
+        TRANSFORM_RULES=json.dumps(rules),
+    )
+
+    expected = (GOLDEN_PATH / pipeline / "data.csv").read_bytes()
+    if rules.get("compression") == "gzip":
+        target_path = tmp_path / "data.csv.gz"
+        assert gzip.decompress(target_path.read_bytes()) == expected
+    else:
+        target_path = tmp_path / "data.csv"
+        assert target_path.read_bytes() == expected
+    # Nothing else lands in the folder the pipeline archives
+    assert list(tmp_path.iterdir()) == [target_path]
+
+
+@pytest.mark.parametrize("processes", ["1", "2"])
+def test_multi_csv_transform_writes_the_golden_bytes(processes, tmp_path):
+    pipeline = "state_facility_level_long_term_care"
+    raw_paths = sorted((GOLDEN_PATH / pipeline).glob("raw-*.csv"))
+    for raw_path in raw_paths:
+        shutil.copy(raw_path, tmp_path)
+
+    run(
+        DATASET_PATH / pipeline / "custom" / "multi_csv_transform.py",
+        WORKING_DIR=str(tmp_path),
+        TRANSFORM_RULES=json.dumps(transform_rules(pipeline)),
+        PROCESSES=processes,
+    )
+
+    assert len(raw_paths) > 1
+    for raw_path in raw_paths:
+        target_name = raw_path.name.replace("raw-", "")
+        expected = (GOLDEN_PATH / pipeline / target_name).read_bytes()
+        assert (tmp_path / target_name).read_bytes() == expected
@@ -0,0 +1,152 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import csv
+import json
+
+import blob_store
+import watermark
+
+
+def write_csv(path, rows):
+    path.write_text("state_name,date\n" + "".join(f"{k},{d}\n" for k, d in rows))
+    return path
+
+
+def test_advance_moves_the_watermark_to_the_loaded_max_date(tmp_path):
+    watermark_path = tmp_path / "watermark.json"
+    stats_path = tmp_path / "stats.json"
+    stats_path.write_text(json.dumps({"columns": {"date": {"max_date": "2021-03-07"}}}))
+
+    assert watermark.read(watermark_path) is None
+    assert watermark.advance(watermark_path, stats_path, "date") == "2021-03-07"
+    assert watermark.read(watermark_path) == "2021-03-07"
+
+    stats_path.write_text(json.dumps({"columns": {"date": {}}}))
+    assert watermark.advance(watermark_path, stats_path, "date") == "2021-03-07"
+
+
+def test_runs_read_the_watermarks_of_the_runs_before_them(tmp_path):
+    watermark_path = tmp_path / "watermark.json"
+    watermark.advance_per_key(
+        watermark_path,
+        write_csv(tmp_path / "first.csv", [("alabama", "2021-03-05")]),
+        "state_name",
+        "date",
+        run_date="2021-03-06",
+    )
+    watermark.advance_per_key(
+        watermark_path,
+        write_csv(tmp_path / "second.csv", [("alabama", "2021-03-06")]),
+        "state_name",
+        "date",
+        run_date="2021-03-07",
+    )
+
+    assert watermark.read_per_key(watermark_path) == {"alabama": "2021-03-06"}
+    assert watermark.read_per_key(watermark_path, "2021-03-08") == {
+        "alabama": "2021-03-06"
+    }
+    # A rerun of the second day scrapes what it loaded again
+    assert watermark.read_per_key(watermark_path, "2021-03-07") == {
+        "alabama": "2021-03-05"
+    }
+    assert watermark.read_per_key(watermark_path, "2021-03-06") == {}
+
+
+def test_rerun_keeps_the_watermarks_of_keys_it_didnt_load(tmp_path):
+    watermark_path = tmp_path / "watermark.json"
+    watermark.advance_per_key(
+        watermark_path,
+        write_csv(tmp_path / "first.csv", [("alabama", "2021-03-05")]),
+        "state_name",
+        "date",
+        run_date="2021-03-06",
+    )
+    csv_path = write_csv(tmp_path / "second.csv", [("alaska", "2021-03-06")])
+    for _ in range(2):
+        max_dates = watermark.advance_per_key(
+            watermark_path, csv_path, "state_name", "date", run_date="2021-03-07"
+        )
+
+    assert max_dates == {"alabama": "2021-03-05", "alaska": "2021-03-06"}
+    assert watermark.read_per_key(watermark_path) == max_dates
+
+
+def test_failed_download_in_the_middle_is_scraped_again(tmp_path):
+    csv_path = tmp_path / "data.csv"
+    with open(csv_path, "w") as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=["state_name", "date", "url"])
+        writer.writeheader()
+        for state, day in [("alabama", 5), ("alabama", 6), ("alabama", 7)]:
+            writer.writerow(
+                {"state_name": state, "date": f"2021-03-0{day}", "url": f"AL/{day}.png"}
+            )
+        writer.writerow(
+            {"state_name": "alaska", "date": "2021-03-07", "url": "AK/7.png"}
+        )
+    manifest = {
+        path: {"uri": f"gs://bucket/{path}", "member": ""}
+        for path in ["AL/5.png", "AL/7.png", "AK/7.png"]
+    }
+
+    blob_store.write_locations(csv_path, "url", manifest)
+    max_dates = watermark.advance_per_key(
+        tmp_path / "watermark.json",
+        csv_path,
+        "state_name",
+        "date",
+        run_date="2021-03-08",
+        dropped_path=blob_store.dropped_path(csv_path),
+    )
+
+    # The next run scrapes the failed 6th again, and the 7th after it
+    assert max_dates == {"alabama": "2021-03-05", "alaska": "2021-03-07"}
+    assert watermark.read_per_key(tmp_path / "watermark.json", "2021-03-09") == (
+        max_dates
+    )
+
+
+def test_dropped_rows_keep_a_new_key_without_watermark(tmp_path):
+    dropped_path = write_csv(tmp_path / "dropped.csv", [("alaska", "2021-03-06")])
+
+    max_dates = watermark.advance_per_key(
+        tmp_path / "watermark.json",
+        write_csv(tmp_path / "data.csv", [("alaska", "2021-03-07")]),
+        "state_name",
+        "date",
+        run_date="2021-03-08",
+        dropped_path=dropped_path,
+    )
+
+    assert max_dates == {}
+
+
+def test_only_the_last_runs_are_kept(tmp_path, monkeypatch):
+    monkeypatch.setattr(watermark, "KEPT_RUNS", 2)
+    watermark_path = tmp_path / "watermark.json"
+    for day in range(5, 9):
+        watermark.advance_per_key(
+            watermark_path,
+            write_csv(tmp_path / "data.csv", [("alabama", f"2021-03-0{day - 1}")]),
+            "state_name",
+            "date",
+            run_date=f"2021-03-0{day}",
+        )
+
+    assert sorted(watermark.read_runs(watermark_path)) == ["2021-03-07", "2021-03-08"]
+    assert watermark.read_per_key(watermark_path, "2021-03-08") == {
+        "alabama": "2021-03-06"
+    }
@@ -341,3 +341,36 @@ def test_script_with_local_flag_copies_custom_callables_dir_to_local_airflow_env
     assert target_callables_dir.is_dir()
     assert (target_callables_dir / custom_file.name.split("/")[-1]).exists()
     assert not (target_callables_dir / custom_file.name.split("/")[-1]).is_dir()
+
+
+def test_script_with_local_flag_copies_shared_callables_dir_to_local_airflow_env(
+    dataset_path: pathlib.Path,
+    pipeline_path: pathlib.Path,
+    airflow_home: pathlib.Path,
+    env: str,
+):
+    shared_dir = dataset_path / "_custom"
+    shared_dir.mkdir(parents=True, exist_ok=True)
+    shared_file = tempfile.NamedTemporaryFile(suffix=".py", dir=shared_dir)
+
+    setup_dag_and_variables(
+        dataset_path,
+        pipeline_path,
+        airflow_home,
+        env,
+        f"{dataset_path.name}_variables.json",
+    )
+
+    deploy_dag.main(
+        local=True,
+        env_path=ENV_PATH,
+        dataset_id=dataset_path.name,
+        airflow_home=airflow_home,
+        composer_env=None,
+        composer_bucket=None,
+        composer_region=None,
+    )
+
+    target_shared_dir = airflow_home / "dags" / dataset_path.name / "_custom"
+    assert target_shared_dir.is_dir()
+    assert (target_shared_dir / shared_file.name.split("/")[-1]).exists()
@@ -13,6 +13,7 @@
 # limitations under the License.
 
 
+import json
 import pathlib
 import shutil
 import subprocess
@@ -245,3 +246,173 @@ def test_dag_id_in_py_file_is_prepended_with_dataset_id(
         pipeline_path.name, dataset_path.name
     )
     assert f'dag_id="{expected_dag_id}"' in dagpy_contents
+
+
+def test_main_copies_shared_custom_dir_if_it_exists(
+    dataset_path: pathlib.Path, pipeline_path: pathlib.Path, env: str
+):
+    copy_config_files_and_set_tmp_folder_names_as_ids(dataset_path, pipeline_path)
+    shared_path = dataset_path / "_custom"
+    shared_path.mkdir(parents=True, exist_ok=True)
+    shared_file = tempfile.NamedTemporaryFile(suffix=".py", dir=shared_path)
+
+    generate_dag.main(dataset_path.name, pipeline_path.name, env)
+
+    target_path = ENV_DATASETS_PATH / dataset_path.name / "_custom"
+    assert target_path.is_dir()
+    assert (target_path / pathlib.Path(shared_file.name).name).exists()
+
+
+def test_transform_section_is_passed_to_the_task_env_as_json():
+    task = {
+        "operator": "BashOperator",
+        "transform": {"columns": [{"index": 0, "rules": ["yyyymmdd_to_iso"]}]},
+        "args": {"task_id": "process_raw_csv_file", "env": {"dataset": "test"}},
+    }
+
+    env = generate_dag.pass_transform_rules_to_env(task)["args"]["env"]
+
+    assert env["dataset"] == "test"
+    assert json.loads(env["TRANSFORM_RULES"]) == task["transform"]
+    assert "TRANSFORM_RULES" not in task["args"]["env"]
+
+
+def test_transform_section_is_only_allowed_for_bash_tasks():
+    task = {
+        "operator": "GoogleCloudStorageToBigQueryOperator",
+        "transform": {"columns": []},
+        "args": {"task_id": "load_gcs_to_bq"},
+    }
+    with pytest.raises(ValueError):
+        generate_dag.validate_task(task)
+
+
+def test_parquet_transform_output_is_loaded_as_parquet_with_the_schema_types():
+    transform_task = {
+        "operator": "BashOperator",
+        "transform": {"output_format": "parquet", "columns": []},
+        "args": {"task_id": "process_raw_csv_file"},
+    }
+    load_task = {
+        "operator": "GoogleCloudStorageToBigQueryOperator",
+        "args": {
+            "task_id": "load_csv_file_to_bq_table",
+            "source_objects": ["data/test/{{ ds }}/data.csv"],
+            "source_format": "CSV",
+            "skip_leading_rows": 1,
+            "schema_fields": [
+                {"name": "date", "type": "DATE", "mode": "REQUIRED"},
+                {"name": "count", "type": "INTEGER", "mode": "NULLABLE"},
+            ],
+        },
+    }
+
+    tasks = generate_dag.apply_transform_output_formats([transform_task, load_task])
+
+    assert tasks[0]["transform"]["column_types"] == {
+        "date": "DATE",
+        "count": "INTEGER",
+    }
+    assert tasks[1]["args"]["source_format"] == "PARQUET"
+    assert tasks[1]["args"]["source_objects"] == ["data/test/{{ ds }}/data.parquet"]
+    assert "skip_leading_rows" not in tasks[1]["args"]
+    assert "column_types" not in transform_task["transform"]
+
+
+def test_parquet_transform_output_requires_a_single_load_task():
+    transform_task = {
+        "operator": "BashOperator",
+        "transform": {"output_format": "parquet", "columns": []},
+        "args": {"task_id": "process_raw_csv_file"},
+    }
+    with pytest.raises(ValueError):
+        generate_dag.apply_transform_output_formats([transform_task])
+
+
+def test_gzip_transform_output_is_loaded_and_archived_as_csv_gz():
+    transform_task = {
+        "operator": "BashOperator",
+        "transform": {"compression": "gzip", "columns": []},
+        "args": {"task_id": "process_raw_csv_file"},
+    }
+    load_task = {
+        "operator": "GoogleCloudStorageToBigQueryOperator",
+        "args": {
+            "task_id": "load_csv_file_to_bq_table",
+            "source_objects": ["data/test/data-{{ ds }}.csv"],
+            "source_format": "CSV",
+            "skip_leading_rows": 1,
+            "schema_fields": [{"name": "date", "type": "DATE", "mode": "REQUIRED"}],
+        },
+    }
+    archive_task = {
+        "operator": "GoogleCloudStorageToGoogleCloudStorageOperator",
+        "args": {
+            "task_id": "archive_csv_file_to_destination_bucket",
+            "source_object": "data/test/data-{{ ds }}.csv",
+            "destination_object": "datasets/test/data-{{ ds }}.csv",
+        },
+    }
+
+    tasks = generate_dag.apply_transform_output_formats(
+        [transform_task, load_task, archive_task]
+    )
+
+    assert tasks[0]["transform"] == {"compression": "gzip", "columns": []}
+    assert tasks[1]["args"]["source_format"] == "CSV"
+    assert tasks[1]["args"]["skip_leading_rows"] == 1
+    assert tasks[1]["args"]["source_objects"] == ["data/test/data-{{ ds }}.csv.gz"]
+    assert tasks[2]["args"]["source_object"] == "data/test/data-{{ ds }}.csv.gz"
+    assert (
+        tasks[2]["args"]["destination_object"] == "datasets/test/data-{{ ds }}.csv.gz"
+    )
+
+
+def test_short_circuit_condition_is_passed_to_bool():
+    task = {
+        "operator": "ShortCircuitOperator",
+        "args": {
+            "task_id": "skip_if_source_unchanged",
+            "condition": "{{ ti.xcom_pull(task_ids='download') == 'changed' or '' }}",
+        },
+    }
+
+    contents = generate_dag.generate_task_contents(task)
+
+    assert "python_operator.ShortCircuitOperator(" in contents
+    assert "python_callable=bool," in contents
+    assert "op_args=[\"{{ ti.xcom_pull(task_ids='download')" in contents
+    assert "condition" not in contents
+
+
+def test_short_circuit_task_requires_a_condition():
+    task = {
+        "operator": "ShortCircuitOperator",
+        "args": {"task_id": "skip_if_source_unchanged"},
+    }
+    with pytest.raises(KeyError):
+        generate_dag.validate_task(task)
+
+
+def test_download_section_is_passed_to_the_task_env_as_json():
+    task = {
+        "operator": "BashOperator",
+        "download": {"files": [{"url": "https://a.test/a.csv", "target": "a.csv"}]},
+        "args": {"task_id": "download_raw_csv_files", "env": {"dataset": "test"}},
+    }
+
+    env = generate_dag.pass_download_manifest_to_env(task)["args"]["env"]
+
+    assert env["dataset"] == "test"
+    assert json.loads(env["DOWNLOAD_MANIFEST"]) == task["download"]
+    assert "DOWNLOAD_MANIFEST" not in task["args"]["env"]
+
+
+def test_download_section_is_only_allowed_for_bash_tasks():
+    task = {
+        "operator": "GoogleCloudStorageToBigQueryOperator",
+        "download": {"files": []},
+        "args": {"task_id": "load_gcs_to_bq"},
+    }
+    with pytest.raises(ValueError):
+        generate_dag.validate_task(task)
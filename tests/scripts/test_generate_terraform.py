@@ -289,3 +289,16 @@ def test_validation_on_generated_tf_files_in_project_dir(
     subprocess.check_call(
         ["terraform", "validate"], cwd=(project_dataset_path / "_terraform")
     )
+
+
+def test_bq_table_can_be_time_partitioned(bq_table_resource, project_id):
+    bq_table_resource["time_partitioning"] = {"type": "DAY", "field": "date"}
+    subs = {"project_id": project_id, "dataset_id": "test_dataset"}
+
+    contents = generate_terraform.tf_resource_contents(
+        bq_table_resource, {**subs, **bq_table_resource}
+    )
+
+    assert "time_partitioning {" in contents
+    assert 'type  = "DAY"' in contents
+    assert 'field = "date"' in contents